@@ -0,0 +1,119 @@
+import atexit
+import logging
+import queue
+import random
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+from app.config import LOG_LEVEL, ACCESS_LOG_LEVEL, ACCESS_LOG_SAMPLE_RATE
+from app.utils import json_dumps
+
+access_logger = logging.getLogger("magnetai.access")
+
+_listener = None
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler that leaves formatting to the writer thread.
+
+    The stock handler formats every record on the calling thread, which is
+    exactly the work we want off the event loop.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class AccessLogFormatter(logging.Formatter):
+    """One JSON object per line for access records, plain text otherwise."""
+
+    def format(self, record):
+        access = getattr(record, "access", None)
+        if access is None:
+            return super().format(record)
+        entry = {"ts": round(record.created, 3), "level": record.levelname}
+        entry.update(access)
+        return json_dumps(entry).decode("utf-8")
+
+
+def setup_logging():
+    """Route all logging through a queue drained by a background writer thread."""
+    global _listener
+    if _listener is not None:
+        return
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(AccessLogFormatter("%(levelname)s:%(name)s:%(message)s"))
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.handlers = [_DeferredQueueHandler(log_queue)]
+    root.setLevel(LOG_LEVEL)
+    access_logger.setLevel(ACCESS_LOG_LEVEL)
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class AccessLogMiddleware:
+    """
+    Pure ASGI middleware that emits one structured record per HTTP request.
+
+    Successful requests are sampled at ``sample_rate``; 5xx responses and
+    requests that raised are always logged.
+    """
+
+    def __init__(self, app, sample_rate: float = ACCESS_LOG_SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+        sent_bytes = 0
+
+        async def send_wrapper(message):
+            nonlocal status_code, sent_bytes
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                sent_bytes += len(message.get("body", b""))
+            await send(message)
+
+        failed = False
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            if failed or status_code >= 500 or self.sample_rate >= 1.0 or random.random() < self.sample_rate:
+                self._log(scope, status_code, sent_bytes, time.perf_counter() - start, failed)
+
+    def _log(self, scope, status_code, sent_bytes, duration, failed):
+        level = logging.ERROR if failed or status_code >= 500 else logging.INFO
+        if not access_logger.isEnabledFor(level):
+            return
+        client = scope.get("client")
+        access = {
+            "method": scope["method"],
+            "path": scope["path"],
+            "status": status_code,
+            "duration_ms": round(duration * 1000, 3),
+            "bytes": sent_bytes,
+            "client": client[0] if client else None,
+        }
+        access_logger.log(level, "access", extra={"access": access})
@@ -1,139 +1,337 @@
-import jwt
-from jwt.exceptions import ExpiredSignatureError, InvalidTokenError
-from fastapi import HTTPException, status, Depends
+import asyncio
+from dataclasses import dataclass
+from fastapi import HTTPException, Header, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from google.oauth2 import id_token
-from google.auth.transport import requests
 from datetime import datetime, timedelta
-from app.config import JWT_SECRET, JWT_ALGORITHM, JWT_EXPIRATION_HOURS
-import firebase_admin
-from firebase_admin import auth as firebase_auth, credentials as firebase_credentials
-import os
-from app.utils import base_response
-import base64
-import json
-
-# Initialize Firebase Admin SDK if not already initialized
-if not firebase_admin._apps:
-    try:
-        cred_path = os.environ.get("FIREBASE_CREDENTIALS")
-        cred_b64 = os.environ.get("FIREBASE_CREDENTIALS_BASE64")
-        if cred_b64:
-            cred_json = base64.b64decode(cred_b64).decode("utf-8")
-            cred_dict = json.loads(cred_json)
-            cred = firebase_credentials.Certificate(cred_dict)
-            firebase_admin.initialize_app(cred)
-        elif cred_path:
-            cred = firebase_credentials.Certificate(cred_path)
-            firebase_admin.initialize_app(cred)
-        else:
-            # Initialize without credentials (for development/testing)
-            print("Warning: No Firebase credentials found. Firebase features may not work.")
-            firebase_admin.initialize_app()
-    except Exception as e:
-        print(f"Warning: Failed to initialize Firebase: {e}")
-        # Continue without Firebase initialization
+from app.config import (
+    ACCESS_TOKEN_EXPIRE_MINUTES,
+    FIREBASE_TOKEN_CACHE_SIZE, ACCESS_TOKEN_CACHE_SIZE, SHARED_CACHES, SHARED_TOKEN_CACHE_VALUE_BYTES,
+    INTERNAL_API_KEY,
+)
+from app.cache import TTLCache
+from app.shared_store import SharedTTLCache
+from app.utils import json_dumps, json_loads
+from app.singleflight import SingleFlight
+from app.metrics import JWT_ENCODE_SECONDS, JWT_DECODE_SECONDS, firebase_verify_histogram, registry
+from app.executor import ExecutorSaturated, get_verification_executor
+from app.circuit_breaker import CircuitOpen, firebase_breaker
+from app.firebase_verifier import StaleKeySet, UnknownKeyId, get_local_verifier, get_key_refresher
+from app.firebase_init import ensure_firebase
+from app.keyring import get_keyring
+from app.revocation import MAX_ACCESS_TOKEN_LIFETIME_SECONDS, is_revoked
+from app.token_prefilter import prefilter_firebase_token
+from app.lazy import lazy_import
+import logging
+import time
+import hashlib
+import hmac
+import secrets
+from typing import Optional
+
+# Deferred: these pull in cryptography, google-auth and requests, none of
+# which the cold path up to the first /health response needs.
+jwt = lazy_import("jwt")
+firebase_admin = lazy_import("firebase_admin")
+firebase_auth = lazy_import("firebase_admin.auth")
+
+logger = logging.getLogger(__name__)
 
 security = HTTPBearer()
 
+
+@dataclass(frozen=True)
+class Principal:
+    """The caller behind a verified access token."""
+    user_id: str
+    email: str
+    claims: dict
+
+
+@dataclass(frozen=True)
+class FirebaseIdentity:
+    """A user as described by a verified Firebase ID token."""
+    uid: str
+    email: str
+    name: str
+    picture: str
+    email_verified: bool
+    claims: dict
+
+    @classmethod
+    def from_claims(cls, claims: dict) -> "FirebaseIdentity":
+        return cls(
+            uid=claims.get("uid", ""),
+            email=claims.get("email", ""),
+            name=claims.get("name", ""),
+            picture=claims.get("picture", ""),
+            email_verified=claims.get("email_verified", False),
+            claims=claims,
+        )
+
+
+def _auth_error(status_code: int, message: str) -> HTTPException:
+    return HTTPException(status_code=status_code, detail=message)
+
+# Verified Firebase identities, keyed by token digest and kept until the token's own exp.
+# Under the multi-worker server one worker's verification serves them all.
+if SHARED_CACHES:
+    firebase_token_cache = SharedTTLCache(
+        slots=FIREBASE_TOKEN_CACHE_SIZE,
+        value_size=SHARED_TOKEN_CACHE_VALUE_BYTES,
+        encode=lambda identity: json_dumps(identity.claims),
+        decode=lambda raw: FirebaseIdentity.from_claims(json_loads(raw)),
+    )
+else:
+    firebase_token_cache = TTLCache(max_entries=FIREBASE_TOKEN_CACHE_SIZE)
+
+# In-flight Firebase verifications, keyed by token digest
+firebase_verify_flight = SingleFlight()
+
+# Principals for verified access tokens on protected routes, keyed the same way
+access_token_cache = TTLCache(max_entries=ACCESS_TOKEN_CACHE_SIZE)
+
+
+def token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode("utf-8")).digest()
+
+
+async def invalidate_firebase_user(uid: str) -> int:
+    """Forget cached Firebase verifications for a revoked or disabled user."""
+    if isinstance(firebase_token_cache, SharedTTLCache):
+        # The shared table has no owner index: this scans every slot, so it
+        # runs in a worker thread rather than on the event loop
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, firebase_token_cache.invalidate_owner, uid)
+    return firebase_token_cache.invalidate_owner(uid)
+
+
+def cache_stats() -> dict:
+    return {
+        "firebase_tokens": firebase_token_cache.stats(),
+        "access_tokens": access_token_cache.stats(),
+    }
+
+
+def _cache_metrics():
+    samples = []
+    for cache_name, stats in cache_stats().items():
+        labels = {"cache": cache_name}
+        samples.append(("magnetai_token_cache_hits_total", "counter", "Token cache hits", labels, stats["hits"]))
+        samples.append(("magnetai_token_cache_misses_total", "counter", "Token cache misses", labels, stats["misses"]))
+        samples.append(("magnetai_token_cache_evictions_total", "counter", "Token cache LRU evictions", labels, stats["evictions"]))
+        samples.append(("magnetai_token_cache_size", "gauge", "Entries in the token cache", labels, stats["size"]))
+    flight = firebase_verify_flight.stats()
+    samples.append(("magnetai_firebase_verify_executions_total", "counter",
+                    "Firebase verifications actually executed", {}, flight["executions"]))
+    samples.append(("magnetai_firebase_verify_coalesced_total", "counter",
+                    "Firebase verifications answered by an in-flight call for the same token", {}, flight["coalesced"]))
+    return samples
+
+
+registry.register_collector(_cache_metrics)
+
+_firebase_verify_cached = firebase_verify_histogram("cache")
+_firebase_verify_local = firebase_verify_histogram("local")
+_firebase_verify_sdk = firebase_verify_histogram("sdk")
+
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
     if expires_delta:
+        # Revoke-all entries are only kept for the longest lifetime a token may have
+        expires_delta = min(expires_delta, timedelta(seconds=MAX_ACCESS_TOKEN_LIFETIME_SECONDS))
         expire = datetime.utcnow() + expires_delta
     else:
-        expire = datetime.utcnow() + timedelta(hours=JWT_EXPIRATION_HOURS)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, JWT_SECRET, algorithm=JWT_ALGORITHM)
+        expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    # Millisecond iat so a revoke-all doesn't also catch tokens issued later in the same second
+    to_encode.update({"exp": expire, "iat": round(time.time(), 3), "jti": secrets.token_urlsafe(12)})
+    start = time.perf_counter()
+    encoded_jwt = get_keyring().encode(to_encode)
+    JWT_ENCODE_SECONDS.observe(time.perf_counter() - start)
     return encoded_jwt
 
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Principal:
+    return verify_access_token(credentials.credentials)
+
+
+def verify_access_token(token: str) -> Principal:
+    digest = token_digest(token)
+    principal = access_token_cache.get(digest)
+    if principal is None:
+        principal = _decode_access_token(token, digest)
+    # Checked on cache hits too: a token can be revoked after it was cached
+    if is_revoked(principal.claims):
+        raise _auth_error(status.HTTP_401_UNAUTHORIZED, "Token has been revoked")
+    return principal
+
+
+def _decode_access_token(token: str, digest: bytes) -> Principal:
+    start = time.perf_counter()
     try:
-        payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            return base_response(
-                success=False,
-                message="Invalid authentication credentials",
-                status_code=status.HTTP_401_UNAUTHORIZED
-            )
-        return base_response(success=True, message="Token is valid", data=payload)
-    except ExpiredSignatureError:
-        return base_response(
-            success=False,
-            message="Token has expired",
-            status_code=status.HTTP_401_UNAUTHORIZED
-        )
-    except InvalidTokenError:
-        return base_response(
-            success=False,
-            message="Invalid authentication credentials",
-            status_code=status.HTTP_401_UNAUTHORIZED
-        )
+        payload = get_keyring().decode(token)
+    except jwt.ExpiredSignatureError:
+        raise _auth_error(status.HTTP_401_UNAUTHORIZED, "Token has expired")
+    except jwt.InvalidTokenError:
+        raise _auth_error(status.HTTP_401_UNAUTHORIZED, "Invalid authentication credentials")
+    finally:
+        JWT_DECODE_SECONDS.observe(time.perf_counter() - start)
+    user_id: str = payload.get("sub")
+    if user_id is None:
+        raise _auth_error(status.HTTP_401_UNAUTHORIZED, "Invalid authentication credentials")
+    principal = Principal(user_id=user_id, email=payload.get("email", ""), claims=payload)
+    # Only tokens with an exp are cached, and never past that exp
+    if "exp" in payload:
+        access_token_cache.set(digest, principal, payload["exp"], owner=user_id)
+    return principal
+
+
+def require_internal_caller(x_internal_api_key: Optional[str] = Header(None)):
+    """
+    Gate for service-to-service and debug endpoints. Closed (404, as if the
+    endpoint weren't there) until INTERNAL_API_KEY is configured.
+    """
+    if not INTERNAL_API_KEY:
+        raise _auth_error(status.HTTP_404_NOT_FOUND, "Not Found")
+    if x_internal_api_key is None or not hmac.compare_digest(
+        x_internal_api_key.encode("utf-8"), INTERNAL_API_KEY.encode("utf-8")
+    ):
+        raise _auth_error(status.HTTP_401_UNAUTHORIZED, "Invalid internal API key")
+
 
+async def verify_google_token(id_token_str: str) -> FirebaseIdentity:
+    # Basic token format validation
+    if not id_token_str or len(id_token_str) < 100:
+        raise _auth_error(status.HTTP_400_BAD_REQUEST, "Invalid token format - token too short")
+    
+    # Repeat logins with the same token skip verification entirely
+    start = time.perf_counter()
+    digest = token_digest(id_token_str)
+    identity = firebase_token_cache.get(digest)
+    if identity is not None:
+        _firebase_verify_cached.observe(time.perf_counter() - start)
+        return identity
+    
+    # Turn away malformed, expired and foreign tokens on the loop, before
+    # any signature check or thread hop
+    prefilter_firebase_token(id_token_str)
+    
+    # Concurrent requests presenting the same token share one verification
+    return await firebase_verify_flight.do(digest, lambda: _verify_uncached(id_token_str, digest, start))
 
-async def verify_google_token(id_token_str: str):
+
+async def _verify_uncached(id_token_str: str, digest: bytes, start: float) -> FirebaseIdentity:
     try:
-        import asyncio
-        from concurrent.futures import ThreadPoolExecutor
-        
-        # Check if Firebase is properly initialized
-        if not firebase_admin._apps:
-            return base_response(
-                success=False,
-                message="Firebase not properly initialized. Check environment variables.",
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
-        
-        print(f"Starting Firebase token verification for token: {id_token_str[:50]}...")
-        
-        # Add more detailed logging
-        print(f"Firebase apps available: {list(firebase_admin._apps.keys())}")
-        
-        # Basic token format validation
-        if not id_token_str or len(id_token_str) < 100:
-            return base_response(
-                success=False,
-                message="Invalid token format - token too short",
-                status_code=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Check if token has the expected format (3 parts separated by dots)
-        token_parts = id_token_str.split('.')
-        if len(token_parts) != 3:
-            return base_response(
-                success=False,
-                message="Invalid token format - not a valid JWT",
-                status_code=status.HTTP_400_BAD_REQUEST
-            )
-        
-        print(f"Token format validation passed, proceeding with Firebase verification...")
+        # Verify locally against the cached signing keys when we can. This is
+        # a pure CPU check, so it runs inline without a thread hop.
+        decoded_token = None
+        local_verifier = get_local_verifier()
+        if local_verifier is None:
+            # The project id may only be known once the SDK has loaded credentials
+            await ensure_firebase()
+            local_verifier = get_local_verifier()
+        if local_verifier is not None:
+            try:
+                try:
+                    decoded_token = local_verifier.verify(id_token_str)
+                except StaleKeySet:
+                    await _refresh_stale_keys()
+                    decoded_token = local_verifier.verify(id_token_str)
+                _firebase_verify_local.observe(time.perf_counter() - start)
+            except UnknownKeyId:
+                # Keys may have rotated (or not loaded yet): let the SDK decide
+                # this one and pull the new key set in the background.
+                get_key_refresher().request_refresh()
         
-        # Use ThreadPoolExecutor to run Firebase verification in a separate thread
-        # with a timeout to prevent hanging
-        loop = asyncio.get_event_loop()
-        print(f"Starting async Firebase verification...")
-        
-        with ThreadPoolExecutor() as executor:
-            print(f"Created ThreadPoolExecutor, starting verification...")
-            decoded_token = await asyncio.wait_for(
-                loop.run_in_executor(executor, firebase_auth.verify_id_token, id_token_str),
-                timeout=15.0  # 15 second timeout
-            )
-            print(f"Firebase token verification successful")
-            return base_response(success=True, message="Firebase ID token is valid", data=decoded_token)
+        if decoded_token is None:
+            # Check if Firebase is properly initialized
+            await ensure_firebase()
+            if not firebase_admin._apps:
+                raise _auth_error(
+                    status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    "Firebase not properly initialized. Check environment variables."
+                )
             
+            decoded_token = await _verify_with_sdk(id_token_str)
+            _firebase_verify_sdk.observe(time.perf_counter() - start)
+    except HTTPException:
+        raise
+    except CircuitOpen as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Firebase verification is temporarily unavailable, please retry shortly",
+            headers={"Retry-After": str(max(1, round(e.retry_after)))},
+        )
+    except ExecutorSaturated:
+        logger.warning("Firebase token verification rejected: executor saturated")
+        raise _auth_error(status.HTTP_503_SERVICE_UNAVAILABLE, "Too many concurrent logins, please retry shortly")
     except asyncio.TimeoutError:
-        print(f"Firebase token verification timed out after 15 seconds")
-        return base_response(
-            success=False,
-            message="Firebase token verification timed out",
-            status_code=status.HTTP_408_REQUEST_TIMEOUT
+        raise _auth_error(status.HTTP_408_REQUEST_TIMEOUT, "Firebase token verification timed out")
+    except Exception as e:
+        logger.info("Firebase token verification failed: %s", e)
+        raise _auth_error(status.HTTP_401_UNAUTHORIZED, f"Invalid Firebase ID token: {str(e)}")
+    
+    identity = FirebaseIdentity.from_claims(decoded_token)
+    firebase_token_cache.set(digest, identity, decoded_token["exp"], owner=identity.uid or None)
+    return identity
+
+
+async def _refresh_stale_keys():
+    # Keys past their max-age may have been withdrawn; refetch before trusting any
+    try:
+        await get_key_refresher().refresh_now()
+    except Exception as e:
+        logger.warning("Firebase signing keys are stale and could not be refreshed: %s", e)
+        raise _auth_error(status.HTTP_503_SERVICE_UNAVAILABLE,
+                          "Firebase signing keys are unavailable, please retry shortly")
+
+
+def _sdk_token_rejections() -> tuple:
+    # The SDK's token errors are FirebaseErrors, not ValueErrors; plain
+    # ValueError still covers arguments it refuses before looking at Firebase
+    return (ValueError, firebase_auth.InvalidIdTokenError, firebase_auth.UserDisabledError)
+
+
+async def _verify_with_sdk(id_token_str: str) -> dict:
+    """
+    Run the blocking SDK call on the shared verification pool, behind the
+    Firebase circuit breaker and with a timeout that follows the SDK's
+    observed p99.
+
+    On timeout we stop waiting right away; the worker finishes in the
+    background and keeps its slot until then, which is what the
+    back-pressure counts. Only timeouts and errors other than a rejected
+    token count against the breaker: a bad token says nothing about
+    Firebase's health.
+    """
+    firebase_breaker.allow()
+    timeout = firebase_breaker.timeout()
+    executor = get_verification_executor()
+    call_start = time.perf_counter()
+    try:
+        decoded_token = await asyncio.wait_for(
+            executor.run(firebase_auth.verify_id_token, id_token_str),
+            timeout=timeout
         )
+    except asyncio.TimeoutError:
+        logger.warning("Firebase token verification timed out after %.2fs", timeout)
+        firebase_breaker.record_failure()
+        raise
+    except ExecutorSaturated:
+        # Our own back-pressure, not a Firebase failure
+        firebase_breaker.release()
+        raise
+    except _sdk_token_rejections():
+        # Firebase answered and the token is bad: the caller's problem, so a 401
+        # from the handler above, and a healthy call as far as the breaker cares
+        firebase_breaker.record_success(time.perf_counter() - call_start)
+        raise
+    except asyncio.CancelledError:
+        firebase_breaker.release()
+        raise
     except Exception as e:
-        print(f"Firebase token verification error: {str(e)}")
-        return base_response(
-            success=False,
-            message=f"Invalid Firebase ID token: {str(e)}",
-            status_code=status.HTTP_401_UNAUTHORIZED
-        ) 
\ No newline at end of file
+        # Certificate fetch failures and the like: Firebase, not the token
+        firebase_breaker.record_failure()
+        logger.warning("Firebase token verification failed: %s", e)
+        raise _auth_error(status.HTTP_503_SERVICE_UNAVAILABLE, "Firebase verification failed, please retry shortly")
+    firebase_breaker.record_success(time.perf_counter() - call_start)
+    return decoded_token
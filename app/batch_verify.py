@@ -0,0 +1,97 @@
+import asyncio
+import logging
+from typing import AsyncIterator, List
+
+from fastapi import HTTPException
+
+from app.auth import verify_access_token, verify_google_token
+from app.config import VERIFY_BATCH_FIREBASE_CONCURRENCY
+from app.utils import json_dumps
+
+logger = logging.getLogger(__name__)
+
+# Lines per chunk written to the stream; also how often the access-token
+# loop yields to the event loop
+CHUNK_LINES = 64
+
+
+def _line(result: dict) -> bytes:
+    return json_dumps(result) + b"\n"
+
+
+def _failed(index: int, kind: str, error: Exception) -> dict:
+    # Anything but a clean rejection: report it on this token's line rather
+    # than cutting off a stream whose 200 has already gone out
+    logger.warning("Batch verification of %s token %d failed: %r", kind, index, error)
+    return {"index": index, "type": kind, "valid": False, "status": 500, "error": "Verification failed"}
+
+
+def _access_result(index: int, token: str) -> dict:
+    try:
+        principal = verify_access_token(token)
+    except HTTPException as e:
+        return {"index": index, "type": "access", "valid": False, "status": e.status_code, "error": e.detail}
+    except Exception as e:
+        return _failed(index, "access", e)
+    return {
+        "index": index,
+        "type": "access",
+        "valid": True,
+        "user_id": principal.user_id,
+        "email": principal.email,
+        "exp": principal.claims.get("exp"),
+    }
+
+
+async def _firebase_result(index: int, token: str, limit: asyncio.Semaphore) -> dict:
+    async with limit:
+        try:
+            identity = await verify_google_token(token)
+        except HTTPException as e:
+            return {"index": index, "type": "firebase", "valid": False, "status": e.status_code, "error": e.detail}
+        except Exception as e:
+            return _failed(index, "firebase", e)
+    return {
+        "index": index,
+        "type": "firebase",
+        "valid": True,
+        "uid": identity.uid,
+        "email": identity.email,
+        "email_verified": identity.email_verified,
+        "exp": identity.claims.get("exp"),
+    }
+
+
+async def verify_batch(access_tokens: List[str], firebase_tokens: List[str],
+                       concurrency: int = VERIFY_BATCH_FIREBASE_CONCURRENCY) -> AsyncIterator[bytes]:
+    """
+    Yield NDJSON chunks, one result line per token.
+
+    Firebase verifications start first, at most ``concurrency`` at a time
+    (cache hits, the local verifier and the SDK executor all apply as for a
+    login), and stream out as they finish. Access tokens are checked inline
+    in between, reusing the token cache and the key ring. ``index`` is the
+    token's position in its own input list; output order is not input order.
+    """
+    limit = asyncio.Semaphore(concurrency)
+    pending = {
+        asyncio.ensure_future(_firebase_result(index, token, limit))
+        for index, token in enumerate(firebase_tokens)
+    }
+    try:
+        chunk = []
+        for index, token in enumerate(access_tokens):
+            chunk.append(_line(_access_result(index, token)))
+            if len(chunk) >= CHUNK_LINES:
+                yield b"".join(chunk)
+                chunk = []
+        if chunk:
+            yield b"".join(chunk)
+
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            yield b"".join(_line(task.result()) for task in done)
+    finally:
+        # The client went away mid-stream: don't keep verifying for nobody
+        for task in pending:
+            task.cancel()
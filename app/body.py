@@ -0,0 +1,79 @@
+import asyncio
+from typing import Any, Tuple
+
+from fastapi import HTTPException, Request, status
+
+from app.config import REQUEST_BODY_MAX_BYTES, REQUEST_BODY_TIMEOUT_SECONDS
+from app.utils import json_loads
+
+
+def _body_error(status_code: int, message: str) -> HTTPException:
+    return HTTPException(status_code=status_code, detail=message)
+
+
+async def read_body(request: Request, max_bytes: int = REQUEST_BODY_MAX_BYTES,
+                    timeout: float = REQUEST_BODY_TIMEOUT_SECONDS) -> bytes:
+    """
+    Read the request body as it streams in, refusing anything over
+    ``max_bytes`` (413) or slower than ``timeout`` seconds in total (408).
+
+    A declared Content-Length over the cap is refused before a byte is
+    read; a chunked or understated body is cut off as soon as it passes it.
+    """
+    declared = request.headers.get("content-length")
+    if declared is not None:
+        try:
+            declared_bytes = int(declared)
+        except ValueError:
+            raise _body_error(status.HTTP_400_BAD_REQUEST, "Invalid Content-Length header")
+        if declared_bytes > max_bytes:
+            raise _body_error(status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                              f"Request body exceeds {max_bytes} bytes")
+
+    async def collect() -> bytes:
+        body = bytearray()
+        async for chunk in request.stream():
+            body += chunk
+            if len(body) > max_bytes:
+                raise _body_error(status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                  f"Request body exceeds {max_bytes} bytes")
+        return bytes(body)
+
+    # Cancel this task at the deadline rather than wrapping the read in
+    # wait_for, which would cost a task (and a loop round-trip) per request
+    task = asyncio.current_task()
+    timed_out = False
+
+    def expire():
+        nonlocal timed_out
+        timed_out = True
+        task.cancel()
+
+    handle = asyncio.get_running_loop().call_later(timeout, expire)
+    try:
+        return await collect()
+    except asyncio.CancelledError:
+        if not timed_out:
+            raise
+        uncancel = getattr(task, "uncancel", None)
+        if uncancel is not None:
+            uncancel()
+        raise _body_error(status.HTTP_408_REQUEST_TIMEOUT, "Timed out reading the request body")
+    finally:
+        handle.cancel()
+
+
+async def read_json_fields(request: Request, *fields: str,
+                           max_bytes: int = REQUEST_BODY_MAX_BYTES) -> Tuple[Any, ...]:
+    """
+    Read a bounded JSON object body and return just the named fields, in
+    order (``None`` where absent). Parsed straight from the bytes.
+    """
+    body = await read_body(request, max_bytes=max_bytes)
+    try:
+        data = json_loads(body)
+    except ValueError:
+        raise _body_error(status.HTTP_400_BAD_REQUEST, "Request body is not valid JSON")
+    if not isinstance(data, dict):
+        raise _body_error(status.HTTP_400_BAD_REQUEST, "Request body must be a JSON object")
+    return tuple(data.get(field) for field in fields)
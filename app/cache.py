@@ -0,0 +1,110 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class TTLCache:
+    """
+    Bounded LRU cache whose entries carry their own absolute expiry time.
+
+    Entries can be tagged with an ``owner`` (e.g. a user id) so everything
+    cached on behalf of that owner can be dropped in one call. All operations
+    are synchronous and never await, so they are atomic with respect to other
+    asyncio tasks; the lock only matters for callers on worker threads.
+    """
+
+    def __init__(self, max_entries: int, clock=time.time):
+        self.max_entries = max_entries
+        self._clock = clock
+        self._data = OrderedDict()
+        self._owners = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value, owner = entry
+            if expires_at <= self._clock():
+                self._remove(key, owner)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, expires_at: float, owner: Optional[Hashable] = None):
+        if expires_at <= self._clock() or self.max_entries <= 0:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._unlink_owner(key, old[2])
+            self._data[key] = (expires_at, value, owner)
+            if owner is not None:
+                self._owners.setdefault(owner, set()).add(key)
+            while len(self._data) > self.max_entries:
+                old_key, (_, _, old_owner) = self._data.popitem(last=False)
+                self._unlink_owner(old_key, old_owner)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return False
+            self._remove(key, entry[2])
+            self.invalidations += 1
+            return True
+
+    def invalidate_owner(self, owner: Hashable) -> int:
+        """Drop every entry cached for ``owner``; returns how many were removed."""
+        with self._lock:
+            keys = self._owners.pop(owner, ())
+            for key in keys:
+                self._data.pop(key, None)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._owners.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+    def _remove(self, key, owner):
+        del self._data[key]
+        self._unlink_owner(key, owner)
+
+    def _unlink_owner(self, key, owner):
+        if owner is None:
+            return
+        keys = self._owners.get(owner)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._owners[owner]
@@ -0,0 +1,206 @@
+import math
+import time
+from collections import deque
+from typing import Deque, List, Optional
+
+from app.config import (
+    FIREBASE_BREAKER_FAILURE_RATIO,
+    FIREBASE_BREAKER_MIN_CALLS,
+    FIREBASE_BREAKER_OPEN_SECONDS,
+    FIREBASE_BREAKER_SLOW_SECONDS,
+    FIREBASE_BREAKER_WINDOW_SECONDS,
+    FIREBASE_VERIFY_MIN_TIMEOUT_SECONDS,
+    FIREBASE_VERIFY_TIMEOUT_P99_MULTIPLIER,
+    FIREBASE_VERIFY_TIMEOUT_SECONDS,
+)
+from app.metrics import registry
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Successful-call latencies kept for the p99 estimate
+_LATENCY_SAMPLES = 256
+# p99 over fewer samples than this is noise; use the ceiling instead
+_MIN_LATENCY_SAMPLES = 20
+
+
+class CircuitOpen(Exception):
+    """The dependency is considered down; the call was not attempted."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Circuit open; retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open breaker over a rolling window of one-second
+    buckets.
+
+    While closed, calls go through and their outcomes are counted; a call
+    slower than ``slow_seconds`` counts as a failure even if it succeeded.
+    Once the window holds at least ``min_calls`` and the failure ratio
+    reaches ``failure_ratio`` the breaker opens and rejects calls for
+    ``open_seconds``. It then lets one probe through (half-open): success
+    closes it, failure reopens it.
+
+    ``timeout()`` gives an adaptive per-call timeout: the observed p99 of
+    successful calls times ``p99_multiplier``, clamped to
+    ``[min_timeout, max_timeout]``.
+
+    Used from the event loop thread only.
+    """
+
+    def __init__(self, name: str,
+                 window_seconds: int = FIREBASE_BREAKER_WINDOW_SECONDS,
+                 min_calls: int = FIREBASE_BREAKER_MIN_CALLS,
+                 failure_ratio: float = FIREBASE_BREAKER_FAILURE_RATIO,
+                 slow_seconds: float = FIREBASE_BREAKER_SLOW_SECONDS,
+                 open_seconds: float = FIREBASE_BREAKER_OPEN_SECONDS,
+                 min_timeout: float = FIREBASE_VERIFY_MIN_TIMEOUT_SECONDS,
+                 max_timeout: float = FIREBASE_VERIFY_TIMEOUT_SECONDS,
+                 p99_multiplier: float = FIREBASE_VERIFY_TIMEOUT_P99_MULTIPLIER,
+                 clock=time.monotonic):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.slow_seconds = slow_seconds
+        self.open_seconds = open_seconds
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.p99_multiplier = p99_multiplier
+        self._clock = clock
+
+        self.state = CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        # [second, calls, failures] per bucket, oldest first
+        self._buckets: Deque[List[int]] = deque()
+        self._latencies: Deque[float] = deque(maxlen=_LATENCY_SAMPLES)
+        self._p99: Optional[float] = None
+        self._since_p99 = 0
+        self.rejected = 0
+        self.opened = 0
+
+    def allow(self):
+        """Raise ``CircuitOpen`` unless a call may go ahead now."""
+        if self.state == CLOSED:
+            return
+        now = self._clock()
+        if self.state == OPEN:
+            remaining = self._opened_at + self.open_seconds - now
+            if remaining > 0:
+                self.rejected += 1
+                raise CircuitOpen(remaining)
+            self.state = HALF_OPEN
+        # Half-open: a single probe at a time decides
+        if self._probe_in_flight:
+            self.rejected += 1
+            raise CircuitOpen(1)
+        self._probe_in_flight = True
+
+    def record_success(self, duration: float):
+        self._latencies.append(duration)
+        self._since_p99 += 1
+        self._record(failed=duration >= self.slow_seconds)
+
+    def record_failure(self):
+        self._record(failed=True)
+
+    def release(self):
+        """The call ended without telling us anything about the dependency."""
+        self._probe_in_flight = False
+
+    def _record(self, failed: bool):
+        now = self._clock()
+        if self.state == HALF_OPEN:
+            self._probe_in_flight = False
+            if failed:
+                self._open(now)
+            else:
+                self.state = CLOSED
+                self._buckets.clear()
+            return
+        if self.state == OPEN:
+            # A call that started before the breaker opened
+            return
+
+        second = int(now)
+        if self._buckets and self._buckets[-1][0] == second:
+            bucket = self._buckets[-1]
+        else:
+            bucket = [second, 0, 0]
+            self._buckets.append(bucket)
+        bucket[1] += 1
+        if failed:
+            bucket[2] += 1
+        while self._buckets and self._buckets[0][0] <= second - self.window_seconds:
+            self._buckets.popleft()
+
+        if failed:
+            calls = sum(b[1] for b in self._buckets)
+            failures = sum(b[2] for b in self._buckets)
+            if calls >= self.min_calls and failures / calls >= self.failure_ratio:
+                self._open(now)
+
+    def _open(self, now: float):
+        self.state = OPEN
+        self._opened_at = now
+        self._buckets.clear()
+        self.opened += 1
+
+    def p99(self) -> Optional[float]:
+        if len(self._latencies) < _MIN_LATENCY_SAMPLES:
+            return None
+        # Re-sorting on every call would be wasted work; the estimate drifts slowly
+        if self._p99 is None or self._since_p99 >= 16:
+            ordered = sorted(self._latencies)
+            self._p99 = ordered[min(len(ordered) - 1, math.ceil(len(ordered) * 0.99) - 1)]
+            self._since_p99 = 0
+        return self._p99
+
+    def timeout(self) -> float:
+        p99 = self.p99()
+        if p99 is None:
+            return self.max_timeout
+        return min(self.max_timeout, max(self.min_timeout, p99 * self.p99_multiplier))
+
+    def stats(self) -> dict:
+        calls = sum(b[1] for b in self._buckets)
+        failures = sum(b[2] for b in self._buckets)
+        p99 = self.p99()
+        return {
+            "state": self.state,
+            "window_calls": calls,
+            "window_failures": failures,
+            "p99_ms": round(p99 * 1000, 1) if p99 is not None else None,
+            "timeout_seconds": round(self.timeout(), 3),
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
+
+
+def _register_metrics(breaker: CircuitBreaker):
+    states = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def collect():
+        labels = {"breaker": breaker.name}
+        return [
+            ("magnetai_circuit_state", "gauge", "Circuit breaker state (0 closed, 1 half-open, 2 open)",
+             labels, states[breaker.state]),
+            ("magnetai_circuit_rejected_total", "counter", "Calls rejected by an open circuit",
+             labels, breaker.rejected),
+            ("magnetai_circuit_opened_total", "counter", "Times the circuit opened",
+             labels, breaker.opened),
+            ("magnetai_circuit_timeout_seconds", "gauge", "Current adaptive call timeout",
+             labels, breaker.timeout()),
+        ]
+
+    registry.register_collector(collect)
+
+
+# Guards the Firebase Admin SDK verification path
+firebase_breaker = CircuitBreaker("firebase")
+_register_metrics(firebase_breaker)
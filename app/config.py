@@ -6,4 +6,114 @@ load_dotenv()
 # Removed GOOGLE_CLIENT_ID and GOOGLE_CLIENT_SECRET
 JWT_SECRET = os.environ.get("JWT_SECRET", "your-jwt-secret-key")
 JWT_ALGORITHM = "HS256"
-JWT_EXPIRATION_HOURS = 24 
\ No newline at end of file
+
+# Short-lived access tokens, renewed through rotating refresh tokens
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.environ.get("ACCESS_TOKEN_EXPIRE_MINUTES", "15"))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.environ.get("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+# Longest an access token may live, whatever lifetime it was issued with. Revoke-all entries
+# are kept this long; the default covers the 24-hour tokens issued before refresh tokens.
+ACCESS_TOKEN_MAX_LIFETIME_HOURS = float(os.environ.get("ACCESS_TOKEN_MAX_LIFETIME_HOURS", "24"))
+# "auto" keeps refresh tokens in the database when one is configured, "memory" never does
+REFRESH_TOKEN_STORE = os.environ.get("REFRESH_TOKEN_STORE", "auto").lower()
+# Without a database the multi-worker server keeps refresh tokens in shared memory
+REFRESH_TOKEN_SHARED_SLOTS = int(os.environ.get("REFRESH_TOKEN_SHARED_SLOTS", "50000"))
+# How often revocations made by other processes are pulled from the database
+REVOCATION_SYNC_SECONDS = float(os.environ.get("REVOCATION_SYNC_SECONDS", "5"))
+
+# Access-token key ring: a JSON list of {"kid", "alg", "secret" | "private_key" | "public_key"}.
+# When unset, JWT_SECRET is the only key (kid "default").
+JWT_KEYS = os.environ.get("JWT_KEYS")
+JWT_SIGNING_KID = os.environ.get("JWT_SIGNING_KID")
+
+# Firebase ID-token verification runs on a shared, bounded thread pool
+FIREBASE_VERIFY_WORKERS = int(os.environ.get("FIREBASE_VERIFY_WORKERS", "8"))
+FIREBASE_VERIFY_QUEUE_SIZE = int(os.environ.get("FIREBASE_VERIFY_QUEUE_SIZE", "32"))
+# Upper bound on one SDK verification; the actual timeout adapts to the observed p99
+FIREBASE_VERIFY_TIMEOUT_SECONDS = float(os.environ.get("FIREBASE_VERIFY_TIMEOUT_SECONDS", "15"))
+FIREBASE_VERIFY_MIN_TIMEOUT_SECONDS = float(os.environ.get("FIREBASE_VERIFY_MIN_TIMEOUT_SECONDS", "1"))
+FIREBASE_VERIFY_TIMEOUT_P99_MULTIPLIER = float(os.environ.get("FIREBASE_VERIFY_TIMEOUT_P99_MULTIPLIER", "3"))
+
+# Circuit breaker around the SDK: opens when failures (errors, timeouts, calls
+# slower than SLOW_SECONDS) reach FAILURE_RATIO of the calls in the window
+FIREBASE_BREAKER_WINDOW_SECONDS = int(os.environ.get("FIREBASE_BREAKER_WINDOW_SECONDS", "30"))
+FIREBASE_BREAKER_MIN_CALLS = int(os.environ.get("FIREBASE_BREAKER_MIN_CALLS", "10"))
+FIREBASE_BREAKER_FAILURE_RATIO = float(os.environ.get("FIREBASE_BREAKER_FAILURE_RATIO", "0.5"))
+FIREBASE_BREAKER_SLOW_SECONDS = float(os.environ.get("FIREBASE_BREAKER_SLOW_SECONDS", "5"))
+FIREBASE_BREAKER_OPEN_SECONDS = float(os.environ.get("FIREBASE_BREAKER_OPEN_SECONDS", "30"))
+
+# Local Firebase ID-token verification against Google's cached signing keys
+FIREBASE_LOCAL_VERIFY = os.environ.get("FIREBASE_LOCAL_VERIFY", "true").lower() in ("1", "true", "yes")
+FIREBASE_PROJECT_ID = os.environ.get("FIREBASE_PROJECT_ID") or os.environ.get("GOOGLE_CLOUD_PROJECT")
+FIREBASE_CERTS_URL = os.environ.get(
+    "FIREBASE_CERTS_URL",
+    "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+)
+FIREBASE_KEYS_MIN_REFRESH_SECONDS = int(os.environ.get("FIREBASE_KEYS_MIN_REFRESH_SECONDS", "60"))
+
+# Verified Firebase token claims are cached until the token expires
+FIREBASE_TOKEN_CACHE_SIZE = int(os.environ.get("FIREBASE_TOKEN_CACHE_SIZE", "10000"))
+ACCESS_TOKEN_CACHE_SIZE = int(os.environ.get("ACCESS_TOKEN_CACHE_SIZE", "10000"))
+
+# Keep the Firebase token cache and login rate limits in shared memory so that
+# forked workers share them (set by app.server; must be decided before import)
+SHARED_CACHES = os.environ.get("SHARED_CACHES", "false").lower() in ("1", "true", "yes")
+# Largest serialized Firebase claim set the shared token cache will hold
+SHARED_TOKEN_CACHE_VALUE_BYTES = int(os.environ.get("SHARED_TOKEN_CACHE_VALUE_BYTES", "2048"))
+# Longest a request waits for a shared-memory stripe lock before bypassing the shared table
+SHARED_LOCK_TIMEOUT_MS = float(os.environ.get("SHARED_LOCK_TIMEOUT_MS", "10"))
+
+# Set by Vercel. Each instance is a separate process, so session state needs the database.
+ON_VERCEL = bool(os.environ.get("VERCEL"))
+
+# Shared secret for service-to-service and debug endpoints (X-Internal-Api-Key); unset disables them
+INTERNAL_API_KEY = os.environ.get("INTERNAL_API_KEY")
+# POST /auth/verify-batch limits
+VERIFY_BATCH_MAX_TOKENS = int(os.environ.get("VERIFY_BATCH_MAX_TOKENS", "1000"))
+VERIFY_BATCH_FIREBASE_CONCURRENCY = int(os.environ.get("VERIFY_BATCH_FIREBASE_CONCURRENCY", "8"))
+
+# Bodies read by hand (app.body): size cap and total read deadline
+REQUEST_BODY_MAX_BYTES = int(os.environ.get("REQUEST_BODY_MAX_BYTES", "16384"))
+REQUEST_BODY_TIMEOUT_SECONDS = float(os.environ.get("REQUEST_BODY_TIMEOUT_SECONDS", "10"))
+
+# Request profiling (served at /debug/profiles); off unless a rate or paths are set.
+# PROFILE_PATHS is a comma-separated list of path prefixes to always profile.
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_PATHS = [p.strip() for p in os.environ.get("PROFILE_PATHS", "").split(",") if p.strip()]
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "5"))
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", "20"))
+
+# Event loop watchdog: lag is sampled every INTERVAL; lags past the threshold are
+# logged with the stack that was blocking the loop
+LOOP_WATCHDOG_ENABLED = os.environ.get("LOOP_WATCHDOG_ENABLED", "true").lower() in ("1", "true", "yes")
+LOOP_WATCHDOG_INTERVAL_MS = float(os.environ.get("LOOP_WATCHDOG_INTERVAL_MS", "20"))
+LOOP_STALL_THRESHOLD_MS = float(os.environ.get("LOOP_STALL_THRESHOLD_MS", "100"))
+
+# JSON encoder for responses: "auto" uses orjson when it is installed, "json" forces the stdlib
+JSON_BACKEND = os.environ.get("JSON_BACKEND", "auto").lower()
+
+# Logging: records are written by a background thread; access records can be sampled
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+ACCESS_LOG_LEVEL = os.environ.get("ACCESS_LOG_LEVEL", "INFO").upper()
+ACCESS_LOG_SAMPLE_RATE = float(os.environ.get("ACCESS_LOG_SAMPLE_RATE", "1.0"))
+
+# User database (Supabase Postgres, or sqlite:///path for a local stand-in)
+DATABASE_URL = os.environ.get("SUPABASE_DATABASE_URL") or os.environ.get("DATABASE_URL")
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+DB_POOL_TIMEOUT_SECONDS = float(os.environ.get("DB_POOL_TIMEOUT_SECONDS", "5"))
+LAST_LOGIN_FLUSH_SECONDS = float(os.environ.get("LAST_LOGIN_FLUSH_SECONDS", "5"))
+LAST_LOGIN_BATCH_SIZE = int(os.environ.get("LAST_LOGIN_BATCH_SIZE", "500"))
+
+# User profiles read by /auth/me are cached in memory
+PROFILE_CACHE_SIZE = int(os.environ.get("PROFILE_CACHE_SIZE", "10000"))
+PROFILE_CACHE_TTL_SECONDS = float(os.environ.get("PROFILE_CACHE_TTL_SECONDS", "300"))
+PROFILE_NEGATIVE_TTL_SECONDS = float(os.environ.get("PROFILE_NEGATIVE_TTL_SECONDS", "30"))
+
+# Login protection: token buckets per client IP and per user, plus a global concurrency cap
+LOGIN_RATE_PER_IP = float(os.environ.get("LOGIN_RATE_PER_IP", "5"))
+LOGIN_BURST_PER_IP = float(os.environ.get("LOGIN_BURST_PER_IP", "20"))
+LOGIN_RATE_PER_SUBJECT = float(os.environ.get("LOGIN_RATE_PER_SUBJECT", "1"))
+LOGIN_BURST_PER_SUBJECT = float(os.environ.get("LOGIN_BURST_PER_SUBJECT", "10"))
+LOGIN_MAX_CONCURRENT = int(os.environ.get("LOGIN_MAX_CONCURRENT", "64"))
+RATE_LIMIT_MAX_KEYS = int(os.environ.get("RATE_LIMIT_MAX_KEYS", "100000"))
+# Behind a proxy (e.g. Vercel) the client address comes from X-Forwarded-For
+RATE_LIMIT_TRUST_FORWARDED = os.environ.get("RATE_LIMIT_TRUST_FORWARDED", "false").lower() in ("1", "true", "yes")
@@ -0,0 +1,234 @@
+import asyncio
+import logging
+import queue
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from app.config import DATABASE_URL, DB_POOL_SIZE, DB_POOL_TIMEOUT_SECONDS
+from app.lazy import lazy_import
+
+psycopg2 = lazy_import("psycopg2")
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    """No connection became available within the pool timeout."""
+
+
+class ConnectionPool:
+    """
+    Fixed-size, thread-safe connection pool.
+
+    Connections are opened lazily up to ``max_size``; once all are checked
+    out, callers wait up to ``timeout`` seconds for one to come back.
+    """
+
+    def __init__(self, connect: Callable, max_size: int, timeout: float):
+        self._connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.max_size:
+                self._created += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._created -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise PoolTimeout(f"No database connection available after {self.timeout:g}s")
+
+    def release(self, conn, discard: bool = False):
+        if discard:
+            with self._lock:
+                self._created -= 1
+            try:
+                conn.close()
+            except Exception:
+                pass
+            return
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection, committing on success and rolling back on error."""
+        conn = self.acquire()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            broken = False
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+            self.release(conn, discard=broken)
+            raise
+        self.release(conn)
+
+    def close(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self.release(conn, discard=True)
+
+
+class Dialect:
+    """The few places where Postgres and the SQLite stand-in disagree."""
+
+    def __init__(self, name: str, placeholder: str, schema: str = ""):
+        self.name = name
+        self.placeholder = placeholder
+        self.schema = schema
+        self.table = self.qualify("users")
+
+    def qualify(self, table: str) -> str:
+        return f"{self.schema}.{table}" if self.schema else table
+
+    def params(self, count: int) -> str:
+        return ", ".join([self.placeholder] * count)
+
+
+POSTGRES = Dialect("postgres", "%s", "public")
+SQLITE = Dialect("sqlite", "?")
+
+# Local stand-in for the tables in supabase_schema.sql
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY DEFAULT (lower(hex(randomblob(16)))),
+    google_id TEXT UNIQUE NOT NULL,
+    email TEXT UNIQUE NOT NULL,
+    name TEXT NOT NULL,
+    picture TEXT,
+    email_verified BOOLEAN NOT NULL DEFAULT 0,
+    last_login TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS refresh_tokens (
+    token_hash BLOB PRIMARY KEY,
+    family_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    email TEXT NOT NULL,
+    expires_at INTEGER NOT NULL,
+    used BOOLEAN NOT NULL DEFAULT 0,
+    revoked BOOLEAN NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_refresh_tokens_family_id ON refresh_tokens(family_id);
+CREATE INDEX IF NOT EXISTS idx_refresh_tokens_user_id ON refresh_tokens(user_id);
+CREATE INDEX IF NOT EXISTS idx_refresh_tokens_expires_at ON refresh_tokens(expires_at);
+CREATE TABLE IF NOT EXISTS revoked_tokens (
+    jti TEXT PRIMARY KEY,
+    expires_at INTEGER NOT NULL,
+    revoked_at REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_revoked_tokens_revoked_at ON revoked_tokens(revoked_at);
+CREATE TABLE IF NOT EXISTS revoked_users (
+    user_id TEXT PRIMARY KEY,
+    revoked_before REAL NOT NULL,
+    expires_at INTEGER NOT NULL,
+    revoked_at REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_revoked_users_revoked_at ON revoked_users(revoked_at);
+"""
+
+
+class Database:
+    """
+    Async front for a blocking DB-API driver.
+
+    Each query runs on a small dedicated thread pool sized to the connection
+    pool, so database work never blocks the event loop or competes with the
+    token-verification executor.
+    """
+
+    def __init__(self, pool: ConnectionPool, dialect: Dialect):
+        self.pool = pool
+        self.dialect = dialect
+        self._executor = ThreadPoolExecutor(max_workers=pool.max_size, thread_name_prefix="db")
+
+    def _call(self, func, args):
+        with self.pool.connection() as conn:
+            return func(conn, *args)
+
+    async def run(self, func, *args):
+        """Run ``func(conn, *args)`` on a pooled connection inside a transaction."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._call, func, args)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.pool.close()
+
+
+def connect_database(url: str, pool_size: int = DB_POOL_SIZE,
+                     timeout: float = DB_POOL_TIMEOUT_SECONDS) -> Database:
+    if url.startswith("sqlite:///"):
+        path = url[len("sqlite:///"):]
+        if path == ":memory:":
+            # Every connection would otherwise see its own empty database.
+            # Shared-cache writers fail with "table is locked" instead of
+            # waiting, so the in-memory stand-in gets a single connection.
+            path = "file:magnetai?mode=memory&cache=shared"
+            pool_size = 1
+
+        def connect():
+            conn = sqlite3.connect(path, uri=path.startswith("file:"), check_same_thread=False)
+            conn.executescript(SQLITE_SCHEMA)
+            return conn
+
+        pool = ConnectionPool(connect, pool_size, timeout)
+        # Open one connection up front; idle connections stay open, which also
+        # keeps a shared in-memory database alive
+        pool.release(pool.acquire())
+        return Database(pool, SQLITE)
+
+    if url.startswith(("postgres://", "postgresql://")):
+        pool = ConnectionPool(lambda: psycopg2.connect(url), pool_size, timeout)
+        return Database(pool, POSTGRES)
+
+    raise ValueError("Unsupported database URL; expected postgresql:// or sqlite:///")
+
+
+_database: Optional[Database] = None
+
+
+def start_database() -> Optional[Database]:
+    global _database
+    if _database is None and DATABASE_URL:
+        try:
+            _database = connect_database(DATABASE_URL)
+        except ValueError as e:
+            # e.g. a placeholder copied from env_template.txt; run as if none were set
+            logger.warning("Ignoring the database URL and running without a database: %s", e)
+            return None
+        logger.info("Database pool ready (%s, up to %d connections)", _database.dialect.name, DB_POOL_SIZE)
+    return _database
+
+
+def get_database() -> Optional[Database]:
+    return _database
+
+
+def shutdown_database():
+    global _database
+    if _database is not None:
+        _database.close()
+        _database = None
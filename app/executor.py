@@ -0,0 +1,111 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from app.config import FIREBASE_VERIFY_WORKERS, FIREBASE_VERIFY_QUEUE_SIZE
+from app.metrics import registry
+
+
+class ExecutorSaturated(Exception):
+    """Raised when the executor already has as much work as it will accept."""
+
+
+class BoundedExecutor:
+    """
+    Thread pool with a hard cap on in-flight work (running + queued).
+
+    Submissions beyond the cap are rejected immediately instead of piling up
+    behind the workers, so callers can shed load with a fast error.
+    """
+
+    def __init__(self, max_workers: int, queue_size: int, thread_name_prefix: str = "verify"):
+        self.max_workers = max_workers
+        self.capacity = max_workers + queue_size
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._in_flight = 0
+        self._rejected = 0
+        self._lock = threading.Lock()
+
+    def _release(self, _future=None):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def run(self, func, *args) -> "asyncio.Future":
+        """Schedule func(*args) on the pool and return an awaitable for the running loop."""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise ExecutorSaturated("Verification executor is saturated")
+        with self._lock:
+            self._in_flight += 1
+        try:
+            future = self._executor.submit(func, *args)
+        except Exception:
+            self._release()
+            raise
+        # The slot is held until the worker actually finishes, even if the
+        # awaiting request has already timed out and gone away.
+        future.add_done_callback(self._release)
+        return asyncio.wrap_future(future)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "capacity": self.capacity,
+                "in_flight": self._in_flight,
+                "rejected": self._rejected,
+            }
+
+    def shutdown(self):
+        # Don't wait on workers stuck in a slow verification; drop queued work.
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_verification_executor: Optional[BoundedExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def start_verification_executor() -> BoundedExecutor:
+    global _verification_executor
+    with _executor_lock:
+        if _verification_executor is None:
+            _verification_executor = BoundedExecutor(
+                max_workers=FIREBASE_VERIFY_WORKERS,
+                queue_size=FIREBASE_VERIFY_QUEUE_SIZE,
+            )
+        return _verification_executor
+
+
+def get_verification_executor() -> BoundedExecutor:
+    # Serverless runtimes don't always deliver the startup event, so fall
+    # back to creating the executor on first use.
+    return _verification_executor or start_verification_executor()
+
+
+def shutdown_verification_executor():
+    global _verification_executor
+    with _executor_lock:
+        if _verification_executor is not None:
+            _verification_executor.shutdown()
+            _verification_executor = None
+
+
+def _executor_metrics():
+    if _verification_executor is None:
+        return []
+    stats = _verification_executor.stats()
+    return [
+        ("magnetai_verify_executor_in_flight", "gauge",
+         "Verifications running or queued on the executor", {}, stats["in_flight"]),
+        ("magnetai_verify_executor_capacity", "gauge",
+         "Maximum verifications the executor accepts", {}, stats["capacity"]),
+        ("magnetai_verify_executor_rejected_total", "counter",
+         "Verifications rejected because the executor was saturated", {}, stats["rejected"]),
+    ]
+
+
+registry.register_collector(_executor_metrics)
@@ -0,0 +1,116 @@
+import asyncio
+import base64
+import json
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+from app.firebase_verifier import get_key_refresher, init_local_verifier
+from app.lazy import lazy_import
+
+firebase_admin = lazy_import("firebase_admin")
+firebase_credentials = lazy_import("firebase_admin.credentials")
+
+logger = logging.getLogger(__name__)
+
+
+class FirebaseInitializer:
+    """
+    Initializes the Firebase Admin SDK exactly once, off the import path.
+
+    The blocking work (decoding credentials, building the app) runs on a
+    worker thread. Concurrent awaiters share one in-flight future, and a
+    failure is remembered so later callers don't retry on every request.
+    """
+
+    def __init__(self):
+        self.state = "pending"
+        self.error: Optional[str] = None
+        self.duration_ms: Optional[float] = None
+        self._lock = threading.Lock()
+        self._future: Optional[asyncio.Future] = None
+        self._future_loop = None
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def initialize_blocking(self):
+        """Run the initialization on the calling thread (idempotent)."""
+        with self._lock:
+            if self.state != "pending":
+                return
+            start = time.perf_counter()
+            try:
+                self._initialize()
+                self.state = "ready"
+            except Exception as e:
+                # Continue without Firebase; login routes report it per request
+                self.state = "failed"
+                self.error = str(e)
+                logger.warning("Failed to initialize Firebase: %s", e)
+            self.duration_ms = (time.perf_counter() - start) * 1000
+            logger.info("Firebase Admin initialization %s in %.1f ms", self.state, self.duration_ms)
+
+    def _initialize(self):
+        if firebase_admin._apps:
+            init_local_verifier(None)
+            return
+        cred_path = os.environ.get("FIREBASE_CREDENTIALS")
+        cred_b64 = os.environ.get("FIREBASE_CREDENTIALS_BASE64")
+        if cred_b64:
+            cred_json = base64.b64decode(cred_b64).decode("utf-8")
+            cred_dict = json.loads(cred_json)
+            cred = firebase_credentials.Certificate(cred_dict)
+            firebase_admin.initialize_app(cred)
+            init_local_verifier(cred.project_id)
+        elif cred_path:
+            cred = firebase_credentials.Certificate(cred_path)
+            firebase_admin.initialize_app(cred)
+            init_local_verifier(cred.project_id)
+        else:
+            # Initialize without credentials (for development/testing)
+            logger.warning("No Firebase credentials found. Firebase features may not work.")
+            firebase_admin.initialize_app()
+            init_local_verifier(None)
+
+    def start(self) -> asyncio.Future:
+        """Begin initializing in the background; returns the shared future."""
+        loop = asyncio.get_running_loop()
+        if self._future is None or self._future_loop is not loop:
+            self._future = asyncio.ensure_future(self._run(loop))
+            self._future_loop = loop
+        return self._future
+
+    async def _run(self, loop):
+        await loop.run_in_executor(None, self.initialize_blocking)
+        key_refresher = get_key_refresher()
+        if key_refresher is not None:
+            key_refresher.start()
+
+    async def ensure(self):
+        """Wait until initialization has finished (successfully or not)."""
+        if self.state != "pending" and self._future is not None and self._future.done():
+            return
+        # Shield so a cancelled request doesn't cancel the shared init
+        await asyncio.shield(self.start())
+
+    def status(self) -> dict:
+        return {
+            "state": self.state,
+            "error": self.error,
+            "init_ms": round(self.duration_ms, 1) if self.duration_ms is not None else None,
+        }
+
+
+firebase_initializer = FirebaseInitializer()
+
+
+async def ensure_firebase():
+    await firebase_initializer.ensure()
+
+
+def start_firebase_warmup():
+    firebase_initializer.start()
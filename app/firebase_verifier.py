@@ -0,0 +1,223 @@
+import asyncio
+import json
+import logging
+import re
+import threading
+import time
+import urllib.request
+from typing import Callable, Optional, Tuple
+
+from app.config import (
+    FIREBASE_CERTS_URL,
+    FIREBASE_LOCAL_VERIFY,
+    FIREBASE_PROJECT_ID,
+    FIREBASE_KEYS_MIN_REFRESH_SECONDS,
+)
+from app.lazy import lazy_import
+
+jwt = lazy_import("jwt")
+x509 = lazy_import("cryptography.x509")
+
+logger = logging.getLogger(__name__)
+
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+# Refresh this long before the published max-age runs out, so requests never
+# see an expired key set while the background refresh is in flight.
+_REFRESH_MARGIN_SECONDS = 300
+
+
+class UnknownKeyId(Exception):
+    """The token was signed with a key that isn't in the cached key set."""
+
+
+class StaleKeySet(Exception):
+    """The cached key set is past its max-age, so a key in it may have been withdrawn."""
+
+
+def _fetch_certs(url: str) -> Tuple[bytes, str]:
+    with urllib.request.urlopen(url, timeout=10) as resp:
+        return resp.read(), resp.headers.get("Cache-Control", "")
+
+
+class FirebaseKeySet:
+    """
+    Google's securetoken signing keys, parsed once and indexed by ``kid``.
+
+    ``fetcher`` takes the certs URL and returns ``(body, cache_control)``;
+    swap it for a stub to serve a locally generated key set.
+    """
+
+    def __init__(self, certs_url: str = FIREBASE_CERTS_URL,
+                 fetcher: Callable[[str], Tuple[bytes, str]] = _fetch_certs):
+        self.certs_url = certs_url
+        self.fetcher = fetcher
+        self.keys = {}
+        self.expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def load(self, certs: dict, max_age: float):
+        keys = {}
+        for kid, pem in certs.items():
+            keys[kid] = x509.load_pem_x509_certificate(pem.encode("utf-8")).public_key()
+        # Swap the whole dict so readers on the event loop never see a partial set
+        self.keys = keys
+        self.expires_at = time.time() + max_age
+
+    def refresh(self):
+        """Fetch and parse the key set. Blocking; run it off the event loop."""
+        with self._lock:
+            body, cache_control = self.fetcher(self.certs_url)
+            match = _MAX_AGE_RE.search(cache_control or "")
+            max_age = int(match.group(1)) if match else 0
+            self.load(json.loads(body), max(max_age, FIREBASE_KEYS_MIN_REFRESH_SECONDS))
+            logger.info(f"Loaded {len(self.keys)} Firebase signing keys (max-age {max_age}s)")
+
+    def get(self, kid: str):
+        return self.keys.get(kid)
+
+    def is_fresh(self) -> bool:
+        return bool(self.keys) and time.time() < self.expires_at
+
+    def seconds_until_refresh(self) -> float:
+        return self.expires_at - _REFRESH_MARGIN_SECONDS - time.time()
+
+
+class LocalFirebaseVerifier:
+    """Verifies Firebase ID tokens in-process against a cached key set."""
+
+    def __init__(self, project_id: str, key_set: FirebaseKeySet):
+        self.project_id = project_id
+        self.issuer = f"https://securetoken.google.com/{project_id}"
+        self.key_set = key_set
+
+    def verify(self, id_token_str: str) -> dict:
+        if self.key_set.keys and not self.key_set.is_fresh():
+            raise StaleKeySet()
+        header = jwt.get_unverified_header(id_token_str)
+        if header.get("alg") != "RS256":
+            raise jwt.InvalidTokenError("Firebase ID token has incorrect algorithm")
+        kid = header.get("kid")
+        if not kid:
+            raise jwt.InvalidTokenError("Firebase ID token has no 'kid' claim")
+        key = self.key_set.get(kid)
+        if key is None:
+            raise UnknownKeyId(kid)
+
+        claims = jwt.decode(
+            id_token_str,
+            key,
+            algorithms=["RS256"],
+            audience=self.project_id,
+            issuer=self.issuer,
+            options={"require": ["exp", "iat", "aud", "iss", "sub"]},
+        )
+        sub = claims.get("sub")
+        if not isinstance(sub, str) or not sub or len(sub) > 128:
+            raise jwt.InvalidTokenError("Firebase ID token has an invalid 'sub' claim")
+        auth_time = claims.get("auth_time")
+        if auth_time is not None and auth_time > time.time():
+            raise jwt.InvalidTokenError("Firebase ID token has a future 'auth_time' claim")
+        # Match the shape returned by firebase_admin.auth.verify_id_token
+        claims["uid"] = sub
+        return claims
+
+
+class KeyRefresher:
+    """Background task that keeps a key set fresh according to its max-age."""
+
+    def __init__(self, key_set: FirebaseKeySet):
+        self.key_set = key_set
+        self._wakeup = None
+        self._task = None
+        self._inflight: Optional[asyncio.Future] = None
+        self._retry_at = 0.0
+
+    def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+
+    def request_refresh(self):
+        """Ask for an early refresh, e.g. after seeing an unknown ``kid``."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def refresh_now(self):
+        """
+        Refresh the key set before returning; concurrent callers share one
+        fetch. After a failed fetch, callers fail fast until
+        ``FIREBASE_KEYS_MIN_REFRESH_SECONDS`` have passed.
+        """
+        if self._inflight is None:
+            if time.monotonic() < self._retry_at:
+                raise StaleKeySet("the last refresh failed; not retrying yet")
+            self._inflight = asyncio.get_running_loop().run_in_executor(None, self.key_set.refresh)
+            self._inflight.add_done_callback(self._refreshed)
+        await asyncio.shield(self._inflight)
+
+    def _refreshed(self, future: asyncio.Future):
+        self._inflight = None
+        if future.cancelled() or future.exception() is not None:
+            self._retry_at = time.monotonic() + FIREBASE_KEYS_MIN_REFRESH_SECONDS
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            delay = self.key_set.seconds_until_refresh()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+            self._wakeup.clear()
+            try:
+                await loop.run_in_executor(None, self.key_set.refresh)
+            except Exception as e:
+                logger.warning(f"Failed to refresh Firebase signing keys: {e}")
+                await asyncio.sleep(FIREBASE_KEYS_MIN_REFRESH_SECONDS)
+
+
+_local_verifier: Optional[LocalFirebaseVerifier] = None
+_key_refresher: Optional[KeyRefresher] = None
+
+
+def configure_local_verifier(project_id: Optional[str], key_set: Optional[FirebaseKeySet] = None):
+    """Install (or with ``project_id=None``, remove) the process-wide local verifier."""
+    global _local_verifier, _key_refresher
+    if not project_id:
+        _local_verifier = None
+        _key_refresher = None
+        return None
+    key_set = key_set or FirebaseKeySet()
+    _local_verifier = LocalFirebaseVerifier(project_id, key_set)
+    _key_refresher = KeyRefresher(key_set)
+    return _local_verifier
+
+
+def get_local_verifier() -> Optional[LocalFirebaseVerifier]:
+    return _local_verifier
+
+
+def get_key_refresher() -> Optional[KeyRefresher]:
+    return _key_refresher
+
+
+def init_local_verifier(project_id: Optional[str]):
+    if FIREBASE_LOCAL_VERIFY and _local_verifier is None:
+        configure_local_verifier(FIREBASE_PROJECT_ID or project_id)
+
+
+# With an explicit project id the local verifier doesn't need to wait for
+# the Admin SDK to load credentials.
+if FIREBASE_PROJECT_ID:
+    init_local_verifier(None)
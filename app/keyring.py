@@ -0,0 +1,193 @@
+import asyncio
+import json
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Optional
+
+from app.config import JWT_ALGORITHM, JWT_KEYS, JWT_SECRET, JWT_SIGNING_KID
+from app.lazy import lazy_import
+
+jwt = lazy_import("jwt")
+
+logger = logging.getLogger(__name__)
+
+# Tokens issued before kid headers existed were signed with JWT_SECRET; they
+# verify against the key with this id.
+LEGACY_KID = "default"
+
+# Distinct header segments seen in practice are one per key; the cap only
+# matters for crafted headers that happen to name a real kid.
+_HEADER_CACHE_SIZE = 1024
+
+
+@dataclass(frozen=True)
+class JWTKey:
+    kid: str
+    algorithm: str
+    # Prepared key objects; signing_key is None for verify-only keys
+    signing_key: Any
+    verification_key: Any
+
+    @property
+    def can_sign(self) -> bool:
+        return self.signing_key is not None
+
+
+def build_key(spec: dict) -> JWTKey:
+    """
+    Build a key from one ``JWT_KEYS`` entry.
+
+    HMAC keys take a ``secret``. RSA/EC keys take a PEM ``private_key`` (sign
+    and verify) or only a ``public_key`` (verify-only, for processes that
+    must not hold signing material).
+    """
+    kid = spec.get("kid")
+    if not kid:
+        raise ValueError("JWT key is missing a kid")
+    algorithm = spec.get("alg", JWT_ALGORITHM)
+    try:
+        algo = jwt.get_algorithm_by_name(algorithm)
+    except NotImplementedError:
+        raise ValueError(f"JWT key {kid!r}: unsupported algorithm {algorithm}")
+
+    if algorithm.startswith("HS"):
+        secret = spec.get("secret")
+        if not secret:
+            raise ValueError(f"JWT key {kid!r}: {algorithm} needs a secret")
+        prepared = algo.prepare_key(secret)
+        return JWTKey(kid, algorithm, prepared, prepared)
+
+    private_pem = spec.get("private_key")
+    public_pem = spec.get("public_key")
+    if private_pem:
+        signing_key = algo.prepare_key(private_pem)
+        return JWTKey(kid, algorithm, signing_key, signing_key.public_key())
+    if public_pem:
+        return JWTKey(kid, algorithm, None, algo.prepare_key(public_pem))
+    raise ValueError(f"JWT key {kid!r}: {algorithm} needs a private_key or public_key")
+
+
+class KeyRing:
+    """
+    Access-token signing and verification keys, built once.
+
+    New tokens are signed with the signing key and carry its ``kid`` header;
+    incoming tokens are verified with the key their ``kid`` names, looked up
+    in a dict. Several keys can be live at once, so a rotation is: add the new
+    key, switch ``JWT_SIGNING_KID`` to it, and drop the old key once the
+    tokens it signed have expired.
+    """
+
+    def __init__(self, keys: Iterable[JWTKey], signing_kid: Optional[str] = None,
+                 legacy_kid: Optional[str] = LEGACY_KID):
+        self._keys: Dict[str, JWTKey] = {}
+        for key in keys:
+            if key.kid in self._keys:
+                raise ValueError(f"Duplicate JWT kid {key.kid!r}")
+            self._keys[key.kid] = key
+        if not self._keys:
+            raise ValueError("JWT key ring is empty")
+
+        if signing_kid is not None:
+            self.signing_key = self._keys.get(signing_kid)
+            if self.signing_key is None or not self.signing_key.can_sign:
+                raise ValueError(f"JWT signing kid {signing_kid!r} is not a key with signing material")
+        else:
+            # Verify-only rings (no signing material at all) are allowed
+            self.signing_key = next((key for key in self._keys.values() if key.can_sign), None)
+
+        self.legacy_key = self._keys.get(legacy_kid) if legacy_kid else None
+        self._signing_headers = {"kid": self.signing_key.kid} if self.signing_key else None
+        # header segment -> key
+        self._header_keys: Dict[str, JWTKey] = {}
+
+    @property
+    def kids(self):
+        return list(self._keys)
+
+    def encode(self, payload: dict) -> str:
+        key = self.signing_key
+        if key is None:
+            raise RuntimeError("JWT key ring has no signing key")
+        return jwt.encode(payload, key.signing_key, algorithm=key.algorithm, headers=self._signing_headers)
+
+    def key_for(self, token: str) -> JWTKey:
+        """Pick the verification key named by the token's header."""
+        segment = token.split(".", 1)[0]
+        key = self._header_keys.get(segment)
+        if key is not None:
+            return key
+        header = jwt.get_unverified_header(token)
+        kid = header.get("kid")
+        key = self.legacy_key if kid is None else self._keys.get(kid)
+        if key is None:
+            raise jwt.InvalidTokenError("Unknown key id")
+        # Only headers naming a real key are remembered
+        if len(self._header_keys) >= _HEADER_CACHE_SIZE:
+            self._header_keys.clear()
+        self._header_keys[segment] = key
+        return key
+
+    def decode(self, token: str) -> dict:
+        key = self.key_for(token)
+        # The algorithm comes from the key, never from the token header
+        return jwt.decode(token, key.verification_key, algorithms=[key.algorithm])
+
+
+def load_keyring(keys_json: Optional[str] = JWT_KEYS, signing_kid: Optional[str] = JWT_SIGNING_KID) -> KeyRing:
+    """
+    Build the ring from ``JWT_KEYS`` (a JSON list of key entries), or from
+    ``JWT_SECRET`` as the single ``default`` key when that isn't set.
+    """
+    if not keys_json:
+        specs = [{"kid": LEGACY_KID, "alg": JWT_ALGORITHM, "secret": JWT_SECRET}]
+    else:
+        try:
+            specs = json.loads(keys_json)
+        except ValueError as e:
+            raise ValueError(f"JWT_KEYS is not valid JSON: {e}")
+        if not isinstance(specs, list):
+            raise ValueError("JWT_KEYS must be a JSON list of keys")
+    return KeyRing([build_key(spec) for spec in specs], signing_kid)
+
+
+_keyring: Optional[KeyRing] = None
+# The warmup thread and a first request can race to build it
+_keyring_lock = threading.Lock()
+
+
+def get_keyring() -> KeyRing:
+    """The process-wide ring, built on first use (normally by the warmup thread)."""
+    global _keyring
+    if _keyring is None:
+        with _keyring_lock:
+            if _keyring is None:
+                keyring = load_keyring()
+                logger.info(
+                    "JWT key ring ready (kids: %s; signing with %s)",
+                    ", ".join(keyring.kids),
+                    keyring.signing_key.kid if keyring.signing_key else "none",
+                )
+                _keyring = keyring
+    return _keyring
+
+
+def _report_keyring_failure(future: asyncio.Future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Invalid JWT key configuration; access tokens will fail: %s", future.exception())
+
+
+def start_keyring_warmup() -> asyncio.Future:
+    """
+    Build the ring in a worker thread: it imports pyjwt and cryptography,
+    which would otherwise hold up the event loop at startup.
+    """
+    future = asyncio.get_running_loop().run_in_executor(None, get_keyring)
+    future.add_done_callback(_report_keyring_failure)
+    return future
+
+
+def configure_keyring(keyring: KeyRing):
+    global _keyring
+    _keyring = keyring
@@ -1,85 +1,100 @@
-from fastapi import FastAPI, Request, Response, HTTPException
-from fastapi.responses import JSONResponse
+import time
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, Request, Response, HTTPException, Depends
 from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from app.routes import auth_routes, user_routes
-from app.models import BaseResponse
-from app.utils import base_response
+from app.utils import base_response, static_response
+from app.executor import start_verification_executor, shutdown_verification_executor
+from app.firebase_verifier import get_key_refresher
+from app.auth import firebase_token_cache, firebase_verify_flight, cache_stats, require_internal_caller
+from app.keyring import start_keyring_warmup
+from app.token_prefilter import prefilter_stats
+from app.circuit_breaker import firebase_breaker
+from app.watchdog import start_watchdog, shutdown_watchdog, watchdog_stats
+from app.profiling import ProfilingMiddleware, WALL, CPU, profiler, profiling_enabled
+from app.access_log import AccessLogMiddleware, setup_logging
+from app.metrics import MetricsMiddleware, registry as metrics_registry
+from app.firebase_init import firebase_initializer, start_firebase_warmup
+from app.db import start_database, shutdown_database
+from app.ratelimit import LoginAdmissionMiddleware
+from app.user_repository import start_user_store, shutdown_user_store, profile_cache_stats
+from app.refresh_tokens import start_refresh_store
+from app.revocation import start_revocation, shutdown_revocation, revocation_stats
 from datetime import datetime
 import json
-import traceback
 import logging
+import os
+import sys
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
+# Set up logging; records are written out by a background thread
+setup_logging()
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="MagnetAI")
 
 @app.on_event("startup")
 async def startup_event():
-    logger.info("MagnetAI API starting up...")
+    logger.info("MagnetAI API starting up (app import took %.1f ms)", _import_ms)
     
-    # Check Firebase configuration
-    try:
-        import firebase_admin
-        if firebase_admin._apps:
-            logger.info("Firebase Admin SDK is initialized")
-        else:
-            logger.warning("Firebase Admin SDK is not initialized - will initialize on first use")
-            
-        # Check environment variables
-        import os
-        firebase_creds = os.environ.get("FIREBASE_CREDENTIALS_BASE64")
-        if firebase_creds:
-            logger.info("Firebase credentials found in environment")
-        else:
-            logger.warning("No Firebase credentials found - Firebase auth will not work")
-            
-    except Exception as e:
-        logger.error(f"Error checking Firebase configuration: {e}")
+    # First, so blocking work in the rest of startup is caught too
+    start_watchdog()
+    
+    executor = start_verification_executor()
+    logger.info(f"Verification executor ready ({executor.max_workers} workers, capacity {executor.capacity})")
+    
+    key_refresher = get_key_refresher()
+    if key_refresher is not None:
+        key_refresher.start()
+        logger.info("Local Firebase token verification enabled")
+    
+    database = start_database()
+    start_user_store(database)
+    start_refresh_store(database)
+    start_revocation(database)
+    
+    # Warm the Firebase Admin SDK and the access-token keys in the background;
+    # a bad JWT_KEYS is logged as soon as the keys are built
+    start_firebase_warmup()
+    start_keyring_warmup()
+    
+    if not (os.environ.get("FIREBASE_CREDENTIALS_BASE64") or os.environ.get("FIREBASE_CREDENTIALS")):
+        logger.warning("No Firebase credentials found - Firebase auth will not work")
 
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    try:
-        # Log request details
-        logger.info(f"Request: {request.method} {request.url}")
-        
-        # Don't read the request body in middleware to avoid conflicts
-        # Just log that it's a POST request
-        if request.method == "POST":
-            logger.info("POST request received (body will be handled by endpoint)")
-        
-        response = await call_next(request)
-        return response
-    except Exception as e:
-        logger.error(f"Middleware error: {e}")
-        # Return a basic error response if middleware fails
-        return JSONResponse(
-            status_code=500,
-            content={"error": "Internal server error in middleware"}
-        )
+@app.on_event("shutdown")
+async def shutdown_event():
+    key_refresher = get_key_refresher()
+    if key_refresher is not None:
+        await key_refresher.stop()
+    shutdown_verification_executor()
+    await shutdown_user_store()
+    await shutdown_revocation()
+    shutdown_database()
+    await shutdown_watchdog()
+
+app.add_middleware(LoginAdmissionMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(AccessLogMiddleware)
+if profiling_enabled():
+    app.add_middleware(ProfilingMiddleware)
 
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
-    return JSONResponse(
+    return base_response(
+        success=False,
+        message=exc.detail,
         status_code=exc.status_code,
-        content=BaseResponse(
-            success=False,
-            message=exc.detail,
-            data=None
-        ).dict()
+        headers=getattr(exc, "headers", None)
     )
 
 @app.exception_handler(StarletteHTTPException)
 async def starlette_http_exception_handler(request: Request, exc: StarletteHTTPException):
-    return JSONResponse(
+    return base_response(
+        success=False,
+        message=exc.detail,
         status_code=exc.status_code,
-        content=BaseResponse(
-            success=False,
-            message=exc.detail,
-            data=None
-        ).dict()
+        headers=getattr(exc, "headers", None)
     )
 
 @app.exception_handler(RequestValidationError)
@@ -95,178 +110,130 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
         }
         serializable_errors.append(serializable_error)
     
-    return JSONResponse(
-        status_code=422,
-        content=BaseResponse(
-            success=False,
-            message="Validation error",
-            data={"errors": serializable_errors}
-        ).dict()
+    return base_response(
+        success=False,
+        message="Validation error",
+        data={"errors": serializable_errors},
+        status_code=422
     )
 
+_json_serialization_error_response = static_response(
+    success=False,
+    message="Internal server error: JSON serialization failed",
+    data={"error": "Request body could not be processed"},
+    status_code=500
+)
+_internal_error_response = static_response(
+    success=False,
+    message="Internal server error",
+    status_code=500
+)
+
 @app.exception_handler(Exception)
 async def general_exception_handler(request: Request, exc: Exception):
-    print("Unhandled exception:", exc)
-    traceback.print_exc()  # This will print the full traceback to your console
+    logger.error("Unhandled exception", exc_info=exc)
     
     # Handle JSON serialization errors specifically
     if isinstance(exc, TypeError) and "not JSON serializable" in str(exc):
-        return JSONResponse(
-            status_code=500,
-            content=BaseResponse(
-                success=False,
-                message="Internal server error: JSON serialization failed",
-                data={"error": "Request body could not be processed"}
-            ).dict()
-        )
+        return _json_serialization_error_response()
     
-    return JSONResponse(
-        status_code=500,
-        content=BaseResponse(
-            success=False,
-            message="Internal server error",
-            data=None
-        ).dict()
-    )
+    return _internal_error_response()
 
 app.include_router(auth_routes.router)
 app.include_router(user_routes.router)
 
+# Constant bodies are encoded once at import time
+_hello_response = static_response(
+    success=True,
+    message="API is working",
+    data={"message": "Hello from MagnetAI API!"},
+    status_code=200
+)
+
 # Add a simple health check endpoint
 @app.get("/health")
 async def health_check():
-    return base_response(
-        success=True,
-        message="API is working",
-        data={"message": "Hello from MagnetAI API!"},
-        status_code=200
-    )
+    return _hello_response()
 
 @app.get("/test")
 async def test_endpoint():
-    return base_response(
-        success=True,
-        message="API is working",
-        data={"message": "Hello from MagnetAI API!"},
-        status_code=200
-    )
+    return _hello_response()
 
 @app.get("/ping")
 async def ping_endpoint():
+    return _hello_response()
+
+@app.get("/cache-stats")
+async def cache_stats_endpoint():
+    """Hit rates and sizes of the in-process token caches"""
     return base_response(
         success=True,
-        message="API is working",
-        data={"message": "Hello from MagnetAI API!"},
+        message="Cache statistics retrieved",
+        data=dict(cache_stats(), profiles=profile_cache_stats(), revocations=revocation_stats()),
         status_code=200
     )
 
-@app.post("/no-imports-test")
-async def no_imports_test():
-    """
-    Test endpoint that doesn't use any imports or complex operations
-    """
-    print("no-imports-test endpoint reached")
-    return {"status": "ok", "message": "no imports test works"}
-
-@app.post("/minimal-test")
-async def minimal_test():
-    """
-    Minimal test endpoint - no request body, no custom functions
-    """
-    print("minimal-test endpoint reached")
-    return {"status": "ok", "message": "minimal test works"}
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text exposition of the in-process metrics"""
+    return Response(
+        content=metrics_registry.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
 
-@app.post("/step-test")
-async def step_test(request: Request):
-    """
-    Step-by-step test to find exactly where it hangs
-    """
-    print("step-test endpoint reached")
-    
-    print("Step 1: About to read request body...")
-    body = await request.body()
-    print("Step 2: Request body read successfully")
-    
-    print("Step 3: About to decode body...")
-    body_str = body.decode('utf-8') if body else ""
-    print("Step 4: Body decoded successfully")
-    
-    print("Step 5: About to create simple dict...")
-    simple_dict = {"test": "simple"}
-    print("Step 6: Simple dict created")
-    
-    print("Step 7: About to return response...")
-    return {"status": "ok", "data": body_str[:50]}
+@app.get("/debug/profiles", dependencies=[Depends(require_internal_caller)])
+async def list_profiles():
+    """The slowest profiled requests, slowest first"""
+    return base_response(
+        success=True,
+        message="Profiles retrieved",
+        data={
+            "enabled": profiling_enabled(),
+            "profiles": [profile.summary(profiler.interval) for profile in profiler.profiles()],
+        },
+        status_code=200
+    )
 
-@app.post("/no-body-test")
-async def no_body_test():
-    """
-    Test endpoint that doesn't read request body at all
-    """
-    print("no-body-test endpoint reached")
-    return {"status": "ok", "message": "no body test works"}
+@app.get("/debug/profiles/{profile_id}", dependencies=[Depends(require_internal_caller)])
+async def get_profile_stacks(profile_id: int, kind: str = WALL):
+    """One profile as collapsed stacks (flamegraph.pl / speedscope input); kind is wall or cpu"""
+    if kind not in (WALL, CPU):
+        raise HTTPException(status_code=400, detail="kind must be 'wall' or 'cpu'")
+    profile = profiler.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return Response(content=profile.collapsed(kind), media_type="text/plain; charset=utf-8")
 
-@app.post("/simple-test")
-async def simple_test(request: Request):
-    """
-    Simple test endpoint that doesn't use any models - just to test if POST requests work
-    """
-    try:
-        print("simple-test endpoint reached")
-        body = await request.body()
-        body_str = body.decode('utf-8') if body else ""
-        print(f"Body received: {body_str}")
-        
-        # Test direct JSONResponse first
-        print("Creating direct JSONResponse...")
-        direct_response = JSONResponse(
-            status_code=200,
-            content={"success": True, "message": "Direct response test", "data": {"test": "direct"}}
-        )
-        print("Direct JSONResponse created successfully")
-        
-        # Test BaseResponse creation
-        print("Creating BaseResponse...")
-        from app.models import BaseResponse
-        base_resp = BaseResponse(success=True, message="BaseResponse test", data={"test": "base"})
-        print("BaseResponse created successfully")
-        
-        # Test dict() conversion
-        print("Converting BaseResponse to dict...")
-        resp_dict = base_resp.dict()
-        print("BaseResponse converted to dict successfully")
-        
-        # Test final response
-        print("Creating final response...")
-        final_response = base_response(
-            success=True,
-            message="Simple test endpoint reached",
-            data={"received_body": body_str[:100]},
-            status_code=200
-        )
-        print("Final response created successfully")
-        return final_response
-        
-    except Exception as e:
-        print(f"Error in simple test: {e}")
-        import traceback
-        traceback.print_exc()
-        return JSONResponse(
-            status_code=500,
-            content={"error": str(e)}
-        )
+@app.get("/debug/stalls", dependencies=[Depends(require_internal_caller)])
+async def list_stalls():
+    """Recent event loop stalls, with the stack that was blocking the loop"""
+    stats = watchdog_stats()
+    return base_response(
+        success=True,
+        message="Event loop stalls retrieved",
+        data={"enabled": stats is not None, "watchdog": stats},
+        status_code=200
+    )
 
 @app.get("/firebase-status")
 async def firebase_status():
     """Check Firebase initialization status"""
     try:
-        import firebase_admin
-        import os
+        # Never import the SDK here: while the warmup thread is importing it,
+        # that would block the loop on the import lock. Until it is loaded
+        # there are no apps to report.
+        firebase_admin = sys.modules.get("firebase_admin")
+        apps = getattr(firebase_admin, "_apps", None) or {}
         
         status = {
-            "firebase_initialized": bool(firebase_admin._apps),
+            "firebase_initialized": bool(apps),
             "has_credentials": bool(os.environ.get("FIREBASE_CREDENTIALS_BASE64")),
-            "app_count": len(firebase_admin._apps) if firebase_admin._apps else 0
+            "app_count": len(apps),
+            "token_cache": firebase_token_cache.stats(),
+            "single_flight": firebase_verify_flight.stats(),
+            "prefilter": prefilter_stats(),
+            "circuit_breaker": firebase_breaker.stats(),
+            "initialization": firebase_initializer.status()
         }
         
         return base_response(
@@ -283,6 +250,8 @@ async def firebase_status():
             status_code=500
         )
 
+_import_ms = (time.perf_counter() - _import_started) * 1000
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="127.0.0.1", port=8000) 
\ No newline at end of file
@@ -0,0 +1,255 @@
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Fixed log-scale latency buckets (seconds), 100us .. 30s
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0,
+    10.0, 30.0,
+)
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+class _Sharded:
+    """
+    Per-thread counter shards, summed when scraped.
+
+    Each thread only ever writes to its own list, so the hot path takes no
+    lock and no update can be lost to a race between threads.
+    """
+
+    def __init__(self, width: int):
+        self._width = width
+        self._local = threading.local()
+        self._shards: List[list] = []
+        self._lock = threading.Lock()
+
+    def shard(self) -> list:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = [0] * self._width
+            with self._lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+            return shard
+
+    def totals(self) -> list:
+        totals = [0] * self._width
+        with self._lock:
+            shards = list(self._shards)
+        for shard in shards:
+            for i, value in enumerate(shard):
+                totals[i] += value
+        return totals
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: Optional[Dict[str, str]] = None,
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels or {}
+        self.buckets = buckets
+        # One slot per bucket, one for +Inf, and the running sum at the end
+        self._counts = _Sharded(len(buckets) + 2)
+        self._sum_index = len(buckets) + 1
+
+    def observe(self, value: float):
+        shard = self._counts.shard()
+        shard[bisect_left(self.buckets, value)] += 1
+        shard[self._sum_index] += value
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        totals = self._counts.totals()
+        return totals[:self._sum_index], totals[self._sum_index]
+
+    def render(self) -> List[str]:
+        counts, total = self.snapshot()
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            labels = dict(self.labels, le=repr(bound))
+            lines.append(f"{self.name}_bucket{_format_labels(labels)} {cumulative}")
+        cumulative += counts[-1]
+        lines.append(f"{self.name}_bucket{_format_labels(dict(self.labels, le='+Inf'))} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(self.labels)} {total}")
+        lines.append(f"{self.name}_count{_format_labels(self.labels)} {cumulative}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Optional[Dict[str, str]] = None):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels or {}
+        self._counts = _Sharded(1)
+
+    def inc(self, amount: float = 1):
+        self._counts.shard()[0] += amount
+
+    def value(self) -> float:
+        return self._counts.totals()[0]
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labels)} {self.value()}"]
+
+
+class Gauge:
+    """Gauge updated from the event loop thread only."""
+
+    def __init__(self, name: str, help_text: str, labels: Optional[Dict[str, str]] = None):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels or {}
+        self.value = 0
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labels)} {self.value}"]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[Tuple[str, tuple], object] = {}
+        self._collectors: List[Callable[[], List[Tuple[str, str, str, Dict[str, str], float]]]] = []
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help_text, labels, **kwargs):
+        key = (name, tuple(sorted((labels or {}).items())))
+        metric = self._metrics.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(key)
+                if metric is None:
+                    metric = cls(name, help_text, labels, **kwargs)
+                    self._metrics[key] = metric
+        return metric
+
+    def histogram(self, name: str, help_text: str, labels: Optional[Dict[str, str]] = None, **kwargs) -> Histogram:
+        return self._get_or_create(Histogram, name, help_text, labels, **kwargs)
+
+    def counter(self, name: str, help_text: str, labels: Optional[Dict[str, str]] = None) -> Counter:
+        return self._get_or_create(Counter, name, help_text, labels)
+
+    def gauge(self, name: str, help_text: str, labels: Optional[Dict[str, str]] = None) -> Gauge:
+        return self._get_or_create(Gauge, name, help_text, labels)
+
+    def register_collector(self, collector):
+        """
+        Add a callback run at scrape time. It returns
+        ``(name, type, help, labels, value)`` tuples for values owned elsewhere.
+        """
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        families: Dict[str, Tuple[str, str, List[str]]] = {}
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            kind = {Histogram: "histogram", Counter: "counter", Gauge: "gauge"}[type(metric)]
+            family = families.setdefault(metric.name, (kind, metric.help_text, []))
+            family[2].extend(metric.render())
+        for collector in self._collectors:
+            for name, kind, help_text, labels, value in collector():
+                family = families.setdefault(name, (kind, help_text, []))
+                family[2].append(f"{name}{_format_labels(labels)} {value}")
+
+        out = []
+        for name in sorted(families):
+            kind, help_text, lines = families[name]
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(lines)
+        return "\n".join(out) + "\n"
+
+
+registry = Registry()
+
+JWT_ENCODE_SECONDS = registry.histogram(
+    "magnetai_jwt_encode_seconds", "Time spent signing access tokens")
+JWT_DECODE_SECONDS = registry.histogram(
+    "magnetai_jwt_decode_seconds", "Time spent decoding access tokens on cache misses")
+RESPONSE_SERIALIZE_SECONDS = registry.histogram(
+    "magnetai_response_serialize_seconds", "Time spent encoding response envelopes")
+HTTP_IN_FLIGHT = registry.gauge(
+    "magnetai_http_requests_in_flight", "HTTP requests currently being handled")
+
+
+def firebase_verify_histogram(method: str) -> Histogram:
+    return registry.histogram(
+        "magnetai_firebase_verify_seconds",
+        "Time spent verifying Firebase ID tokens",
+        {"method": method},
+    )
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording per-route latency and status counts."""
+
+    def __init__(self, app):
+        self.app = app
+        self._route_histograms = {}
+        self._status_counters = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.value += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start
+            HTTP_IN_FLIGHT.value -= 1
+            # Label by route template rather than raw path to bound cardinality
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            self._observe(scope["method"], route_path, status_code, duration)
+
+    def _observe(self, method, route_path, status_code, duration):
+        key = (method, route_path)
+        histogram = self._route_histograms.get(key)
+        if histogram is None:
+            histogram = registry.histogram(
+                "magnetai_http_request_duration_seconds",
+                "HTTP request latency by route",
+                {"method": method, "route": route_path},
+            )
+            self._route_histograms[key] = histogram
+        histogram.observe(duration)
+
+        status_key = (method, route_path, status_code)
+        counter = self._status_counters.get(status_key)
+        if counter is None:
+            counter = registry.counter(
+                "magnetai_http_requests_total",
+                "HTTP requests by route and status",
+                {"method": method, "route": route_path, "status": str(status_code)},
+            )
+            self._status_counters[status_key] = counter
+        counter.inc()
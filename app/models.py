@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, Any
+from typing import Optional, Any, List
 from datetime import datetime
 
 class BaseResponse(BaseModel):
@@ -10,6 +10,16 @@ class BaseResponse(BaseModel):
 class FirebaseTokenRequest(BaseModel):
     id_token: str
 
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str
+
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
+
+class VerifyBatchRequest(BaseModel):
+    access_tokens: List[str] = []
+    firebase_tokens: List[str] = []
+
 class UserResponse(BaseModel):
     id: str
     email: str
@@ -20,4 +30,6 @@ class UserResponse(BaseModel):
 class LoginResponse(BaseModel):
     access_token: str
     token_type: str
-    user: UserResponse 
\ No newline at end of file
+    user: UserResponse
+    expires_in: Optional[int] = None
+    refresh_token: Optional[str] = None
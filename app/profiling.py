@@ -0,0 +1,258 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+import weakref
+from collections import Counter
+from typing import Dict, List, Optional
+
+from app.config import PROFILE_INTERVAL_MS, PROFILE_KEEP, PROFILE_PATHS, PROFILE_SAMPLE_RATE
+
+WALL = "wall"
+CPU = "cpu"
+
+# Longest first, so a file is shortened against the most specific root
+_PATH_PREFIXES = sorted(
+    {os.path.join(os.path.abspath(p), "") for p in sys.path if p},
+    key=len,
+    reverse=True,
+)
+_labels: Dict[object, str] = {}
+
+# The profile of the request being handled; inherited by tasks it spawns
+_current_profile: contextvars.ContextVar = contextvars.ContextVar("current_profile", default=None)
+
+
+def _frame_label(code) -> str:
+    label = _labels.get(code)
+    if label is None:
+        filename = code.co_filename
+        for prefix in _PATH_PREFIXES:
+            if filename.startswith(prefix):
+                filename = filename[len(prefix):]
+                break
+        label = f"{filename}:{getattr(code, 'co_qualname', code.co_name)}"
+        _labels[code] = label
+    return label
+
+
+def _thread_stack(frame) -> str:
+    """Collapsed stack (root first) of a thread's current frame."""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.reverse()
+    return ";".join(labels)
+
+
+def _awaiting_stack(task: asyncio.Task) -> str:
+    """Collapsed stack of a suspended task, down to what it is waiting on."""
+    labels = []
+    awaitable = task.get_coro()
+    while awaitable is not None:
+        frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None)
+        if frame is None:
+            if isinstance(awaitable, asyncio.Future):
+                labels.append("[future]")
+            break
+        labels.append(_frame_label(frame.f_code))
+        awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None)
+    labels.append("[waiting]")
+    return ";".join(labels)
+
+
+class Profile:
+    """Stack samples for one request."""
+
+    def __init__(self, profile_id: int, method: str, path: str, task: asyncio.Task):
+        self.id = profile_id
+        self.method = method
+        self.path = path
+        self.task = task
+        self.status = 500
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self.duration = 0.0
+        self.stacks = {WALL: Counter(), CPU: Counter()}
+
+    def summary(self, interval: float) -> dict:
+        samples = sum(self.stacks[WALL].values())
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "started": round(self.started, 3),
+            "duration_ms": round(self.duration * 1000, 3),
+            # Estimated from the samples that caught this request on the loop thread
+            "on_loop_ms": round(sum(self.stacks[CPU].values()) * interval * 1000, 3),
+            "samples": samples,
+        }
+
+    def collapsed(self, kind: str) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks[kind].most_common())
+
+
+class Profiler:
+    """
+    Samples the event loop thread's stack every ``interval`` seconds while
+    any selected request is in flight, and keeps the ``keep`` slowest
+    finished profiles.
+
+    A sample is charged to whichever profiled request is running on the
+    loop at that moment (wall and CPU); every other profiled request in
+    flight is suspended, and gets its await chain as a wall sample. Work a
+    request hands to tasks of its own (single-flight, ``wait_for``) is
+    charged to it too: a task factory on the loop tags each task created
+    while a profiled request's context is current.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL_MS / 1000, keep: int = PROFILE_KEEP):
+        self.interval = interval
+        self.keep = keep
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._active: Dict[asyncio.Task, Profile] = {}
+        self._task_profiles = weakref.WeakKeyDictionary()
+        self._slowest: List[tuple] = []
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+
+    def begin(self, method: str, path: str) -> Profile:
+        task = asyncio.current_task()
+        loop = asyncio.get_running_loop()
+        profile = Profile(next(self._ids), method, path, task)
+        if self._loop is not loop:
+            self._install_task_factory(loop)
+        with self._lock:
+            self._loop = loop
+            self._loop_thread_id = threading.get_ident()
+            self._active[task] = profile
+            self._task_profiles[task] = profile
+            self._wake.set()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+        return profile
+
+    def _install_task_factory(self, loop: asyncio.AbstractEventLoop):
+        previous = loop.get_task_factory()
+        task_profiles = self._task_profiles
+        lock = self._lock
+
+        def factory(loop, coro, context=None):
+            if previous is not None:
+                task = previous(loop, coro) if context is None else previous(loop, coro, context=context)
+            else:
+                task = asyncio.Task(coro, loop=loop, context=context)
+            profile = (context.get(_current_profile) if context is not None else _current_profile.get())
+            if profile is not None:
+                with lock:
+                    task_profiles[task] = profile
+            return task
+
+        loop.set_task_factory(factory)
+
+    def end(self, profile: Profile):
+        profile.duration = time.perf_counter() - profile._start
+        profile.task = None
+        with self._lock:
+            self._active.pop(asyncio.current_task(), None)
+            entry = (profile.duration, profile.id, profile)
+            if len(self._slowest) < self.keep:
+                heapq.heappush(self._slowest, entry)
+            else:
+                heapq.heappushpop(self._slowest, entry)
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    self._wake.clear()
+                    continue
+                active = list(self._active.items())
+                loop = self._loop
+                loop_thread_id = self._loop_thread_id
+            self._sample(active, loop, loop_thread_id)
+
+    def _sample(self, active, loop, loop_thread_id):
+        running = asyncio.current_task(loop)
+        with self._lock:
+            running_profile = self._task_profiles.get(running) if running is not None else None
+        frame = sys._current_frames().get(loop_thread_id)
+        for task, profile in active:
+            try:
+                if profile is running_profile and frame is not None:
+                    stack = _thread_stack(frame)
+                    profile.stacks[CPU][stack] += 1
+                else:
+                    stack = _awaiting_stack(task)
+                profile.stacks[WALL][stack] += 1
+            except (RuntimeError, AttributeError):
+                # The task moved on while we were walking it; skip this sample
+                pass
+
+    def profiles(self) -> List[Profile]:
+        """Finished profiles, slowest first."""
+        with self._lock:
+            entries = list(self._slowest)
+        return [entry[2] for entry in sorted(entries, reverse=True)]
+
+    def get(self, profile_id: int) -> Optional[Profile]:
+        for profile in self.profiles():
+            if profile.id == profile_id:
+                return profile
+        return None
+
+
+profiler = Profiler()
+
+
+def profiling_enabled() -> bool:
+    return PROFILE_SAMPLE_RATE > 0 or bool(PROFILE_PATHS)
+
+
+class ProfilingMiddleware:
+    """
+    Pure ASGI middleware that profiles requests whose path starts with one
+    of ``paths``, plus a random ``sample_rate`` fraction of the rest.
+    """
+
+    def __init__(self, app, sample_rate: float = PROFILE_SAMPLE_RATE, paths=PROFILE_PATHS):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.paths = tuple(paths)
+
+    def _selected(self, path: str) -> bool:
+        if self.paths and path.startswith(self.paths):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._selected(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        profile = profiler.begin(scope["method"], scope["path"])
+        context_token = _current_profile.set(profile)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_profile.reset(context_token)
+            profiler.end(profile)
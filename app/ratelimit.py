@@ -0,0 +1,263 @@
+import math
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+
+from fastapi import HTTPException
+
+from app.config import (
+    LOGIN_RATE_PER_IP, LOGIN_BURST_PER_IP,
+    LOGIN_RATE_PER_SUBJECT, LOGIN_BURST_PER_SUBJECT,
+    LOGIN_MAX_CONCURRENT, RATE_LIMIT_MAX_KEYS, RATE_LIMIT_TRUST_FORWARDED,
+    SHARED_CACHES,
+)
+from app.metrics import registry
+from app.shared_store import SharedTable, StripeBusy
+from app.utils import base_response
+
+
+class TokenBucketLimiter:
+    """
+    Per-key token buckets in an LRU-ordered dict.
+
+    Every check is O(1). Memory is capped at ``max_keys`` by evicting the
+    least recently seen key, and buckets that have refilled completely are
+    swept out periodically, since a full bucket is the same as no bucket.
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int = RATE_LIMIT_MAX_KEYS,
+                 clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._clock = clock
+        # key -> [tokens, last_seen]; least recently seen first
+        self._buckets: "OrderedDict[Hashable, list]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._refill_seconds = burst / rate if rate > 0 else math.inf
+        self._next_sweep = 0.0
+        self.allowed = 0
+        self.limited = 0
+
+    def allow(self, key: Hashable) -> Tuple[bool, float]:
+        """Take one token for ``key``; returns ``(allowed, retry_after_seconds)``."""
+        now = self._clock()
+        with self._lock:
+            if now >= self._next_sweep:
+                self._sweep(now)
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = [self.burst, now]
+                self._buckets[key] = bucket
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                self.allowed += 1
+                return True, 0.0
+            self.limited += 1
+            return False, (1 - bucket[0]) / self.rate if self.rate > 0 else math.inf
+
+    def _sweep(self, now: float):
+        # Oldest first: stop at the first bucket that could still be below burst
+        while self._buckets:
+            key, (tokens, last_seen) = next(iter(self._buckets.items()))
+            if now - last_seen < self._refill_seconds:
+                break
+            del self._buckets[key]
+        self._next_sweep = now + min(self._refill_seconds, 60.0)
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+_BUCKET = struct.Struct("<dd")
+
+
+class SharedTokenBucketLimiter:
+    """
+    ``TokenBucketLimiter`` with its buckets in shared memory, so every worker
+    process draws from the same budget. A bucket's slot expires once it
+    would have refilled completely, which stands in for the sweep.
+
+    When a bucket's stripe lock can't be had in time, the key is checked
+    against a per-process ``TokenBucketLimiter`` instead, so the limit
+    still holds per worker.
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int = RATE_LIMIT_MAX_KEYS,
+                 clock=time.time):
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._table = SharedTable(max_keys, _BUCKET.size, clock=clock)
+        self._refill_seconds = burst / rate if rate > 0 else math.inf
+        self._local = TokenBucketLimiter(rate, burst, max_keys)
+        self.allowed = 0
+        self.limited = 0
+        self.fallbacks = 0
+
+    def allow(self, key: Hashable) -> Tuple[bool, float]:
+        now = self._clock()
+        allowed = False
+        tokens = 0.0
+
+        def take(raw: Optional[bytes]):
+            nonlocal allowed, tokens
+            if raw is None:
+                tokens = self.burst
+            else:
+                tokens, last_seen = _BUCKET.unpack(raw)
+                tokens = min(self.burst, tokens + (now - last_seen) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                allowed = True
+            return _BUCKET.pack(tokens, now), now + min(self._refill_seconds, 86400.0)
+
+        try:
+            self._table.update(key, take)
+        except StripeBusy:
+            self.fallbacks += 1
+            allowed, retry_after = self._local.allow(key)
+            if allowed:
+                self.allowed += 1
+            else:
+                self.limited += 1
+            return allowed, retry_after
+        if allowed:
+            self.allowed += 1
+            return True, 0.0
+        self.limited += 1
+        return False, (1 - tokens) / self.rate if self.rate > 0 else math.inf
+
+    def __len__(self):
+        return len(self._table)
+
+
+class AdmissionController:
+    """Caps how many requests of one kind may run at once."""
+
+    def __init__(self, max_concurrent: int):
+        self.max_concurrent = max_concurrent
+        self.active = 0
+        self.shed = 0
+
+    def try_acquire(self) -> bool:
+        # Only touched from the event loop thread
+        if self.active >= self.max_concurrent:
+            self.shed += 1
+            return False
+        self.active += 1
+        return True
+
+    def release(self):
+        self.active -= 1
+
+
+# Under the multi-worker server the buckets live in shared memory, so the
+# limits hold per deployment rather than per worker
+_Limiter = SharedTokenBucketLimiter if SHARED_CACHES else TokenBucketLimiter
+ip_limiter = _Limiter(LOGIN_RATE_PER_IP, LOGIN_BURST_PER_IP)
+subject_limiter = _Limiter(LOGIN_RATE_PER_SUBJECT, LOGIN_BURST_PER_SUBJECT)
+login_admission = AdmissionController(LOGIN_MAX_CONCURRENT)
+
+
+# A zero rate gives an infinite wait; advertise a day instead
+_MAX_RETRY_AFTER_SECONDS = 86400
+
+
+def _retry_after_header(seconds: float) -> dict:
+    # Written so that NaN lands on the cap too
+    if not seconds < _MAX_RETRY_AFTER_SECONDS:
+        seconds = _MAX_RETRY_AFTER_SECONDS
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
+
+
+def client_ip(scope) -> str:
+    if RATE_LIMIT_TRUST_FORWARDED:
+        for name, value in scope.get("headers", ()):
+            if name == b"x-forwarded-for":
+                return value.split(b",", 1)[0].strip().decode("latin-1")
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+class LoginAdmissionMiddleware:
+    """
+    Sheds login requests before any body is read or verification starts.
+
+    Requests to ``paths`` are rate limited per client IP (429) and capped
+    by a global concurrency limit (503); both carry a Retry-After header.
+    Everything else passes straight through.
+    """
+
+    def __init__(self, app, paths=("/auth/firebase", "/auth/firebase-raw")):
+        self.app = app
+        self.paths = frozenset(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        allowed, retry_after = ip_limiter.allow(client_ip(scope))
+        if not allowed:
+            response = base_response(
+                success=False,
+                message="Too many login attempts, please retry later",
+                status_code=429,
+                headers=_retry_after_header(retry_after),
+            )
+            await response(scope, receive, send)
+            return
+
+        if not login_admission.try_acquire():
+            response = base_response(
+                success=False,
+                message="Login service is busy, please retry shortly",
+                status_code=503,
+                headers=_retry_after_header(1),
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            login_admission.release()
+
+
+def check_subject_rate(subject: str):
+    """Raise 429 when one user is logging in faster than the per-subject limit."""
+    allowed, retry_after = subject_limiter.allow(subject)
+    if not allowed:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many login attempts for this account, please retry later",
+            headers=_retry_after_header(retry_after),
+        )
+
+
+def _rate_limit_metrics():
+    return [
+        ("magnetai_login_rate_limited_total", "counter", "Login requests rejected by a rate limiter",
+         {"key": "ip"}, ip_limiter.limited),
+        ("magnetai_login_rate_limited_total", "counter", "Login requests rejected by a rate limiter",
+         {"key": "subject"}, subject_limiter.limited),
+        ("magnetai_login_shed_total", "counter", "Login requests shed by the concurrency limit",
+         {}, login_admission.shed),
+        ("magnetai_login_in_flight", "gauge", "Login requests currently admitted",
+         {}, login_admission.active),
+        ("magnetai_rate_limit_buckets", "gauge", "Live rate-limit buckets",
+         {"key": "ip"}, len(ip_limiter)),
+        ("magnetai_rate_limit_buckets", "gauge", "Live rate-limit buckets",
+         {"key": "subject"}, len(subject_limiter)),
+    ]
+
+
+registry.register_collector(_rate_limit_metrics)
@@ -0,0 +1,361 @@
+import abc
+import hashlib
+import heapq
+import logging
+import secrets
+import struct
+import time
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional, Set, Tuple
+
+from fastapi import HTTPException, status
+
+from app.config import (
+    ON_VERCEL, REFRESH_TOKEN_EXPIRE_DAYS, REFRESH_TOKEN_SHARED_SLOTS, REFRESH_TOKEN_STORE, SHARED_CACHES,
+)
+from app.db import Database
+from app.shared_store import SharedTable, StripeBusy
+from app.utils import json_dumps, json_loads
+
+logger = logging.getLogger(__name__)
+
+REFRESH_TOKEN_TTL_SECONDS = REFRESH_TOKEN_EXPIRE_DAYS * 86400
+
+
+@dataclass(frozen=True)
+class RefreshTokenRecord:
+    user_id: str
+    email: str
+    # Every token rotated from the same login shares a family
+    family_id: str
+    expires_at: float
+    used: bool = False
+    revoked: bool = False
+
+
+def refresh_token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode("utf-8")).digest()
+
+
+class RefreshTokenStore(abc.ABC):
+    """
+    Where refresh tokens live, keyed by the SHA-256 of the opaque token; the
+    token itself is never stored.
+    """
+
+    @abc.abstractmethod
+    async def add(self, digest: bytes, record: RefreshTokenRecord):
+        ...
+
+    @abc.abstractmethod
+    async def consume(self, digest: bytes) -> Optional[RefreshTokenRecord]:
+        """
+        Atomically mark a token used and return it as it was *before* the
+        call, so ``used=True`` in the result means the token was replayed.
+        """
+
+    @abc.abstractmethod
+    async def revoke_family(self, family_id: str) -> int:
+        ...
+
+    @abc.abstractmethod
+    async def revoke_user(self, user_id: str) -> int:
+        ...
+
+
+class InMemoryRefreshTokenStore(RefreshTokenStore):
+    """
+    Process-local store. Only touched from the event loop thread, so it needs
+    no lock; expired tokens are dropped as new ones are added.
+    """
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._records: Dict[bytes, RefreshTokenRecord] = {}
+        self._families: Dict[str, Set[bytes]] = {}
+        # (expires_at, digest), earliest first
+        self._expiry: List[Tuple[float, bytes]] = []
+
+    async def add(self, digest: bytes, record: RefreshTokenRecord):
+        self._purge_expired(self._clock())
+        self._records[digest] = record
+        self._families.setdefault(record.family_id, set()).add(digest)
+        heapq.heappush(self._expiry, (record.expires_at, digest))
+
+    async def consume(self, digest: bytes) -> Optional[RefreshTokenRecord]:
+        record = self._records.get(digest)
+        if record is None:
+            return None
+        if not record.used:
+            self._records[digest] = replace(record, used=True)
+        return record
+
+    async def revoke_family(self, family_id: str) -> int:
+        digests = self._families.get(family_id, ())
+        for digest in digests:
+            self._records[digest] = replace(self._records[digest], revoked=True)
+        return len(digests)
+
+    async def revoke_user(self, user_id: str) -> int:
+        revoked = 0
+        for digest, record in self._records.items():
+            if record.user_id == user_id and not record.revoked:
+                self._records[digest] = replace(record, revoked=True)
+                revoked += 1
+        return revoked
+
+    def _purge_expired(self, now: float):
+        while self._expiry and self._expiry[0][0] <= now:
+            _, digest = heapq.heappop(self._expiry)
+            record = self._records.pop(digest, None)
+            if record is not None:
+                family = self._families.get(record.family_id)
+                if family is not None:
+                    family.discard(digest)
+                    if not family:
+                        del self._families[record.family_id]
+
+    def __len__(self):
+        return len(self._records)
+
+
+class DatabaseRefreshTokenStore(RefreshTokenStore):
+    """
+    ``refresh_tokens`` table store, shared by every process on the database.
+
+    Expired rows are deleted in bulk every ``purge_every`` additions.
+    """
+
+    _COLUMNS = "user_id, email, family_id, expires_at, used, revoked"
+
+    def __init__(self, db: Database, purge_every: int = 1000, clock=time.time):
+        self.db = db
+        self.purge_every = purge_every
+        self._clock = clock
+        self._adds = 0
+        dialect = db.dialect
+        table = dialect.qualify("refresh_tokens")
+        p = dialect.placeholder
+        self._insert_sql = (
+            f"INSERT INTO {table} (token_hash, user_id, email, family_id, expires_at) "
+            f"VALUES ({dialect.params(5)})"
+        )
+        # Only a token that is still unused and unrevoked can be claimed
+        self._claim_sql = (
+            f"UPDATE {table} SET used = TRUE "
+            f"WHERE token_hash = {p} AND NOT used AND NOT revoked "
+            f"RETURNING {self._COLUMNS}"
+        )
+        self._select_sql = f"SELECT {self._COLUMNS} FROM {table} WHERE token_hash = {p}"
+        self._revoke_family_sql = f"UPDATE {table} SET revoked = TRUE WHERE family_id = {p}"
+        self._revoke_user_sql = f"UPDATE {table} SET revoked = TRUE WHERE user_id = {p} AND NOT revoked"
+        self._purge_sql = f"DELETE FROM {table} WHERE expires_at <= {p}"
+
+    @staticmethod
+    def _record(row) -> RefreshTokenRecord:
+        return RefreshTokenRecord(
+            user_id=row[0],
+            email=row[1],
+            family_id=row[2],
+            expires_at=float(row[3]),
+            used=bool(row[4]),
+            revoked=bool(row[5]),
+        )
+
+    async def add(self, digest: bytes, record: RefreshTokenRecord):
+        self._adds += 1
+        purge = self._adds % self.purge_every == 0
+        await self.db.run(self._add, digest, record, purge)
+
+    def _add(self, conn, digest, record, purge):
+        cur = conn.cursor()
+        cur.execute(self._insert_sql, (digest, record.user_id, record.email, record.family_id,
+                                       int(record.expires_at)))
+        if purge:
+            cur.execute(self._purge_sql, (int(self._clock()),))
+
+    async def consume(self, digest: bytes) -> Optional[RefreshTokenRecord]:
+        return await self.db.run(self._consume, digest)
+
+    def _consume(self, conn, digest):
+        cur = conn.cursor()
+        cur.execute(self._claim_sql, (digest,))
+        row = cur.fetchone()
+        if row is not None:
+            # The claim flipped used; report the state it had before
+            return replace(self._record(row), used=False)
+        cur.execute(self._select_sql, (digest,))
+        row = cur.fetchone()
+        return self._record(row) if row else None
+
+    async def revoke_family(self, family_id: str) -> int:
+        return await self.db.run(self._revoke_family, family_id)
+
+    def _revoke_family(self, conn, family_id):
+        cur = conn.cursor()
+        cur.execute(self._revoke_family_sql, (family_id,))
+        return cur.rowcount
+
+    async def revoke_user(self, user_id: str) -> int:
+        return await self.db.run(self._revoke_user, user_id)
+
+    def _revoke_user(self, conn, user_id):
+        cur = conn.cursor()
+        cur.execute(self._revoke_user_sql, (user_id,))
+        return cur.rowcount
+
+
+_REVOKED_BEFORE = struct.Struct("<d")
+# user_id (up to 128), email (up to 254), family id and the JSON around them
+_SHARED_RECORD_BYTES = 640
+
+
+class SharedRefreshTokenStore(RefreshTokenStore):
+    """
+    Store in a ``SharedTable``, for the multi-worker server without a
+    database: create it before forking and every worker sees the same
+    tokens. Each slot expires with its token.
+
+    Revocations are markers in the same table rather than edits to every
+    affected record: one per family, and one per user holding the time of
+    the revoke, which covers every token issued before it. A token whose
+    stripe is stuck reads as unknown.
+    """
+
+    def __init__(self, slots: int = REFRESH_TOKEN_SHARED_SLOTS, clock=time.time):
+        self.table = SharedTable(slots, _SHARED_RECORD_BYTES, clock=clock)
+        self._clock = clock
+
+    async def add(self, digest: bytes, record: RefreshTokenRecord):
+        value = json_dumps({
+            "user_id": record.user_id, "email": record.email, "family_id": record.family_id,
+            "expires_at": record.expires_at, "used": record.used, "issued_at": self._clock(),
+        })
+        if not self.table.set(digest, value, record.expires_at):
+            logger.warning("Could not store a refresh token for user %s in shared memory", record.user_id)
+
+    async def consume(self, digest: bytes) -> Optional[RefreshTokenRecord]:
+        before = None
+
+        def claim(raw: Optional[bytes]):
+            nonlocal before
+            if raw is None:
+                return None
+            before = json_loads(raw)
+            if before["used"]:
+                return None
+            return json_dumps(dict(before, used=True)), before["expires_at"]
+
+        try:
+            self.table.update(digest, claim)
+        except StripeBusy:
+            return None
+        if before is None:
+            return None
+        return RefreshTokenRecord(
+            user_id=before["user_id"],
+            email=before["email"],
+            family_id=before["family_id"],
+            expires_at=before["expires_at"],
+            used=before["used"],
+            revoked=self._revoked(before),
+        )
+
+    def _revoked(self, record: dict) -> bool:
+        if self.table.get(f"family:{record['family_id']}") is not None:
+            return True
+        marker = self.table.get(f"user:{record['user_id']}")
+        return marker is not None and record["issued_at"] < _REVOKED_BEFORE.unpack(marker)[0]
+
+    async def revoke_family(self, family_id: str) -> int:
+        """Mark the family revoked; returns 1, as the tokens in it aren't counted."""
+        return self._mark(f"family:{family_id}", b"1")
+
+    async def revoke_user(self, user_id: str) -> int:
+        """Revoke every token issued to the user so far; returns 1, as they aren't counted."""
+        return self._mark(f"user:{user_id}", _REVOKED_BEFORE.pack(self._clock()))
+
+    def _mark(self, key: str, value: bytes) -> int:
+        if self.table.set(key, value, self._clock() + REFRESH_TOKEN_TTL_SECONDS):
+            return 1
+        logger.warning("Could not record refresh token revocation %s in shared memory", key)
+        return 0
+
+
+# Under the multi-worker server the default store lives in shared memory, so
+# a refresh token works on whichever worker the next request lands on
+_store: RefreshTokenStore = SharedRefreshTokenStore() if SHARED_CACHES else InMemoryRefreshTokenStore()
+
+
+def start_refresh_store(db: Optional[Database]):
+    global _store
+    if db is not None and REFRESH_TOKEN_STORE in ("auto", "database"):
+        _store = DatabaseRefreshTokenStore(db)
+        return
+    if REFRESH_TOKEN_STORE == "database":
+        logger.warning("REFRESH_TOKEN_STORE=database but no database is configured; using memory")
+    if ON_VERCEL:
+        logger.warning("No database configured: refresh tokens only work on the instance that issued "
+                       "them, so /auth/refresh will fail across Vercel instances")
+
+
+def configure_refresh_store(store: RefreshTokenStore):
+    global _store
+    _store = store
+
+
+def get_refresh_store() -> RefreshTokenStore:
+    return _store
+
+
+def _refresh_error(message: str) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=message)
+
+
+async def issue_refresh_token(user_id: str, email: str, family_id: Optional[str] = None) -> str:
+    """Create a refresh token, starting a new family unless one is given."""
+    token = secrets.token_urlsafe(32)
+    record = RefreshTokenRecord(
+        user_id=user_id,
+        email=email,
+        family_id=family_id or secrets.token_hex(16),
+        expires_at=time.time() + REFRESH_TOKEN_TTL_SECONDS,
+    )
+    await _store.add(refresh_token_digest(token), record)
+    return token
+
+
+async def revoke_refresh_token(token: str) -> bool:
+    """Revoke the session ``token`` belongs to; False if it isn't a known token."""
+    record = await _store.consume(refresh_token_digest(token))
+    if record is None:
+        return False
+    await _store.revoke_family(record.family_id)
+    return True
+
+
+async def revoke_user_refresh_tokens(user_id: str) -> int:
+    return await _store.revoke_user(user_id)
+
+
+async def rotate_refresh_token(token: str) -> Tuple[RefreshTokenRecord, str]:
+    """
+    Spend ``token`` and return its record with a replacement token.
+
+    Presenting an already-spent token means it leaked (or the client is
+    confused), so the whole family is revoked and the user has to sign in
+    with Firebase again.
+    """
+    record = await _store.consume(refresh_token_digest(token))
+    if record is None:
+        raise _refresh_error("Invalid refresh token")
+    if record.revoked:
+        raise _refresh_error("Refresh token has been revoked")
+    if record.used:
+        await _store.revoke_family(record.family_id)
+        logger.warning("Refresh token reuse detected for user %s; revoked its session", record.user_id)
+        raise _refresh_error("Refresh token has been revoked")
+    if record.expires_at <= time.time():
+        raise _refresh_error("Refresh token has expired")
+    new_token = await issue_refresh_token(record.user_id, record.email, record.family_id)
+    return record, new_token
@@ -0,0 +1,354 @@
+import asyncio
+import heapq
+import logging
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.config import (
+    ACCESS_TOKEN_EXPIRE_MINUTES, ACCESS_TOKEN_MAX_LIFETIME_HOURS, ON_VERCEL, REVOCATION_SYNC_SECONDS,
+    SHARED_CACHES,
+)
+from app.db import Database
+from app.metrics import registry
+from app.shared_store import SharedLog
+from app.utils import json_dumps, json_loads
+
+logger = logging.getLogger(__name__)
+
+# No access token outlives this, whatever expires_delta it was issued with
+MAX_ACCESS_TOKEN_LIFETIME_SECONDS = max(ACCESS_TOKEN_EXPIRE_MINUTES * 60, ACCESS_TOKEN_MAX_LIFETIME_HOURS * 3600)
+# A user-wide revocation only has to outlive the tokens it covers
+USER_REVOCATION_TTL_SECONDS = MAX_ACCESS_TOKEN_LIFETIME_SECONDS
+# Each sync re-reads this much before the newest revocation it has seen, so a
+# row committed late, or stamped by a process whose clock runs behind, is not missed
+SYNC_OVERLAP_SECONDS = 60
+# Revocations the shared log holds; a worker only misses some if more than
+# this many arrive between two of its syncs
+_SHARED_LOG_CAPACITY = 4096
+_SHARED_LOG_RECORD_BYTES = 256
+
+
+class RevocationList:
+    """
+    Revoked access tokens, checked on every authenticated request.
+
+    Two exact maps: ``jti -> exp`` for single tokens and ``user -> revoked
+    before`` for "sign out everywhere". Both shrink as entries outlive the
+    tokens they cover, so memory tracks the number of live revocations.
+    Lookups take no lock; writers serialize on one.
+    """
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._tokens: Dict[str, float] = {}
+        # user_id -> (revoked_before, forget_at)
+        self._users: Dict[str, Tuple[float, float]] = {}
+        # (forget_at, kind, key), earliest first
+        self._expiry: List[Tuple[float, str, str]] = []
+        self._lock = threading.Lock()
+
+    def is_revoked(self, claims: dict) -> bool:
+        if self._tokens:
+            jti = claims.get("jti")
+            if jti is not None and jti in self._tokens:
+                return True
+        if self._users:
+            entry = self._users.get(claims.get("sub"))
+            # Tokens without an iat predate revocation support; treat them as old
+            if entry is not None and claims.get("iat", 0) < entry[0]:
+                return True
+        return False
+
+    def add_token(self, jti: str, expires_at: float):
+        with self._lock:
+            if jti not in self._tokens:
+                self._tokens[jti] = expires_at
+                heapq.heappush(self._expiry, (expires_at, "token", jti))
+            self._compact(self._clock())
+
+    def add_user(self, user_id: str, revoked_before: float, forget_at: float):
+        with self._lock:
+            current = self._users.get(user_id)
+            if current is not None and current[0] >= revoked_before:
+                return
+            self._users[user_id] = (revoked_before, forget_at)
+            heapq.heappush(self._expiry, (forget_at, "user", user_id))
+            self._compact(self._clock())
+
+    def compact(self):
+        with self._lock:
+            self._compact(self._clock())
+
+    def _compact(self, now: float):
+        while self._expiry and self._expiry[0][0] <= now:
+            forget_at, kind, key = heapq.heappop(self._expiry)
+            if kind == "token":
+                self._tokens.pop(key, None)
+            else:
+                entry = self._users.get(key)
+                # A later revocation of the same user pushed its own entry
+                if entry is not None and entry[1] <= forget_at:
+                    del self._users[key]
+
+    def stats(self) -> dict:
+        return {"tokens": len(self._tokens), "users": len(self._users)}
+
+
+class RevocationStore:
+    """
+    Where revocations are shared between processes. This base keeps nothing,
+    which is right for a single process: the in-memory list is the record.
+    """
+
+    async def add_token(self, jti: str, expires_at: float):
+        pass
+
+    async def add_user(self, user_id: str, revoked_before: float, forget_at: float):
+        pass
+
+    async def load(self) -> Tuple[Iterable[Tuple[str, float]], Iterable[Tuple[str, float, float]]]:
+        """
+        Return the live ``(jti, exp)`` and ``(user, revoked_before, forget_at)``
+        rows added since the previous call (all of them on the first).
+        """
+        return (), ()
+
+
+class DatabaseRevocationStore(RevocationStore):
+    """
+    ``revoked_tokens`` / ``revoked_users`` tables.
+
+    Each row is stamped with ``revoked_at``, and ``load`` only reads rows
+    stamped since the newest one it has already seen (less
+    ``SYNC_OVERLAP_SECONDS``), so a sync costs the number of recent
+    revocations rather than the size of the tables. Expired rows are deleted
+    in bulk every ``purge_every`` additions, by the process that writes them.
+    """
+
+    def __init__(self, db: Database, purge_every: int = 100, clock=time.time):
+        self.db = db
+        self.purge_every = purge_every
+        self._clock = clock
+        self._adds = 0
+        self._seen: Optional[float] = None
+        dialect = db.dialect
+        tokens = dialect.qualify("revoked_tokens")
+        users = dialect.qualify("revoked_users")
+        p = dialect.placeholder
+        self._add_token_sql = (
+            f"INSERT INTO {tokens} (jti, expires_at, revoked_at) VALUES ({dialect.params(3)}) "
+            f"ON CONFLICT (jti) DO NOTHING"
+        )
+        self._add_user_sql = (
+            f"INSERT INTO {users} (user_id, revoked_before, expires_at, revoked_at) "
+            f"VALUES ({dialect.params(4)}) "
+            f"ON CONFLICT (user_id) DO UPDATE SET revoked_before = excluded.revoked_before, "
+            f"expires_at = excluded.expires_at, revoked_at = excluded.revoked_at"
+        )
+        self._purge_sql = [f"DELETE FROM {tokens} WHERE expires_at <= {p}",
+                           f"DELETE FROM {users} WHERE expires_at <= {p}"]
+        self._load_tokens_sql = (
+            f"SELECT jti, expires_at, revoked_at FROM {tokens} WHERE revoked_at > {p} AND expires_at > {p}"
+        )
+        self._load_users_sql = (
+            f"SELECT user_id, revoked_before, expires_at, revoked_at FROM {users} "
+            f"WHERE revoked_at > {p} AND expires_at > {p}"
+        )
+
+    async def add_token(self, jti: str, expires_at: float):
+        await self.db.run(self._add, self._add_token_sql, (jti, int(expires_at) + 1, self._clock()),
+                          self._should_purge())
+
+    async def add_user(self, user_id: str, revoked_before: float, forget_at: float):
+        await self.db.run(self._add, self._add_user_sql,
+                          (user_id, revoked_before, int(forget_at) + 1, self._clock()),
+                          self._should_purge())
+
+    def _should_purge(self) -> bool:
+        self._adds += 1
+        return self._adds % self.purge_every == 0
+
+    def _add(self, conn, sql, params, purge):
+        cur = conn.cursor()
+        cur.execute(sql, params)
+        if purge:
+            now = int(self._clock())
+            for purge_sql in self._purge_sql:
+                cur.execute(purge_sql, (now,))
+
+    async def load(self):
+        since = -1.0 if self._seen is None else self._seen - SYNC_OVERLAP_SECONDS
+        tokens, users, seen = await self.db.run(self._load, since)
+        if seen is not None and (self._seen is None or seen > self._seen):
+            self._seen = seen
+        elif self._seen is None:
+            # Nothing revoked yet: later loads only need what arrives from now on
+            self._seen = self._clock()
+        return tokens, users
+
+    def _load(self, conn, since):
+        cur = conn.cursor()
+        now = int(self._clock())
+        seen = None
+        cur.execute(self._load_tokens_sql, (since, now))
+        tokens = []
+        for jti, expires_at, revoked_at in cur.fetchall():
+            tokens.append((jti, float(expires_at)))
+            seen = revoked_at if seen is None else max(seen, revoked_at)
+        cur.execute(self._load_users_sql, (since, now))
+        users = []
+        for user_id, revoked_before, expires_at, revoked_at in cur.fetchall():
+            users.append((user_id, float(revoked_before), float(expires_at)))
+            seen = revoked_at if seen is None else max(seen, revoked_at)
+        return tokens, users, (float(seen) if seen is not None else None)
+
+
+class SharedRevocationStore(RevocationStore):
+    """
+    Revocations passed between the multi-worker server's processes through a
+    ``SharedLog``, for when there is no database. Each worker reads what was
+    appended since its last sync.
+    """
+
+    def __init__(self, log: SharedLog):
+        self.log = log
+        self._position = 0
+
+    async def add_token(self, jti: str, expires_at: float):
+        self._append(["token", jti, expires_at])
+
+    async def add_user(self, user_id: str, revoked_before: float, forget_at: float):
+        self._append(["user", user_id, revoked_before, forget_at])
+
+    def _append(self, entry: list):
+        if not self.log.append(json_dumps(entry)):
+            logger.warning("Could not share revocation of %s %s with the other workers", entry[0], entry[1])
+
+    async def load(self):
+        self._position, records, lost = self.log.read_since(self._position)
+        if lost:
+            logger.warning("Missed %d revocations made by other workers; the shared log wrapped", lost)
+        tokens, users = [], []
+        for record in records:
+            entry = json_loads(record)
+            if entry[0] == "token":
+                tokens.append((entry[1], entry[2]))
+            else:
+                users.append((entry[1], entry[2], entry[3]))
+        return tokens, users
+
+
+class RevocationSync:
+    """Pulls revocations made by other processes into the local list every ``interval`` seconds."""
+
+    def __init__(self, revocations: RevocationList, store: RevocationStore,
+                 interval: float = REVOCATION_SYNC_SECONDS):
+        self.revocations = revocations
+        self.store = store
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self.syncs = 0
+
+    async def sync(self):
+        tokens, users = await self.store.load()
+        for jti, expires_at in tokens:
+            self.revocations.add_token(jti, expires_at)
+        for user_id, revoked_before, forget_at in users:
+            self.revocations.add_user(user_id, revoked_before, forget_at)
+        self.revocations.compact()
+        self.syncs += 1
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.warning("Failed to sync token revocations: %s", e)
+            await asyncio.sleep(self.interval)
+
+
+revocation_list = RevocationList()
+_store = RevocationStore()
+_sync: Optional[RevocationSync] = None
+# Created before the multi-worker server forks, for when there is no database
+_shared_log = SharedLog(_SHARED_LOG_CAPACITY, _SHARED_LOG_RECORD_BYTES) if SHARED_CACHES else None
+
+
+def start_revocation(db: Optional[Database]):
+    """
+    Share revocations through the database when there is one, else through
+    shared memory under the multi-worker server. Otherwise they only hold
+    in this process.
+    """
+    global _store, _sync
+    if _sync is not None:
+        return
+    if db is not None:
+        _store = DatabaseRevocationStore(db)
+    elif _shared_log is not None:
+        _store = SharedRevocationStore(_shared_log)
+    else:
+        if ON_VERCEL:
+            logger.warning("No database configured: logouts only take effect on the Vercel instance "
+                           "that served them")
+        return
+    _sync = RevocationSync(revocation_list, _store)
+    _sync.start()
+
+
+async def shutdown_revocation():
+    global _store, _sync
+    if _sync is not None:
+        await _sync.stop()
+    _store = RevocationStore()
+    _sync = None
+
+
+def is_revoked(claims: dict) -> bool:
+    return revocation_list.is_revoked(claims)
+
+
+async def revoke_token(jti: str, expires_at: float):
+    """Revoke one access token until its own expiry."""
+    revocation_list.add_token(jti, expires_at)
+    await _store.add_token(jti, expires_at)
+
+
+async def revoke_user(user_id: str, revoked_before: Optional[float] = None):
+    """Revoke every access token issued to ``user_id`` before ``revoked_before`` (default: now)."""
+    if revoked_before is None:
+        revoked_before = time.time()
+    forget_at = revoked_before + USER_REVOCATION_TTL_SECONDS
+    revocation_list.add_user(user_id, revoked_before, forget_at)
+    await _store.add_user(user_id, revoked_before, forget_at)
+
+
+def revocation_stats() -> dict:
+    return revocation_list.stats()
+
+
+def _revocation_metrics():
+    stats = revocation_list.stats()
+    return [
+        ("magnetai_revoked_entries", "gauge", "Live access-token revocations",
+         {"kind": "token"}, stats["tokens"]),
+        ("magnetai_revoked_entries", "gauge", "Live access-token revocations",
+         {"kind": "user"}, stats["users"]),
+    ]
+
+
+registry.register_collector(_revocation_metrics)
@@ -1,177 +1,216 @@
-from fastapi import APIRouter, status, Depends, Request
-from app.models import FirebaseTokenRequest, LoginResponse, UserResponse
-from app.auth import create_access_token, verify_token, verify_google_token
+import logging
+from fastapi import APIRouter, HTTPException, status, Depends, Request
+from fastapi.responses import StreamingResponse
+from app.models import (
+    FirebaseTokenRequest, LoginResponse, LogoutRequest, RefreshTokenRequest, UserResponse, VerifyBatchRequest,
+)
+from app.auth import (
+    FirebaseIdentity, Principal, access_token_cache, create_access_token, invalidate_firebase_user,
+    require_internal_caller, verify_token, verify_google_token,
+)
+from app.batch_verify import verify_batch
+from app.body import read_json_fields
+from app.token_prefilter import decode_header
 from datetime import timedelta
-from app.config import JWT_EXPIRATION_HOURS
+from typing import Optional
+from app.config import ACCESS_TOKEN_EXPIRE_MINUTES, VERIFY_BATCH_MAX_TOKENS
 from app.utils import base_response
+from app.user_repository import get_profile, record_login
+from app.ratelimit import check_subject_rate
+from app.refresh_tokens import (
+    issue_refresh_token, revoke_refresh_token, revoke_user_refresh_tokens, rotate_refresh_token,
+)
+from app.revocation import revoke_token, revoke_user
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+async def _login_response(identity: FirebaseIdentity):
+    # Keyed by the verified uid, so a forged token can't burn someone else's budget
+    check_subject_rate(identity.uid)
+    
+    user_data = {
+        "id": identity.uid,
+        "email": identity.email,
+        "name": identity.name,
+        "picture": identity.picture,
+        "verified_email": identity.email_verified
+    }
+    
+    profile = await record_login(
+        identity.uid, identity.email, identity.name, identity.picture, identity.email_verified
+    )
+    if profile is not None:
+        user_data["name"] = profile.name
+        user_data["picture"] = profile.picture
+    
+    return await _token_response(user_data, "Login was successful")
+
+async def _token_response(user_data: dict, message: str, refresh_token: Optional[str] = None):
+    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = create_access_token(
+        data={"sub": user_data["id"], "email": user_data["email"]},
+        expires_delta=access_token_expires
+    )
+    if refresh_token is None:
+        refresh_token = await issue_refresh_token(user_data["id"], user_data["email"])
+    
+    login_response = LoginResponse(
+        access_token=access_token,
+        token_type="bearer",
+        user=UserResponse(**user_data),
+        expires_in=int(access_token_expires.total_seconds()),
+        refresh_token=refresh_token
+    )
+    
+    return base_response(
+        success=True,
+        message=message,
+        data=login_response.dict(),
+        status_code=status.HTTP_200_OK
+    )
+
 @router.post("/auth/firebase")
 async def firebase_auth(token_request: FirebaseTokenRequest):
     """
     Authenticate a user using a Firebase ID token (from any provider: Google, Email, etc.).
     Expects a Firebase ID token from the frontend (obtained via Firebase Auth).
     """
-    print(f"Received token request: {token_request}")
-    print(f"Starting Firebase verification...")
-    
     try:
-        idinfo_response = await verify_google_token(token_request.id_token)
-        print(f"Firebase verification completed with status: {idinfo_response.status_code}")
-        
-        if not idinfo_response.status_code == 200:
-            print(f"Firebase verification failed: {idinfo_response.body}")
-            return idinfo_response
+        identity = await verify_google_token(token_request.id_token)
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error during Firebase verification: {e}")
+        logger.exception("Error during Firebase verification")
         return base_response(
             success=False,
             message=f"Error during Firebase verification: {str(e)}",
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
+    return await _login_response(identity)
 
 @router.post("/auth/firebase-raw")
 async def firebase_auth_raw(request: Request):
     """
     Raw version of Firebase auth that manually handles request body
     """
-    print("firebase_auth_raw endpoint reached")
-    
     try:
-        # Manually read and parse the request body
-        body = await request.body()
-        print(f"Request body read, length: {len(body)}")
-        
-        body_str = body.decode('utf-8')
-        print(f"Request body decoded: {body_str[:100]}...")
-        
-        import json
-        data = json.loads(body_str)
-        print(f"JSON parsed: {data}")
-        
-        id_token = data.get("id_token")
-        if not id_token:
+        # Bounded read, parsed straight from the bytes
+        id_token, = await read_json_fields(request, "id_token")
+        if not id_token or not isinstance(id_token, str):
             return base_response(
                 success=False,
                 message="Missing id_token in request body",
                 status_code=status.HTTP_400_BAD_REQUEST
             )
         
-        print(f"Starting Firebase verification for token: {id_token[:50]}...")
-        idinfo_response = await verify_google_token(id_token)
-        
-        if not idinfo_response.status_code == 200:
-            return idinfo_response
-            
-        # Continue with the rest of the logic...
-        response_data = idinfo_response.body
-        if isinstance(response_data, bytes):
-            response_data = response_data.decode('utf-8')
-        if isinstance(response_data, str):
-            response_data = json.loads(response_data)
-        
-        idinfo = response_data.get("data", {})
-        
-        user_data = {
-            "id": idinfo.get("uid", ""),
-            "email": idinfo.get("email", ""),
-            "name": idinfo.get("name", ""),
-            "picture": idinfo.get("picture", ""),
-            "verified_email": idinfo.get("email_verified", False)
-        }
-        
-        from datetime import timedelta
-        from app.config import JWT_EXPIRATION_HOURS
-        from app.auth import create_access_token
-        
-        access_token_expires = timedelta(hours=JWT_EXPIRATION_HOURS)
-        access_token = create_access_token(
-            data={"sub": user_data["id"], "email": user_data["email"]},
-            expires_delta=access_token_expires
-        )
-        
-        login_response = LoginResponse(
-            access_token=access_token,
-            token_type="bearer",
-            user=UserResponse(**user_data)
-        )
-        
-        return base_response(
-            success=True,
-            message="Login was successful",
-            data=login_response.dict(),
-            status_code=status.HTTP_200_OK
-        )
+        identity = await verify_google_token(id_token)
+        return await _login_response(identity)
         
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error in firebase_auth_raw: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error in firebase_auth_raw")
         return base_response(
             success=False,
             message=f"Error processing request: {str(e)}",
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
-    
-    # Get the response data from the JSONResponse
-    response_data = idinfo_response.body
-    if isinstance(response_data, bytes):
-        response_data = response_data.decode('utf-8')
-    if isinstance(response_data, str):
-        import json
-        response_data = json.loads(response_data)
-    
-    # Extract the actual data from the BaseResponse structure
-    idinfo = response_data.get("data", {})
-    
+
+@router.post("/auth/refresh")
+async def refresh_access_token(refresh_request: RefreshTokenRequest):
+    """
+    Trade a refresh token for a new access token and a new refresh token.
+    Each refresh token works once; no Firebase verification is involved.
+    """
+    record, refresh_token = await rotate_refresh_token(refresh_request.refresh_token)
     user_data = {
-        "id": idinfo.get("uid", ""),
-        "email": idinfo.get("email", ""),
-        "name": idinfo.get("name", ""),
-        "picture": idinfo.get("picture", ""),
-        "verified_email": idinfo.get("email_verified", False)
+        "id": record.user_id,
+        "email": record.email,
+        "name": "",
+        "picture": "",
+        "verified_email": True
     }
-    access_token_expires = timedelta(hours=JWT_EXPIRATION_HOURS)
-    access_token = create_access_token(
-        data={"sub": user_data["id"], "email": user_data["email"]},
-        expires_delta=access_token_expires
-    )
-    login_response = LoginResponse(
-        access_token=access_token,
-        token_type="bearer",
-        user=UserResponse(**user_data)
+    profile = await get_profile(record.user_id)
+    if profile is not None:
+        user_data["email"] = profile.email
+        user_data["name"] = profile.name
+        user_data["picture"] = profile.picture
+        user_data["verified_email"] = profile.email_verified
+    return await _token_response(user_data, "Token refreshed", refresh_token)
+
+@router.post("/auth/logout")
+async def logout(logout_request: Optional[LogoutRequest] = None,
+                 principal: Principal = Depends(verify_token)):
+    """
+    Revoke the presented access token and, when given, the refresh token
+    of the same session. Other sessions of the user stay signed in.
+    """
+    jti = principal.claims.get("jti")
+    if jti is not None:
+        await revoke_token(jti, principal.claims.get("exp", 0))
+    if logout_request is not None and logout_request.refresh_token:
+        await revoke_refresh_token(logout_request.refresh_token)
+    return base_response(
+        success=True,
+        message="Logged out",
+        status_code=status.HTTP_200_OK
     )
+
+@router.post("/auth/logout-all")
+async def logout_all(principal: Principal = Depends(verify_token)):
+    """
+    Sign the user out everywhere: every access token issued so far, every
+    refresh token, and any cached Firebase verification for them.
+    """
+    await revoke_user(principal.user_id)
+    await revoke_user_refresh_tokens(principal.user_id)
+    await invalidate_firebase_user(principal.user_id)
+    access_token_cache.invalidate_owner(principal.user_id)
     return base_response(
         success=True,
-        message="Login was successful",
-        data=login_response.dict(),
+        message="Logged out of all sessions",
         status_code=status.HTTP_200_OK
     )
 
-@router.get("/auth/me")
-async def get_current_user(token_response = Depends(verify_token)):
-    if not token_response.status_code == 200:
-        return token_response
-    
-    # Get the response data from the JSONResponse
-    response_data = token_response.body
-    if isinstance(response_data, bytes):
-        response_data = response_data.decode('utf-8')
-    if isinstance(response_data, str):
-        import json
-        response_data = json.loads(response_data)
-    
-    # Extract the actual data from the BaseResponse structure
-    token_data = response_data.get("data", {})
-    
-    user_response = UserResponse(
-        id=token_data.get("sub", ""),
-        email=token_data.get("email", ""),
-        name="", # You'd get this from your database
-        picture="", # You'd get this from your database
-        verified_email=True
+@router.post("/auth/verify-batch", dependencies=[Depends(require_internal_caller)])
+async def verify_tokens_batch(batch_request: VerifyBatchRequest):
+    """
+    Verify many access tokens and/or Firebase ID tokens in one call, for
+    other backend services. Results stream back as NDJSON, one line per
+    token: {"index", "type", "valid", ...}.
+    """
+    count = len(batch_request.access_tokens) + len(batch_request.firebase_tokens)
+    if count > VERIFY_BATCH_MAX_TOKENS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {VERIFY_BATCH_MAX_TOKENS} tokens per batch"
+        )
+    return StreamingResponse(
+        verify_batch(batch_request.access_tokens, batch_request.firebase_tokens),
+        media_type="application/x-ndjson"
     )
+
+@router.get("/auth/me")
+async def get_current_user(principal: Principal = Depends(verify_token)):
+    profile = await get_profile(principal.user_id)
+    if profile is not None:
+        user_response = UserResponse(
+            id=principal.user_id,
+            email=profile.email,
+            name=profile.name,
+            picture=profile.picture,
+            verified_email=profile.email_verified
+        )
+    else:
+        user_response = UserResponse(
+            id=principal.user_id,
+            email=principal.email,
+            name="",
+            picture="",
+            verified_email=True
+        )
     return base_response(
         success=True,
         message="User profile retrieved successfully",
@@ -184,7 +223,6 @@ async def test_auth_endpoint():
     """
     Test endpoint that doesn't require Firebase - just to verify the API is working
     """
-    print("test endpoint reached")
     return base_response(
         success=True,
         message="Auth endpoint is working (no Firebase required)",
@@ -197,7 +235,6 @@ async def test_token_format(token_request: FirebaseTokenRequest):
     """
     Test endpoint to validate token format without Firebase verification
     """
-    print(f"test-token endpoint reached with token: {token_request.id_token[:50]}...")
     token = token_request.id_token
     
     # Basic validation
@@ -221,15 +258,7 @@ async def test_token_format(token_request: FirebaseTokenRequest):
     
     # Try to decode the header (first part) to see if it's valid
     try:
-        import base64
-        import json
-        
-        # Decode the header
-        header_part = token_parts[0]
-        # Add padding if needed
-        header_part += '=' * (4 - len(header_part) % 4)
-        header_json = base64.urlsafe_b64decode(header_part)
-        header = json.loads(header_json)
+        header = decode_header(token_parts[0])
         
         return base_response(
             success=True,
@@ -0,0 +1,165 @@
+"""
+Multi-worker production server.
+
+The app is imported and Firebase / the JWT keys are initialized once in the
+parent; workers are then forked from it and share those pages copy-on-write,
+along with the listening socket and the shared-memory caches.
+
+    python -m app.server [--workers N] [--host 0.0.0.0] [--port 8000]
+"""
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+# Decided at import time by the cache and rate-limit modules, so set it first
+os.environ.setdefault("SHARED_CACHES", "true")
+
+logger = logging.getLogger("app.server")
+
+# A worker dying this soon after it was forked counts as a crash loop
+_MIN_WORKER_LIFETIME_SECONDS = 1.0
+
+
+def default_workers() -> int:
+    if "WEB_CONCURRENCY" in os.environ:
+        return int(os.environ["WEB_CONCURRENCY"])
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def preload():
+    """Everything that should happen once, before the fork."""
+    from app.main import app
+    from app.firebase_init import firebase_initializer
+    from app.firebase_verifier import get_local_verifier
+    from app.keyring import get_keyring
+
+    firebase_initializer.initialize_blocking()
+    get_keyring()
+    verifier = get_local_verifier()
+    if verifier is not None:
+        try:
+            verifier.key_set.refresh()
+        except Exception as e:
+            # Each worker's key refresher retries on its own
+            logger.warning("Could not prefetch Firebase signing keys: %s", e)
+    return app
+
+
+def bind_socket(host: str, port: int, backlog: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock: socket.socket, args):
+    import uvicorn
+    from app.access_log import setup_logging
+
+    # The parent's log writer thread didn't survive the fork
+    setup_logging()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, signal.SIG_DFL)
+    config = uvicorn.Config(
+        app,
+        # Logging is already configured, and AccessLogMiddleware covers access logs
+        log_config=None,
+        access_log=False,
+        timeout_keep_alive=args.keep_alive,
+        lifespan="on",
+    )
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+class Supervisor:
+    """Forks the workers, replaces any that die, and stops them all on SIGTERM/SIGINT."""
+
+    def __init__(self, app, sock: socket.socket, args):
+        self.app = app
+        self.sock = sock
+        self.args = args
+        self.workers = {}
+        self.stopping = False
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(self.app, self.sock, self.args)
+            except BaseException:
+                logger.exception("Worker %d crashed", os.getpid())
+                code = 1
+            finally:
+                logging.shutdown()
+                os._exit(code)
+        self.workers[pid] = time.monotonic()
+
+    def stop(self, signum, frame):
+        self.stopping = True
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        from app.access_log import setup_logging, shutdown_logging
+
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        # Stop the log writer thread so no worker inherits it mid-write,
+        # and move the preloaded objects out of the GC's reach so collections
+        # don't dirty the copy-on-write pages
+        shutdown_logging()
+        gc.freeze()
+        for _ in range(self.args.workers):
+            self.spawn()
+        setup_logging()
+        logger.info("Serving on %s:%d with %d workers", self.args.host, self.args.port, self.args.workers)
+
+        while self.workers:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            started = self.workers.pop(pid, None)
+            if started is None or self.stopping:
+                continue
+            logger.warning("Worker %d exited (status %d); starting a replacement", pid, status)
+            if time.monotonic() - started < _MIN_WORKER_LIFETIME_SECONDS:
+                time.sleep(_MIN_WORKER_LIFETIME_SECONDS)
+            shutdown_logging()
+            self.spawn()
+            setup_logging()
+        logger.info("All workers stopped")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=default_workers())
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--keep-alive", type=int, default=5, help="keep-alive timeout in seconds")
+    args = parser.parse_args(argv)
+
+    app = preload()
+    sock = bind_socket(args.host, args.port, args.backlog)
+    Supervisor(app, sock, args).run()
+    sock.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,365 @@
+import hashlib
+import logging
+import mmap
+import multiprocessing
+import struct
+import time
+from typing import Callable, List, Optional, Tuple
+
+from app.config import SHARED_LOCK_TIMEOUT_MS
+from app.utils import json_dumps, json_loads
+
+logger = logging.getLogger(__name__)
+
+# key digest, owner digest, expires_at (0 = empty), value length
+_SLOT_HEADER = struct.Struct("<32s16sdI")
+_HEADER_SIZE = 64
+_EMPTY_OWNER = bytes(16)
+# After a stripe lock times out, it is only tried without waiting for this long
+_STUCK_RETRY_SECONDS = 5.0
+
+
+class StripeBusy(Exception):
+    """A stripe lock could not be taken within the table's ``lock_timeout``."""
+
+
+def _key(key) -> bytes:
+    if isinstance(key, bytes) and len(key) == 32:
+        return key
+    if not isinstance(key, bytes):
+        key = str(key).encode("utf-8")
+    return hashlib.sha256(key).digest()
+
+
+def _owner(owner) -> bytes:
+    if owner is None:
+        return _EMPTY_OWNER
+    return hashlib.blake2b(str(owner).encode("utf-8"), digest_size=16).digest()
+
+
+class SharedTable:
+    """
+    Fixed-size hash table in an anonymous shared mmap.
+
+    Create it before forking: every child then maps the same pages. Slots are
+    grouped into ``ways``-slot sets (a key can only live in its own set) and
+    each set is guarded by one of ``stripes`` process-shared locks, so
+    workers only contend when they touch the same stripe. When a set is full
+    the entry expiring soonest is evicted; values larger than ``value_size``
+    are not stored. Nothing here allocates on the Python heap per entry.
+
+    Locks are taken on the event loop, so no caller waits more than
+    ``lock_timeout`` seconds for one: a worker that died holding a stripe
+    would otherwise hang every process that touches it. A stripe that timed
+    out is only tried without waiting for the next few seconds. Reads
+    through a busy stripe miss, writes and deletes are dropped, and
+    ``update`` raises ``StripeBusy`` for the caller to fall back on.
+    """
+
+    def __init__(self, slots: int, value_size: int, ways: int = 4, stripes: int = 64,
+                 clock=time.time, lock_timeout: float = SHARED_LOCK_TIMEOUT_MS / 1000):
+        self.sets = max(1, slots // ways)
+        self.ways = ways
+        self.value_size = value_size
+        self.slot_size = _HEADER_SIZE + value_size
+        self._clock = clock
+        self._map = mmap.mmap(-1, self.sets * ways * self.slot_size)
+        self._locks = [multiprocessing.Lock() for _ in range(stripes)]
+        self.lock_timeout = lock_timeout
+        # Per process: monotonic time until which each stripe is only tried without waiting
+        self._stuck_until = [0.0] * stripes
+        # Per-process counters
+        self.evictions = 0
+        self.oversize = 0
+        self.lock_timeouts = 0
+
+    @property
+    def capacity(self) -> int:
+        return self.sets * self.ways
+
+    def _locate(self, key: bytes):
+        set_index = int.from_bytes(key[:8], "little") % self.sets
+        return set_index * self.ways * self.slot_size, set_index % len(self._locks)
+
+    def _acquire(self, stripe: int) -> bool:
+        lock = self._locks[stripe]
+        stuck_until = self._stuck_until[stripe]
+        if stuck_until and time.monotonic() < stuck_until:
+            acquired = lock.acquire(False)
+        else:
+            acquired = lock.acquire(timeout=self.lock_timeout)
+        if acquired:
+            if stuck_until:
+                self._stuck_until[stripe] = 0.0
+            return True
+        self.lock_timeouts += 1
+        if not stuck_until:
+            logger.warning("Shared table stripe %d stayed locked for over %.0f ms; bypassing it",
+                           stripe, self.lock_timeout * 1000)
+        self._stuck_until[stripe] = time.monotonic() + _STUCK_RETRY_SECONDS
+        return False
+
+    def _find(self, base: int, key: bytes, now: float) -> Tuple[Optional[int], Optional[int]]:
+        """Return ``(offset of key's live slot, offset of the best slot to write into)``."""
+        victim = None
+        victim_expires = None
+        for way in range(self.ways):
+            offset = base + way * self.slot_size
+            slot_key, _, expires_at, _ = _SLOT_HEADER.unpack_from(self._map, offset)
+            if expires_at == 0 or expires_at <= now:
+                if victim_expires != 0:
+                    victim, victim_expires = offset, 0
+                continue
+            if slot_key == key:
+                return offset, offset
+            if victim_expires is None or (victim_expires != 0 and expires_at < victim_expires):
+                victim, victim_expires = offset, expires_at
+        return None, victim
+
+    def _read(self, offset: int) -> bytes:
+        length = _SLOT_HEADER.unpack_from(self._map, offset)[3]
+        start = offset + _HEADER_SIZE
+        return self._map[start:start + length]
+
+    def _write(self, offset: int, key: bytes, value: bytes, expires_at: float, owner: bytes):
+        previous = _SLOT_HEADER.unpack_from(self._map, offset)
+        if previous[2] > self._clock() and previous[0] != key:
+            self.evictions += 1
+        _SLOT_HEADER.pack_into(self._map, offset, key, owner, expires_at, len(value))
+        start = offset + _HEADER_SIZE
+        self._map[start:start + len(value)] = value
+
+    def get(self, key) -> Optional[bytes]:
+        key = _key(key)
+        base, stripe = self._locate(key)
+        if not self._acquire(stripe):
+            return None
+        try:
+            offset, _ = self._find(base, key, self._clock())
+            return None if offset is None else self._read(offset)
+        finally:
+            self._locks[stripe].release()
+
+    def set(self, key, value: bytes, expires_at: float, owner=None) -> bool:
+        if len(value) > self.value_size:
+            self.oversize += 1
+            return False
+        key = _key(key)
+        base, stripe = self._locate(key)
+        if not self._acquire(stripe):
+            return False
+        try:
+            _, offset = self._find(base, key, self._clock())
+            self._write(offset, key, value, expires_at, _owner(owner))
+        finally:
+            self._locks[stripe].release()
+        return True
+
+    def update(self, key, func: Callable[[Optional[bytes]], Optional[Tuple[bytes, float]]]):
+        """
+        Read-modify-write one entry under its lock. ``func`` gets the current
+        value (or None) and returns ``(new_value, expires_at)``, or None to
+        leave the table as it is; its result is also returned. Raises
+        ``StripeBusy`` if the lock can't be taken.
+        """
+        key = _key(key)
+        base, stripe = self._locate(key)
+        if not self._acquire(stripe):
+            raise StripeBusy(stripe)
+        try:
+            offset, victim = self._find(base, key, self._clock())
+            result = func(None if offset is None else self._read(offset))
+            if result is not None:
+                self._write(victim, key, result[0], result[1], _EMPTY_OWNER)
+        finally:
+            self._locks[stripe].release()
+        return result
+
+    def delete(self, key) -> bool:
+        key = _key(key)
+        base, stripe = self._locate(key)
+        if not self._acquire(stripe):
+            return False
+        try:
+            offset, _ = self._find(base, key, self._clock())
+            if offset is None:
+                return False
+            _SLOT_HEADER.pack_into(self._map, offset, bytes(32), _EMPTY_OWNER, 0.0, 0)
+            return True
+        finally:
+            self._locks[stripe].release()
+
+    def delete_owner(self, owner) -> int:
+        """
+        Drop every entry tagged with ``owner``. This scans the whole table
+        (milliseconds for a large one), so call it off the event loop.
+        """
+        owner = _owner(owner)
+        removed = 0
+        for set_index in range(self.sets):
+            base = set_index * self.ways * self.slot_size
+            stripe = set_index % len(self._locks)
+            if not self._acquire(stripe):
+                continue
+            try:
+                for way in range(self.ways):
+                    offset = base + way * self.slot_size
+                    _, slot_owner, expires_at, _ = _SLOT_HEADER.unpack_from(self._map, offset)
+                    if expires_at != 0 and slot_owner == owner:
+                        _SLOT_HEADER.pack_into(self._map, offset, bytes(32), _EMPTY_OWNER, 0.0, 0)
+                        removed += 1
+            finally:
+                self._locks[stripe].release()
+        return removed
+
+    def clear(self):
+        set_bytes = self.ways * self.slot_size
+        empty = bytes(set_bytes)
+        for set_index in range(self.sets):
+            stripe = set_index % len(self._locks)
+            if not self._acquire(stripe):
+                continue
+            try:
+                base = set_index * set_bytes
+                self._map[base:base + set_bytes] = empty
+            finally:
+                self._locks[stripe].release()
+
+    def __len__(self):
+        # Unlocked scan; an approximate count is fine for stats
+        now = self._clock()
+        live = 0
+        for index in range(self.capacity):
+            expires_at = _SLOT_HEADER.unpack_from(self._map, index * self.slot_size)[2]
+            if expires_at > now:
+                live += 1
+        return live
+
+
+_LOG_COUNT = struct.Struct("<Q")
+_LOG_LENGTH = struct.Struct("<I")
+
+
+class SharedLog:
+    """
+    Append-only ring of ``capacity`` records of up to ``record_size`` bytes
+    in an anonymous shared mmap; create it before forking.
+
+    Every process appends, and each reader keeps its own position and
+    pulls what was appended since. A reader that falls more than
+    ``capacity`` records behind loses the oldest ones, and is told how
+    many. The one lock is taken with the same bounded wait as
+    ``SharedTable``'s: an append that can't get it is dropped, and a read
+    returns nothing new.
+    """
+
+    def __init__(self, capacity: int, record_size: int,
+                 lock_timeout: float = SHARED_LOCK_TIMEOUT_MS / 1000):
+        self.capacity = capacity
+        self.record_size = record_size
+        self.slot_size = _LOG_LENGTH.size + record_size
+        self.lock_timeout = lock_timeout
+        self._map = mmap.mmap(-1, _LOG_COUNT.size + capacity * self.slot_size)
+        self._lock = multiprocessing.Lock()
+        # Per-process counters
+        self.dropped = 0
+        self.lock_timeouts = 0
+
+    def _acquire(self) -> bool:
+        if self._lock.acquire(timeout=self.lock_timeout):
+            return True
+        self.lock_timeouts += 1
+        logger.warning("Shared log stayed locked for over %.0f ms", self.lock_timeout * 1000)
+        return False
+
+    def append(self, record: bytes) -> bool:
+        if len(record) > self.record_size:
+            self.dropped += 1
+            return False
+        if not self._acquire():
+            self.dropped += 1
+            return False
+        try:
+            count = _LOG_COUNT.unpack_from(self._map, 0)[0]
+            offset = _LOG_COUNT.size + (count % self.capacity) * self.slot_size
+            _LOG_LENGTH.pack_into(self._map, offset, len(record))
+            start = offset + _LOG_LENGTH.size
+            self._map[start:start + len(record)] = record
+            _LOG_COUNT.pack_into(self._map, 0, count + 1)
+        finally:
+            self._lock.release()
+        return True
+
+    def read_since(self, position: int) -> Tuple[int, List[bytes], int]:
+        """Return ``(new position, records appended since position, records lost)``."""
+        if not self._acquire():
+            return position, [], 0
+        try:
+            count = _LOG_COUNT.unpack_from(self._map, 0)[0]
+            start = max(position, count - self.capacity)
+            records = []
+            for index in range(start, count):
+                offset = _LOG_COUNT.size + (index % self.capacity) * self.slot_size
+                length = _LOG_LENGTH.unpack_from(self._map, offset)[0]
+                begin = offset + _LOG_LENGTH.size
+                records.append(self._map[begin:begin + length])
+        finally:
+            self._lock.release()
+        return count, records, start - position
+
+
+class SharedTTLCache:
+    """
+    ``app.cache.TTLCache`` look-alike backed by a ``SharedTable``, so every
+    worker process sees the same entries. Values go through ``encode`` /
+    ``decode``; by default they are JSON.
+    """
+
+    def __init__(self, slots: int, value_size: int, encode: Callable = json_dumps,
+                 decode: Callable = json_loads, clock=time.time):
+        self.table = SharedTable(slots, value_size, clock=clock)
+        self._encode = encode
+        self._decode = decode
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        raw = self.table.get(key)
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self._decode(raw)
+
+    def set(self, key, value, expires_at: float, owner=None):
+        self.table.set(key, self._encode(value), expires_at, owner)
+
+    def invalidate(self, key) -> bool:
+        removed = self.table.delete(key)
+        if removed:
+            self.invalidations += 1
+        return removed
+
+    def invalidate_owner(self, owner) -> int:
+        removed = self.table.delete_owner(owner)
+        self.invalidations += removed
+        return removed
+
+    def clear(self):
+        self.table.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.table),
+            "max_entries": self.table.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.table.evictions,
+            "expirations": 0,
+            "invalidations": self.invalidations,
+            "lock_timeouts": self.table.lock_timeouts,
+            "shared": True,
+        }
@@ -0,0 +1,86 @@
+"""
+Per-module import timing for cold-start investigations.
+
+Enable with ``python main.py --profile-startup`` or ``MAGNETAI_PROFILE_STARTUP=1``.
+The report uses the same layout as ``python -X importtime``: self and
+cumulative microseconds, with nesting shown by indentation.
+"""
+import os
+import sys
+import time
+
+_records = []
+_stack = []
+_finder = None
+
+
+class _TimingLoader:
+    def __init__(self, loader):
+        self._loader = loader
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        # [name, start, time spent in nested imports]
+        frame = [module.__name__, time.perf_counter(), 0.0]
+        _stack.append(frame)
+        try:
+            self._loader.exec_module(module)
+        finally:
+            _stack.pop()
+            cumulative = time.perf_counter() - frame[1]
+            if _stack:
+                _stack[-1][2] += cumulative
+            _records.append((module.__name__, cumulative - frame[2], cumulative, len(_stack)))
+
+    def __getattr__(self, attr):
+        return getattr(self._loader, attr)
+
+
+class _TimingFinder:
+    """Meta path finder that wraps whatever loader the real finders return."""
+
+    def find_spec(self, name, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimingLoader(spec.loader)
+                return spec
+        return None
+
+
+def enable():
+    global _finder
+    if _finder is None:
+        _finder = _TimingFinder()
+        sys.meta_path.insert(0, _finder)
+
+
+def disable():
+    global _finder
+    if _finder is not None:
+        sys.meta_path.remove(_finder)
+        _finder = None
+
+
+def is_requested(argv=None) -> bool:
+    argv = sys.argv if argv is None else argv
+    return "--profile-startup" in argv or os.environ.get("MAGNETAI_PROFILE_STARTUP", "") not in ("", "0")
+
+
+def report(stream=None, top: int = 20):
+    """Write the import timeline followed by the most expensive modules."""
+    stream = stream or sys.stderr
+    stream.write("import time: self [us] | cumulative | imported package\n")
+    for name, self_time, cumulative, depth in _records:
+        stream.write(f"import time: {self_time * 1e6:9.0f} | {cumulative * 1e6:10.0f} | {'  ' * depth}{name}\n")
+
+    total = sum(cumulative for _, _, cumulative, depth in _records if depth == 0)
+    stream.write(f"\nstartup imports: {len(_records)} modules, {total * 1000:.1f} ms total\n")
+    stream.write(f"top {top} by self time:\n")
+    for name, self_time, cumulative, _ in sorted(_records, key=lambda r: r[1], reverse=True)[:top]:
+        stream.write(f"  {self_time * 1000:8.2f} ms self  {cumulative * 1000:8.2f} ms cumulative  {name}\n")
@@ -0,0 +1,133 @@
+import base64
+import binascii
+import time
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException, status
+
+from app.config import FIREBASE_PROJECT_ID
+from app.firebase_verifier import get_local_verifier
+from app.metrics import registry
+from app.utils import json_loads
+
+# Deliberately looser than the verifiers, which allow no leeway (PyJWT and the
+# Admin SDK both default to 0): the prefilter only turns away tokens they would
+# certainly reject, and leaves the borderline ones to them
+CLOCK_SKEW_SECONDS = 60
+
+# Real traffic has one header per signing key; the cap only bounds junk
+_HEADER_CACHE_SIZE = 256
+
+_REASONS = (
+    "passed", "malformed", "algorithm", "missing_kid", "unknown_kid",
+    "expired", "issued_in_future", "audience", "issuer", "subject",
+)
+_counters = {
+    reason: registry.counter(
+        "magnetai_firebase_prefilter_total",
+        "Firebase ID tokens seen by the pre-filter, by outcome",
+        {"result": reason},
+    )
+    for reason in _REASONS
+}
+
+
+class TokenRejected(HTTPException):
+    """A token the pre-filter turned away; ``reason`` is the counter label."""
+
+    def __init__(self, status_code: int, message: str, reason: str):
+        super().__init__(status_code=status_code, detail=message)
+        self.reason = reason
+
+
+def decode_segment(segment: str):
+    """base64url-decode one JWT segment (padding optional) and parse its JSON."""
+    raw = base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+    return json_loads(raw)
+
+
+_header_cache: Dict[str, dict] = {}
+
+
+def decode_header(segment: str) -> dict:
+    """
+    Decode a JWT header segment, served from a small cache after the first
+    time. Raises ValueError unless it is an object whose ``alg`` and ``kid``
+    (where present) are strings, so nothing malformed is ever cached.
+    """
+    header = _header_cache.get(segment)
+    if header is None:
+        header = decode_segment(segment)
+        if not isinstance(header, dict):
+            raise ValueError("JWT header is not a JSON object")
+        for name in ("alg", "kid"):
+            if not isinstance(header.get(name, ""), str):
+                raise ValueError(f"JWT header '{name}' is not a string")
+        if len(_header_cache) >= _HEADER_CACHE_SIZE:
+            _header_cache.clear()
+        _header_cache[segment] = header
+    return header
+
+
+def _reject(status_code: int, message: str, reason: str) -> TokenRejected:
+    _counters[reason].inc()
+    return TokenRejected(status_code, message, reason)
+
+
+def prefilter_firebase_token(token: str, now: Optional[float] = None) -> Tuple[dict, dict]:
+    """
+    Reject Firebase ID tokens that can't possibly verify, before any
+    signature check or thread hop. Returns ``(header, claims)`` for tokens
+    worth verifying; the claims are unverified and only for routing.
+
+    ``aud``/``iss`` are checked only when the project id is known, and an
+    unknown ``kid`` only while the cached key set is fresh (otherwise Google
+    may have rotated keys we haven't fetched yet).
+    """
+    parts = token.split(".")
+    if len(parts) != 3:
+        raise _reject(status.HTTP_400_BAD_REQUEST, "Invalid token format - not a valid JWT", "malformed")
+    try:
+        header = decode_header(parts[0])
+        claims = decode_segment(parts[1])
+    except (ValueError, binascii.Error):
+        raise _reject(status.HTTP_400_BAD_REQUEST, "Invalid token format - undecodable header or payload", "malformed")
+    if not isinstance(claims, dict):
+        raise _reject(status.HTTP_400_BAD_REQUEST, "Invalid token format - payload is not an object", "malformed")
+
+    if header.get("alg") != "RS256":
+        raise _reject(status.HTTP_401_UNAUTHORIZED, "Firebase ID token has incorrect algorithm", "algorithm")
+    kid = header.get("kid")
+    if not kid or not isinstance(kid, str):
+        raise _reject(status.HTTP_401_UNAUTHORIZED, "Firebase ID token has no 'kid' claim", "missing_kid")
+
+    verifier = get_local_verifier()
+    if verifier is not None and verifier.key_set.is_fresh() and verifier.key_set.get(kid) is None:
+        raise _reject(status.HTTP_401_UNAUTHORIZED, "Firebase ID token was signed by an unknown key", "unknown_kid")
+
+    if now is None:
+        now = time.time()
+    exp = claims.get("exp")
+    if not isinstance(exp, (int, float)) or exp <= now - CLOCK_SKEW_SECONDS:
+        raise _reject(status.HTTP_401_UNAUTHORIZED, "Firebase ID token has expired", "expired")
+    iat = claims.get("iat")
+    if not isinstance(iat, (int, float)) or iat > now + CLOCK_SKEW_SECONDS:
+        raise _reject(status.HTTP_401_UNAUTHORIZED, "Firebase ID token is issued in the future", "issued_in_future")
+
+    project_id = verifier.project_id if verifier is not None else FIREBASE_PROJECT_ID
+    if project_id:
+        if claims.get("aud") != project_id:
+            raise _reject(status.HTTP_401_UNAUTHORIZED, "Firebase ID token has incorrect audience", "audience")
+        if claims.get("iss") != "https://securetoken.google.com/" + project_id:
+            raise _reject(status.HTTP_401_UNAUTHORIZED, "Firebase ID token has incorrect issuer", "issuer")
+
+    sub = claims.get("sub")
+    if not isinstance(sub, str) or not sub or len(sub) > 128:
+        raise _reject(status.HTTP_401_UNAUTHORIZED, "Firebase ID token has an invalid 'sub' claim", "subject")
+
+    _counters["passed"].inc()
+    return header, claims
+
+
+def prefilter_stats() -> dict:
+    return {reason: int(counter.value()) for reason, counter in _counters.items()}
@@ -0,0 +1,276 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from app.cache import TTLCache
+from app.config import (
+    LAST_LOGIN_FLUSH_SECONDS, LAST_LOGIN_BATCH_SIZE,
+    PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL_SECONDS, PROFILE_NEGATIVE_TTL_SECONDS,
+)
+from app.db import Database
+from app.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+_PROFILE_COLUMNS = "id, google_id, email, name, picture, email_verified"
+
+
+@dataclass(frozen=True)
+class UserProfile:
+    id: str
+    google_id: str
+    email: str
+    name: str
+    picture: str
+    email_verified: bool
+
+    @classmethod
+    def from_row(cls, row) -> "UserProfile":
+        return cls(
+            id=str(row[0]),
+            google_id=row[1],
+            email=row[2],
+            name=row[3],
+            picture=row[4] or "",
+            email_verified=bool(row[5]),
+        )
+
+
+class UserRepository:
+    """Reads and writes ``public.users`` rows keyed by Firebase uid (``google_id``)."""
+
+    def __init__(self, db: Database):
+        self.db = db
+        dialect = db.dialect
+        self._select_sql = (
+            f"SELECT {_PROFILE_COLUMNS} FROM {dialect.table} WHERE google_id = {dialect.placeholder}"
+        )
+        self._upsert_sql = (
+            f"INSERT INTO {dialect.table} (google_id, email, name, picture, email_verified) "
+            f"VALUES ({dialect.params(5)}) "
+            f"ON CONFLICT (google_id) DO UPDATE SET "
+            f"email = excluded.email, name = excluded.name, "
+            f"picture = excluded.picture, email_verified = excluded.email_verified "
+            f"RETURNING {_PROFILE_COLUMNS}"
+        )
+
+    async def get(self, google_id: str) -> Optional[UserProfile]:
+        return await self.db.run(self._get, google_id)
+
+    def _get(self, conn, google_id):
+        cur = conn.cursor()
+        cur.execute(self._select_sql, (google_id,))
+        row = cur.fetchone()
+        return UserProfile.from_row(row) if row else None
+
+    async def upsert(self, google_id: str, email: str, name: str, picture: str,
+                     email_verified: bool) -> UserProfile:
+        """Insert or update the profile fields; last_login is handled by the batcher."""
+        return await self.db.run(self._upsert, (google_id, email, name or email, picture, email_verified))
+
+    def _upsert(self, conn, params):
+        cur = conn.cursor()
+        cur.execute(self._upsert_sql, params)
+        return UserProfile.from_row(cur.fetchone())
+
+    def update_last_logins(self, conn, rows):
+        """Apply ``(google_id, last_login)`` pairs in one ``UPDATE ... FROM (VALUES ...)``."""
+        dialect = self.db.dialect
+        if dialect.name == "postgres":
+            values = ", ".join([f"({dialect.placeholder}, {dialect.placeholder}::timestamptz)"] * len(rows))
+            sql = (
+                f"UPDATE {dialect.table} AS u SET last_login = v.last_login "
+                f"FROM (VALUES {values}) AS v(google_id, last_login) "
+                f"WHERE u.google_id = v.google_id AND u.last_login < v.last_login"
+            )
+        else:
+            values = ", ".join([f"({dialect.params(2)})"] * len(rows))
+            sql = (
+                f"UPDATE {dialect.table} SET last_login = v.column2 "
+                f"FROM (VALUES {values}) AS v "
+                f"WHERE {dialect.table}.google_id = v.column1 AND {dialect.table}.last_login < v.column2"
+            )
+        params = []
+        for google_id, last_login in rows:
+            params.append(google_id)
+            params.append(last_login if dialect.name == "postgres" else last_login.strftime("%Y-%m-%d %H:%M:%S"))
+        conn.cursor().execute(sql, params)
+
+
+class LastLoginBatcher:
+    """
+    Coalesces last_login writes into periodic batched UPDATEs.
+
+    Repeated logins by the same user between flushes collapse into one row;
+    a flush happens every ``interval`` seconds or as soon as ``batch_size``
+    distinct users are pending.
+    """
+
+    def __init__(self, repository: UserRepository, interval: float = LAST_LOGIN_FLUSH_SECONDS,
+                 batch_size: int = LAST_LOGIN_BATCH_SIZE):
+        self.repository = repository
+        self.interval = interval
+        self.batch_size = batch_size
+        self._pending: Dict[str, datetime] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.rows_written = 0
+
+    def record(self, google_id: str, when: Optional[datetime] = None):
+        self._pending[google_id] = when or datetime.now(timezone.utc)
+        if len(self._pending) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning("Failed to flush last_login updates: %s", e)
+
+    async def flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        rows = list(pending.items())
+        try:
+            await self.repository.db.run(self._write, rows)
+        except Exception:
+            # Put rows back unless a newer login arrived in the meantime
+            for google_id, when in rows:
+                self._pending.setdefault(google_id, when)
+            raise
+        self.flushes += 1
+        self.rows_written += len(rows)
+
+    def _write(self, conn, rows):
+        for i in range(0, len(rows), self.batch_size):
+            self.repository.update_last_logins(conn, rows[i:i + self.batch_size])
+
+    def stats(self) -> dict:
+        return {"pending": len(self._pending), "flushes": self.flushes, "rows_written": self.rows_written}
+
+
+_repository: Optional[UserRepository] = None
+_batcher: Optional[LastLoginBatcher] = None
+
+# Read-through profile cache for /auth/me. Unknown ids are cached too (for a
+# shorter time) so lookups for missing users don't hit the database each time.
+profile_cache = TTLCache(max_entries=PROFILE_CACHE_SIZE)
+_profile_loads = SingleFlight()
+_MISSING = object()
+
+
+def start_user_store(db: Optional[Database]):
+    global _repository, _batcher
+    if db is None or _repository is not None:
+        return
+    _repository = UserRepository(db)
+    _batcher = LastLoginBatcher(_repository)
+    _batcher.start()
+
+
+async def shutdown_user_store():
+    global _repository, _batcher
+    if _batcher is not None:
+        try:
+            await _batcher.stop()
+        except Exception as e:
+            logger.warning("Failed to flush last_login updates on shutdown: %s", e)
+    _repository = None
+    _batcher = None
+
+
+def get_user_repository() -> Optional[UserRepository]:
+    return _repository
+
+
+async def record_login(google_id: str, email: str, name: str, picture: str,
+                       email_verified: bool) -> Optional[UserProfile]:
+    """
+    Persist the profile from a verified login and queue its last_login write.
+
+    Database trouble never fails the login; the caller falls back to the
+    token's own claims.
+    """
+    if _repository is None:
+        return None
+    cached = profile_cache.get(google_id)
+    if (
+        isinstance(cached, UserProfile)
+        and cached.email == email
+        and cached.name == (name or email)
+        and cached.picture == (picture or "")
+        and cached.email_verified == email_verified
+    ):
+        # Nothing changed since the last login; only last_login needs writing
+        _batcher.record(google_id)
+        return cached
+    try:
+        profile = await _repository.upsert(google_id, email, name, picture, email_verified)
+    except Exception as e:
+        profile_cache.invalidate(google_id)
+        logger.warning("Failed to store user %s: %s", google_id, e)
+        return None
+    # Write-through so the next /auth/me sees the new profile without a read
+    profile_cache.set(google_id, profile, time.time() + PROFILE_CACHE_TTL_SECONDS)
+    _batcher.record(google_id)
+    return profile
+
+
+async def get_profile(google_id: str) -> Optional[UserProfile]:
+    if _repository is None:
+        return None
+    cached = profile_cache.get(google_id)
+    if cached is not None:
+        return None if cached is _MISSING else cached
+    # Concurrent misses for the same user share one database read
+    return await _profile_loads.do(google_id, lambda: _load_profile(google_id))
+
+
+async def _load_profile(google_id: str) -> Optional[UserProfile]:
+    try:
+        profile = await _repository.get(google_id)
+    except Exception as e:
+        # Don't cache failures; the next request retries the database
+        logger.warning("Failed to load user %s: %s", google_id, e)
+        return None
+    if profile is None:
+        profile_cache.set(google_id, _MISSING, time.time() + PROFILE_NEGATIVE_TTL_SECONDS)
+    else:
+        profile_cache.set(google_id, profile, time.time() + PROFILE_CACHE_TTL_SECONDS)
+    return profile
+
+
+def invalidate_profile(google_id: str) -> bool:
+    return profile_cache.invalidate(google_id)
+
+
+def profile_cache_stats() -> dict:
+    stats = profile_cache.stats()
+    stats.update(_profile_loads.stats())
+    return stats
@@ -1,7 +1,88 @@
-from app.models import BaseResponse
-from fastapi.responses import JSONResponse
+import json
+import time
+from datetime import date, datetime
 
+from fastapi.responses import Response
+from pydantic import BaseModel
 
-def base_response(success: bool, message: str, data=None, status_code: int = 200):
-    response = BaseResponse(success=success, message=message, data=data)
-    return JSONResponse(status_code=status_code, content=response.dict()) 
\ No newline at end of file
+from app.config import JSON_BACKEND
+from app.metrics import RESPONSE_SERIALIZE_SECONDS
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _json_default(obj):
+    if isinstance(obj, BaseModel):
+        return obj.dict()
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, (bytes, bytearray)):
+        return obj.decode("utf-8", errors="replace")
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+# The backend is picked once at import time: orjson when it's installed,
+# otherwise a reusable stdlib encoder with the same settings JSONResponse uses.
+if orjson is not None and JSON_BACKEND in ("auto", "orjson"):
+    JSON_BACKEND_NAME = "orjson"
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def json_dumps(obj) -> bytes:
+        return orjson.dumps(obj, default=_json_default, option=_ORJSON_OPTIONS)
+
+    json_loads = orjson.loads
+else:
+    JSON_BACKEND_NAME = "json"
+    _encoder = json.JSONEncoder(
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+        default=_json_default,
+    )
+
+    def json_dumps(obj) -> bytes:
+        return _encoder.encode(obj).encode("utf-8")
+
+    json_loads = json.loads
+
+
+_SUCCESS_PREFIX = b'{"success":true,"message":'
+_FAILURE_PREFIX = b'{"success":false,"message":'
+_DATA_SEPARATOR = b',"data":'
+_NULL_DATA_SUFFIX = b',"data":null}'
+
+
+def encode_envelope(success: bool, message: str, data=None) -> bytes:
+    """Serialize the BaseResponse envelope without building the model first."""
+    prefix = _SUCCESS_PREFIX if success else _FAILURE_PREFIX
+    if data is None:
+        return prefix + json_dumps(message) + _NULL_DATA_SUFFIX
+    return prefix + json_dumps(message) + _DATA_SEPARATOR + json_dumps(data) + b"}"
+
+
+class EnvelopeResponse(Response):
+    """JSON response whose body is already-encoded envelope bytes."""
+    media_type = "application/json"
+
+
+def base_response(success: bool, message: str, data=None, status_code: int = 200, headers=None):
+    start = time.perf_counter()
+    body = encode_envelope(success, message, data)
+    RESPONSE_SERIALIZE_SECONDS.observe(time.perf_counter() - start)
+    return EnvelopeResponse(content=body, status_code=status_code, headers=headers)
+
+
+def static_response(success: bool, message: str, data=None, status_code: int = 200):
+    """
+    Encode a constant response once; the returned callable builds a fresh
+    Response around the same bytes on every call.
+    """
+    body = encode_envelope(success, message, data)
+
+    def build():
+        return EnvelopeResponse(content=body, status_code=status_code)
+
+    return build
@@ -0,0 +1,246 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from contextlib import contextmanager
+from typing import List, Optional
+
+from app.config import LOOP_STALL_THRESHOLD_MS, LOOP_WATCHDOG_ENABLED, LOOP_WATCHDOG_INTERVAL_MS
+from app.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Recent stalls kept for /debug/stalls
+_STALLS_KEPT = 20
+
+LOOP_LAG_SECONDS = registry.histogram(
+    "magnetai_event_loop_lag_seconds", "How late the event loop ran the watchdog's timer")
+LOOP_STALLS = registry.counter(
+    "magnetai_event_loop_stalls_total", "Event loop lags over the stall threshold")
+
+
+class Stall:
+    """One stall: where the loop thread was stuck, and (once it recovered) for how long."""
+
+    def __init__(self, started: float, task: Optional[str], stack: Optional[List[str]]):
+        self.started = started
+        self.task = task
+        self.stack = stack
+        self.duration: Optional[float] = None
+
+    def as_dict(self) -> dict:
+        return {
+            "started": round(self.started, 3),
+            "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+            "task": self.task,
+            "stack": self.stack,
+        }
+
+
+class LoopStallError(AssertionError):
+    """The event loop stalled for longer than a ``stall_budget`` allowed."""
+
+    def __init__(self, lag: float, budget: float, stall: Optional[Stall]):
+        message = f"Event loop stalled for {lag * 1000:.1f} ms (budget {budget * 1000:.1f} ms)"
+        if stall is not None and stall.stack:
+            message += f" in {stall.task}:\n" + "".join(stall.stack)
+        super().__init__(message)
+        self.lag = lag
+        self.budget = budget
+        self.stall = stall
+
+
+class _Budget:
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.worst = 0.0
+        self.worst_stall: Optional[Stall] = None
+
+    def observe(self, lag: float, stall: Optional[Stall]):
+        if lag > self.worst:
+            self.worst = lag
+            self.worst_stall = stall
+
+
+def _describe_task(task: Optional[asyncio.Task]) -> Optional[str]:
+    if task is None:
+        return None
+    coro = task.get_coro()
+    return f"{task.get_name()} ({getattr(coro, '__qualname__', coro)})"
+
+
+class LoopWatchdog:
+    """
+    Measures event loop lag and catches the loop thread in the act when it
+    stalls.
+
+    A ticker task sleeps ``interval`` seconds at a time; how late each wakeup
+    comes is the loop's lag, recorded in the lag histogram. A watcher thread
+    polls the ticker's heartbeat, and once the loop is ``threshold`` seconds
+    overdue it takes the loop thread's stack and the running task right
+    then, while the blocking call is still on the stack. The stall is logged
+    with that stack when the loop recovers and its length is known.
+    """
+
+    def __init__(self, interval: float = LOOP_WATCHDOG_INTERVAL_MS / 1000,
+                 threshold: float = LOOP_STALL_THRESHOLD_MS / 1000):
+        self.interval = interval
+        self.threshold = threshold
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.stalls = deque(maxlen=_STALLS_KEPT)
+        self._loop_thread_id: Optional[int] = None
+        self._beat = 0.0
+        self._pending: Optional[Stall] = None
+        self._budgets: List[_Budget] = []
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Start watching the running loop; call from a coroutine."""
+        self.loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.perf_counter()
+        self._task = self.loop.create_task(self._tick(), name="loop-watchdog")
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def halt(self):
+        """Stop without waiting for the ticker to finish; callable from any loop or thread."""
+        self._stop.set()
+        if self._task is not None and not self._task.done() and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._task.cancel)
+
+    async def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def current_lag(self) -> float:
+        """How overdue the ticker is right now (0 while the loop keeps up)."""
+        return max(0.0, time.perf_counter() - self._beat - self.interval)
+
+    async def _tick(self):
+        interval = self.interval
+        while True:
+            before = time.perf_counter()
+            await asyncio.sleep(interval)
+            now = time.perf_counter()
+            self._observe(max(0.0, now - before - interval))
+            self._beat = now
+
+    def _observe(self, lag: float):
+        LOOP_LAG_SECONDS.observe(lag)
+        stall = None
+        if lag >= self.threshold:
+            LOOP_STALLS.inc()
+            # The watcher thread normally caught it mid-stall; a stall that
+            # ended between two of its polls goes on record without a stack
+            stall = self._pending or Stall(time.time() - lag, None, None)
+            self._pending = None
+            stall.duration = lag
+            self.stalls.append(stall)
+            if stall.stack:
+                logger.warning("Event loop stalled for %.1f ms in %s:\n%s",
+                               lag * 1000, stall.task, "".join(stall.stack))
+            else:
+                logger.warning("Event loop stalled for %.1f ms", lag * 1000)
+        for budget in self._budgets:
+            budget.observe(lag, stall)
+
+    def _watch(self):
+        captured_beat = None
+        while not self._stop.wait(self.threshold / 4):
+            if self.loop.is_closed():
+                return
+            if not self.loop.is_running():
+                continue
+            beat = self._beat
+            if beat == captured_beat:
+                continue
+            overdue = time.perf_counter() - beat - self.interval
+            if overdue < self.threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            task = asyncio.current_task(self.loop)
+            stack = traceback.format_stack(frame) if frame is not None else None
+            # The loop may have caught up while we were looking
+            if self._beat != beat:
+                continue
+            captured_beat = beat
+            self._pending = Stall(time.time() - overdue, _describe_task(task), stack)
+
+    def stats(self) -> dict:
+        return {
+            "interval_ms": self.interval * 1000,
+            "threshold_ms": self.threshold * 1000,
+            "current_lag_ms": round(self.current_lag() * 1000, 3),
+            "stalls": [stall.as_dict() for stall in self.stalls],
+        }
+
+
+_watchdog: Optional[LoopWatchdog] = None
+
+
+def _replace_watchdog() -> LoopWatchdog:
+    global _watchdog
+    # Startup can run more than once per process (TestClient lifespans,
+    # reloads); the old watcher thread must not be left behind
+    if _watchdog is not None:
+        _watchdog.halt()
+    _watchdog = LoopWatchdog()
+    _watchdog.start()
+    return _watchdog
+
+
+def start_watchdog() -> Optional[LoopWatchdog]:
+    """Start the loop watchdog from app startup (when LOOP_WATCHDOG_ENABLED)."""
+    if not LOOP_WATCHDOG_ENABLED:
+        return None
+    return _replace_watchdog()
+
+
+async def shutdown_watchdog():
+    global _watchdog
+    if _watchdog is not None:
+        await _watchdog.stop()
+        _watchdog = None
+
+
+def watchdog_stats() -> Optional[dict]:
+    return _watchdog.stats() if _watchdog is not None else None
+
+
+@contextmanager
+def stall_budget(seconds: float):
+    """
+    Fail with ``LoopStallError`` when the event loop stalls for more than
+    ``seconds`` inside the block. For tests and benchmarks::
+
+        with stall_budget(0.05):
+            await exercise_the_app()
+
+    Must be entered on the running loop; a watchdog is started for it if
+    the app hasn't already.
+    """
+    loop = asyncio.get_running_loop()
+    watchdog = _watchdog
+    if watchdog is None or watchdog.loop is not loop:
+        watchdog = _replace_watchdog()
+    budget = _Budget(seconds)
+    watchdog._budgets.append(budget)
+    try:
+        yield budget
+    finally:
+        watchdog._budgets.remove(budget)
+    # A stall right before the exit that the ticker hasn't woken up to report yet
+    budget.observe(watchdog.current_lag(), watchdog._pending)
+    if budget.worst > seconds:
+        raise LoopStallError(budget.worst, seconds, budget.worst_stall)
@@ -0,0 +1,233 @@
+"""
+Auth hot-path benchmarks: microbenchmarks for the token and response helpers
+plus an in-process load run against the login, profile and protected routes.
+Firebase is replaced by a locally generated RSA key set and the database by
+in-memory SQLite, so the suite runs offline.
+
+    python -m benchmarks.bench_auth                    # run and compare to baseline.json
+    python -m benchmarks.bench_auth --save-baseline    # record a new baseline
+    python -m benchmarks.bench_auth --check            # exit 1 on a regression
+    python -m benchmarks.bench_auth --stall-budget-ms 50  # exit 1 if the loop blocks longer
+
+Only compare numbers taken on the same machine.
+"""
+import os
+
+# Settings are read at import time, so pin them before the app loads. The
+# login limits are lifted: the load run measures the path, not the limiter.
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+os.environ.setdefault("ACCESS_LOG_LEVEL", "WARNING")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("LOGIN_RATE_PER_IP", "1000000")
+os.environ.setdefault("LOGIN_BURST_PER_IP", "1000000")
+os.environ.setdefault("LOGIN_RATE_PER_SUBJECT", "1000000")
+os.environ.setdefault("LOGIN_BURST_PER_SUBJECT", "1000000")
+os.environ.setdefault("LOGIN_MAX_CONCURRENT", "100000")
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import sys
+import timeit
+from contextlib import nullcontext
+from datetime import timedelta
+from typing import Optional
+
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+
+from app.auth import access_token_cache, create_access_token, firebase_token_cache, verify_token
+from app.refresh_tokens import issue_refresh_token
+from app.watchdog import LoopStallError, stall_budget
+from app.utils import JSON_BACKEND_NAME, base_response, json_dumps
+from benchmarks.loadgen import call_app, run_load
+from benchmarks.stub_firebase import StubFirebase
+from main import app
+from app.main import general_exception_handler, http_exception_handler
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+MICRO_NUMBER = 20000
+LOAD_REQUESTS = 2000
+CONCURRENCY_LEVELS = (1, 32)
+USERS = 200
+# Allowed slowdown before a result counts as a regression
+TOLERANCE = 0.25
+
+
+def _run_sync(coro):
+    # The exception handlers never actually suspend; step them without a loop
+    try:
+        coro.send(None)
+    except StopIteration as stop:
+        return stop.value
+    raise RuntimeError("handler suspended")
+
+
+def micro(number: int = MICRO_NUMBER) -> dict:
+    token = create_access_token({"sub": "bench-user", "email": "bench@example.com"}, timedelta(hours=1))
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    http_error = HTTPException(status_code=401, detail="Invalid authentication credentials")
+    server_error = RuntimeError("boom")
+
+    def verify_uncached():
+        access_token_cache.clear()
+        verify_token(credentials)
+
+    cases = [
+        ("create_access_token", lambda: create_access_token(
+            {"sub": "bench-user", "email": "bench@example.com"}, timedelta(hours=1))),
+        ("verify_token cached", lambda: verify_token(credentials)),
+        ("verify_token uncached", verify_uncached),
+        ("base_response", lambda: base_response(True, "Login was successful", {"access_token": token})),
+        ("http_exception_handler", lambda: _run_sync(http_exception_handler(None, http_error))),
+        ("general_exception_handler", lambda: _run_sync(general_exception_handler(None, server_error))),
+    ]
+    results = {}
+    # The unhandled-exception case would otherwise log a traceback per call
+    app_logger = logging.getLogger("app.main")
+    app_logger.disabled = True
+    try:
+        for name, func in cases:
+            seconds = min(timeit.repeat(func, number=number, repeat=3))
+            results[name] = {"us_per_call": round(seconds / number * 1e6, 3)}
+    finally:
+        app_logger.disabled = False
+    return results
+
+
+async def load(total: int = LOAD_REQUESTS, levels=CONCURRENCY_LEVELS,
+               stall_budget_seconds: Optional[float] = None) -> dict:
+    firebase = StubFirebase()
+    firebase.install()
+    await app.router.startup()
+    try:
+        uids = [f"bench-user-{i}" for i in range(USERS)]
+        login_bodies = [json_dumps({"id_token": firebase.mint(uid)}) for uid in uids]
+        auth_headers = [
+            [(b"authorization", f"Bearer {create_access_token({'sub': uid, 'email': f'{uid}@example.com'})}".encode())]
+            for uid in uids
+        ]
+        json_headers = [(b"content-type", b"application/json")]
+
+        # One login per user first, so profiles exist for /auth/me
+        for body in login_bodies:
+            status, payload = await call_app(app, "POST", "/auth/firebase-raw", json_headers, body)
+            if status != 200:
+                raise RuntimeError(f"warm-up login failed: {status} {payload[:200]!r}")
+
+        # Refresh tokens are single-use: one per request across every level
+        refresh_bodies = [
+            json_dumps({"refresh_token": await issue_refresh_token(uids[i % USERS], f"{uids[i % USERS]}@example.com")})
+            for i in range(total * len(levels))
+        ]
+        next_refresh = itertools.count()
+
+        def uncached_login(i):
+            # Force the RS256 signature check instead of a token-cache hit
+            firebase_token_cache.clear()
+            return "POST", "/auth/firebase-raw", json_headers, login_bodies[i % USERS]
+
+        scenarios = {
+            "GET /health": lambda i: ("GET", "/health", [], b""),
+            "POST /auth/firebase-raw": lambda i: ("POST", "/auth/firebase-raw", json_headers,
+                                                  login_bodies[i % USERS]),
+            "POST /auth/firebase-raw uncached": uncached_login,
+            "POST /auth/refresh": lambda i: ("POST", "/auth/refresh", json_headers,
+                                             refresh_bodies[next(next_refresh)]),
+            "GET /auth/me": lambda i: ("GET", "/auth/me", auth_headers[i % USERS], b""),
+            "GET /protected": lambda i: ("GET", "/protected", auth_headers[i % USERS], b""),
+        }
+        results = {}
+        # Warm-up above is excluded: first-use imports legitimately block
+        with stall_budget(stall_budget_seconds) if stall_budget_seconds else nullcontext():
+            for name, make_request in scenarios.items():
+                for concurrency in levels:
+                    results[f"{name} c={concurrency}"] = await run_load(app, make_request, concurrency, total)
+        return results
+    finally:
+        await app.router.shutdown()
+
+
+def compare(results: dict, baseline: dict, tolerance: float = TOLERANCE) -> list:
+    """Return human-readable regressions of ``results`` against ``baseline``."""
+    regressions = []
+    for section in ("micro", "load"):
+        for name, current in results.get(section, {}).items():
+            previous = baseline.get(section, {}).get(name)
+            if previous is None:
+                continue
+            if "us_per_call" in current:
+                if current["us_per_call"] > previous["us_per_call"] * (1 + tolerance):
+                    regressions.append(f"{name}: {previous['us_per_call']} -> {current['us_per_call']} us/call")
+                continue
+            if current["throughput_rps"] < previous["throughput_rps"] * (1 - tolerance):
+                regressions.append(f"{name}: {previous['throughput_rps']} -> {current['throughput_rps']} req/s")
+            if current["p99_ms"] > previous["p99_ms"] * (1 + tolerance):
+                regressions.append(f"{name}: p99 {previous['p99_ms']} -> {current['p99_ms']} ms")
+            if current["errors"] > previous["errors"]:
+                regressions.append(f"{name}: {current['errors']} errors")
+    return regressions
+
+
+def report(results: dict):
+    print(f"JSON backend: {JSON_BACKEND_NAME}")
+    for name, row in results["micro"].items():
+        print(f"{name:<40} {row['us_per_call']:10.2f} us/call")
+    print()
+    print(f"{'scenario':<40} {'req/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for name, row in results["load"].items():
+        print(f"{name:<40} {row['throughput_rps']:10.1f} {row['p50_ms']:9.3f} "
+              f"{row['p95_ms']:9.3f} {row['p99_ms']:9.3f} {row['errors']:7d}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=LOAD_REQUESTS, help="requests per load scenario")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=list(CONCURRENCY_LEVELS))
+    parser.add_argument("--micro-number", type=int, default=MICRO_NUMBER)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="write results to the baseline file")
+    parser.add_argument("--check", action="store_true", help="exit 1 when a result regresses")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--stall-budget-ms", type=float, default=None,
+                        help="exit 1 if the event loop stalls longer than this during the load run")
+    args = parser.parse_args(argv)
+
+    stall_budget_seconds = args.stall_budget_ms / 1000 if args.stall_budget_ms else None
+    try:
+        results = {
+            "micro": micro(args.micro_number),
+            "load": asyncio.run(load(args.requests, args.concurrency, stall_budget_seconds)),
+        }
+    except LoopStallError as e:
+        print(f"FAIL: {e}")
+        return 1
+    report(results)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nBaseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("\nNo baseline to compare against; run with --save-baseline first")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\nRegressions beyond {args.tolerance:.0%} of baseline:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1 if args.check else 0
+    print(f"\nWithin {args.tolerance:.0%} of baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
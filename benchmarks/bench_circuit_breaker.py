@@ -0,0 +1,178 @@
+"""
+Fault-injection run for the Firebase circuit breaker and adaptive timeout.
+
+The Admin SDK's verify_id_token is replaced by a stub with configurable
+latency and error rate, and logins are driven through verify_google_token
+in three phases:
+
+    healthy   fast answers; the timeout settles near the SDK's p99
+    forged    the SDK rejects every token; each is a 401 and the breaker
+              stays closed
+    outage    the SDK hangs or errors; the breaker should open and later
+              calls fail fast with 503 instead of waiting out a timeout
+    recovery  the SDK is healthy again; after the open period one probe
+              should close the breaker
+
+    python -m benchmarks.bench_circuit_breaker [--outage slow|errors]
+
+Exits non-zero when the breaker doesn't behave as described.
+"""
+import os
+
+# Settings are read at import time. The SDK path is forced (no local
+# verifier) and the breaker is scaled down so the run takes seconds.
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("FIREBASE_LOCAL_VERIFY", "false")
+os.environ.setdefault("FIREBASE_VERIFY_MIN_TIMEOUT_SECONDS", "0.05")
+os.environ.setdefault("FIREBASE_VERIFY_TIMEOUT_SECONDS", "2")
+os.environ.setdefault("FIREBASE_BREAKER_WINDOW_SECONDS", "1")
+os.environ.setdefault("FIREBASE_BREAKER_MIN_CALLS", "10")
+os.environ.setdefault("FIREBASE_BREAKER_OPEN_SECONDS", "1")
+
+import argparse
+import asyncio
+import logging
+import random
+import sys
+import time
+
+import firebase_admin
+import jwt
+from fastapi import HTTPException
+from firebase_admin import auth as sdk_auth
+from firebase_admin import credentials
+
+from app.auth import verify_google_token
+from app.circuit_breaker import firebase_breaker
+from benchmarks.loadgen import percentile
+from benchmarks.stub_firebase import StubFirebase
+
+CONCURRENCY = 8
+
+
+class _NoCredential(credentials.Base):
+    def get_credential(self):
+        return None
+
+
+class FaultyVerifier:
+    """Stands in for ``firebase_admin.auth.verify_id_token``."""
+
+    def __init__(self):
+        self.latency = 0.005
+        self.error_rate = 0.0
+        self.reject_rate = 0.0
+
+    def __call__(self, id_token, *args, **kwargs):
+        time.sleep(self.latency * random.uniform(0.5, 1.5))
+        if random.random() < self.error_rate:
+            raise ConnectionError("injected: certificate endpoint unreachable")
+        if random.random() < self.reject_rate:
+            raise sdk_auth.InvalidIdTokenError("injected: invalid signature")
+        claims = jwt.decode(id_token, options={"verify_signature": False})
+        claims["uid"] = claims["sub"]
+        return claims
+
+
+async def drive(stub: StubFirebase, total: int) -> dict:
+    """Log in ``total`` distinct tokens; tally statuses and latencies."""
+    statuses = {}
+    latencies = []
+    queue = iter(range(total))
+
+    async def worker():
+        for i in queue:
+            token = stub.mint(f"user-{random.getrandbits(48)}-{i}")
+            start = time.perf_counter()
+            try:
+                await verify_google_token(token)
+                code = 200
+            except HTTPException as e:
+                code = e.status_code
+            latencies.append(time.perf_counter() - start)
+            statuses[code] = statuses.get(code, 0) + 1
+
+    await asyncio.gather(*(worker() for _ in range(CONCURRENCY)))
+    latencies.sort()
+    return {
+        "statuses": statuses,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def report(phase: str, result: dict):
+    stats = firebase_breaker.stats()
+    print(f"{phase:<10} state={stats['state']:<9} timeout={stats['timeout_seconds']:.3f}s "
+          f"p50={result['p50_ms']:7.1f}ms p99={result['p99_ms']:7.1f}ms statuses={result['statuses']}")
+
+
+async def scenario(outage: str) -> list:
+    stub = StubFirebase()
+    faulty = FaultyVerifier()
+    sdk_auth.verify_id_token = faulty
+    firebase_admin.initialize_app(_NoCredential(), options={"projectId": stub.project_id})
+    problems = []
+
+    result = await drive(stub, 300)
+    report("healthy", result)
+    # Let the healthy calls age out of the window
+    await asyncio.sleep(firebase_breaker.window_seconds)
+    if firebase_breaker.state != "closed":
+        problems.append("breaker opened while the SDK was healthy")
+    if firebase_breaker.timeout() >= firebase_breaker.max_timeout:
+        problems.append("timeout did not adapt to the observed p99")
+
+    # Forged tokens are Firebase doing its job: 401s, and no reason to open
+    faulty.reject_rate = 1.0
+    result = await drive(stub, 100)
+    report("forged", result)
+    faulty.reject_rate = 0.0
+    if result["statuses"] != {401: 100}:
+        problems.append(f"forged tokens were not all rejected with 401: {result['statuses']}")
+    if firebase_breaker.state != "closed":
+        problems.append("rejected tokens opened the breaker")
+    await asyncio.sleep(firebase_breaker.window_seconds)
+
+    if outage == "slow":
+        # Far past the adaptive timeout, so every call that gets through times out
+        faulty.latency = 1.0
+    else:
+        faulty.error_rate = 1.0
+    result = await drive(stub, 200)
+    report("outage", result)
+    if firebase_breaker.opened == 0:
+        problems.append("breaker never opened during the outage")
+    fail_fast = result["statuses"].get(503, 0)
+    if fail_fast == 0:
+        problems.append("no call failed fast during the outage")
+    if result["p50_ms"] > 50:
+        problems.append(f"outage p50 {result['p50_ms']:.1f}ms: calls are waiting instead of failing fast")
+
+    # Timed-out calls keep their executor threads until the stub returns;
+    # wait for those to drain as well as for the open period to pass
+    await asyncio.sleep(max(firebase_breaker.open_seconds, faulty.latency * 1.5))
+    faulty.latency = 0.005
+    faulty.error_rate = 0.0
+    result = await drive(stub, 100)
+    report("recovery", result)
+    if firebase_breaker.state != "closed":
+        problems.append("breaker did not close after the SDK recovered")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--outage", choices=("slow", "errors"), default="slow")
+    args = parser.parse_args()
+
+    # One warning per timed-out call until the breaker opens is just noise here
+    logging.getLogger("app.auth").setLevel(logging.ERROR)
+    problems = asyncio.run(scenario(args.outage))
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
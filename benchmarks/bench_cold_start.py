@@ -0,0 +1,80 @@
+"""
+Cold-start regression check: fresh interpreter -> import main -> app startup
+-> first /health response, measured end to end from the parent process.
+
+    python -m benchmarks.bench_cold_start [--runs 5] [--budget-ms 1500]
+
+Exits non-zero when the median exceeds the budget (COLD_START_BUDGET_MS).
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Drives the ASGI app directly so the measurement doesn't include an HTTP
+# client or server import.
+_CHILD = r"""
+import asyncio
+from main import app
+
+async def first_health():
+    await app.router.startup()
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": "/health", "raw_path": b"/health",
+        "root_path": "", "query_string": b"", "headers": [],
+        "client": ("127.0.0.1", 1), "server": ("127.0.0.1", 80),
+    }
+    await app(scope, receive, send)
+    assert messages[0]["status"] == 200, messages[0]
+
+asyncio.run(first_health())
+"""
+
+
+def measure_once() -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", _CHILD], cwd=ROOT, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return (time.perf_counter() - start) * 1000
+
+
+def run(runs: int) -> dict:
+    samples = [measure_once() for _ in range(runs)]
+    return {
+        "runs": runs,
+        "median_ms": statistics.median(samples),
+        "min_ms": min(samples),
+        "max_ms": max(samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=float(os.environ.get("COLD_START_BUDGET_MS", "1500")))
+    args = parser.parse_args()
+
+    result = run(args.runs)
+    print(f"cold start to first /health: median {result['median_ms']:.1f} ms "
+          f"(min {result['min_ms']:.1f}, max {result['max_ms']:.1f}, {args.runs} runs), "
+          f"budget {args.budget_ms:.0f} ms")
+    if result["median_ms"] > args.budget_ms:
+        print("FAIL: cold start exceeds budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
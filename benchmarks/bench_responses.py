@@ -0,0 +1,61 @@
+"""
+Per-response serialization overhead: the old pydantic + JSONResponse path
+versus app.utils.base_response and the pre-encoded constant responses.
+
+    python -m benchmarks.bench_responses
+"""
+import timeit
+
+from fastapi.responses import JSONResponse
+
+from app.models import BaseResponse
+from app.utils import JSON_BACKEND_NAME, base_response, static_response
+
+NUMBER = 50000
+
+PAYLOAD = {
+    "access_token": "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9." + "x" * 120,
+    "token_type": "bearer",
+    "user": {
+        "id": "f1o2o3b4a5r6",
+        "email": "someone@example.com",
+        "name": "Some One",
+        "picture": "https://example.com/p.jpg",
+        "verified_email": True,
+    },
+}
+
+
+def legacy_response(success, message, data=None, status_code=200):
+    response = BaseResponse(success=success, message=message, data=data)
+    return JSONResponse(status_code=status_code, content=response.dict())
+
+
+_constant = static_response(True, "API is working", {"message": "Hello from MagnetAI API!"})
+
+CASES = [
+    ("legacy login body", lambda: legacy_response(True, "Login was successful", PAYLOAD)),
+    ("base_response login body", lambda: base_response(True, "Login was successful", PAYLOAD)),
+    ("legacy error", lambda: legacy_response(False, "Invalid authentication credentials", status_code=401)),
+    ("base_response error", lambda: base_response(False, "Invalid authentication credentials", status_code=401)),
+    ("legacy /health", lambda: legacy_response(True, "API is working", {"message": "Hello from MagnetAI API!"})),
+    ("static /health", _constant),
+]
+
+
+def run(number: int = NUMBER) -> dict:
+    results = {}
+    for name, func in CASES:
+        seconds = min(timeit.repeat(func, number=number, repeat=3))
+        results[name] = seconds / number * 1e6
+    return results
+
+
+def main():
+    print(f"JSON backend: {JSON_BACKEND_NAME}")
+    for name, usec in run().items():
+        print(f"{name:<28} {usec:8.2f} us/response")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Per-request cost of the access-token revocation check, with an empty list
+and with a large one, against a sub-microsecond budget.
+
+    python -m benchmarks.bench_revocation [--tokens 100000] [--users 10000] [--budget-ns 1000]
+
+Exits non-zero when any case exceeds the budget.
+"""
+import argparse
+import secrets
+import sys
+import time
+import timeit
+
+from app.revocation import RevocationList
+
+NUMBER = 1_000_000
+
+
+def _net_ns(func, number: int) -> float:
+    # Subtract the cost of calling an empty lambda so only the check remains
+    empty = min(timeit.repeat(lambda: None, number=number, repeat=3))
+    seconds = min(timeit.repeat(func, number=number, repeat=3))
+    return max(0.0, seconds - empty) / number * 1e9
+
+
+def run(tokens: int, users: int, number: int = NUMBER) -> dict:
+    now = time.time()
+    claims = {"sub": "someone", "jti": secrets.token_urlsafe(12), "iat": now, "exp": now + 900}
+    legacy_claims = {"sub": "someone", "exp": now + 900}
+
+    empty = RevocationList()
+    full = RevocationList()
+    for _ in range(tokens):
+        full.add_token(secrets.token_urlsafe(12), now + 900)
+    for i in range(users):
+        full.add_user(f"user-{i}", now, now + 900)
+    revoked_user = dict(claims, sub="user-0", iat=now - 1)
+
+    cases = [
+        ("empty list", lambda: empty.is_revoked(claims)),
+        (f"{tokens} tokens + {users} users, not revoked", lambda: full.is_revoked(claims)),
+        ("legacy token without jti/iat", lambda: full.is_revoked(legacy_claims)),
+        ("revoked by user", lambda: full.is_revoked(revoked_user)),
+    ]
+    return {name: _net_ns(func, number) for name, func in cases}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--number", type=int, default=NUMBER)
+    parser.add_argument("--budget-ns", type=float, default=1000)
+    args = parser.parse_args()
+
+    results = run(args.tokens, args.users, args.number)
+    for name, ns in results.items():
+        print(f"{name:<48} {ns:8.1f} ns/check")
+    worst = max(results.values())
+    if worst > args.budget_ns:
+        print(f"Over budget: {worst:.1f} ns > {args.budget_ns:.0f} ns")
+        sys.exit(1)
+    print(f"Within budget ({args.budget_ns:.0f} ns)")
+
+
+if __name__ == "__main__":
+    main()
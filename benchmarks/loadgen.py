@@ -0,0 +1,99 @@
+"""
+In-process ASGI load generator. Requests are fed straight into the app's
+ASGI callable, so numbers reflect the application (middleware, routing,
+handlers) without a socket or HTTP parser in the way.
+"""
+import asyncio
+import itertools
+import time
+from typing import Callable, List, Optional, Tuple
+
+Request = Tuple[str, str, List[Tuple[bytes, bytes]], bytes]
+
+
+def percentile(sorted_samples: List[float], pct: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, max(0, int(round(pct / 100 * len(sorted_samples))) - 1))
+    return sorted_samples[index]
+
+
+async def call_app(app, method: str, path: str, headers=(), body: bytes = b"",
+                   client: Tuple[str, int] = ("127.0.0.1", 50000)) -> Tuple[int, bytes]:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode("ascii"),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"bench"), (b"content-length", str(len(body)).encode("ascii"))] + list(headers),
+        "client": client,
+        "server": ("bench", 80),
+    }
+    sent = False
+    status = 0
+    chunks = []
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        # Nothing more to send; behave like an idle connection
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return status, b"".join(chunks)
+
+
+async def run_load(app, make_request: Callable[[int], Request], concurrency: int,
+                   total: int, expect_status: Optional[int] = 200) -> dict:
+    """
+    Issue ``total`` requests from ``concurrency`` workers and report
+    throughput plus latency percentiles (milliseconds).
+    """
+    counter = itertools.count()
+    latencies: List[float] = []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        while True:
+            i = next(counter)
+            if i >= total:
+                return
+            method, path, headers, body = make_request(i)
+            # A distinct client address per request keeps the per-IP login
+            # limiter out of the measurement
+            client = (f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}", 40000)
+            start = time.perf_counter()
+            status, _ = await call_app(app, method, path, headers, body, client)
+            latencies.append(time.perf_counter() - start)
+            if expect_status is not None and status != expect_status:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "throughput_rps": round(total / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
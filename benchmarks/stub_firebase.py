@@ -0,0 +1,65 @@
+"""
+Offline stand-in for Firebase: a locally generated RSA key served through a
+stub certs fetcher, plus a helper that mints matching ID tokens.
+"""
+import datetime
+import json
+import time
+
+import jwt
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+
+from app.firebase_verifier import FirebaseKeySet, configure_local_verifier
+
+PROJECT_ID = "magnetai-bench"
+KEY_ID = "bench-key-1"
+
+
+class StubFirebase:
+    def __init__(self, project_id: str = PROJECT_ID, kid: str = KEY_ID):
+        self.project_id = project_id
+        self.kid = kid
+        self._key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "magnetai-bench")])
+        now = datetime.datetime.now(datetime.timezone.utc)
+        cert = (
+            x509.CertificateBuilder()
+            .subject_name(name)
+            .issuer_name(name)
+            .public_key(self._key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(minutes=1))
+            .not_valid_after(now + datetime.timedelta(days=1))
+            .sign(self._key, hashes.SHA256())
+        )
+        self._certs = {kid: cert.public_bytes(serialization.Encoding.PEM).decode("ascii")}
+
+    def fetch(self, url):
+        return json.dumps(self._certs).encode("utf-8"), "public, max-age=3600"
+
+    def install(self):
+        """Point the app's local verifier at this key set."""
+        key_set = FirebaseKeySet(fetcher=self.fetch)
+        key_set.refresh()
+        configure_local_verifier(self.project_id, key_set)
+        return key_set
+
+    def mint(self, uid: str, **claims) -> str:
+        now = int(time.time())
+        payload = {
+            "iss": f"https://securetoken.google.com/{self.project_id}",
+            "aud": self.project_id,
+            "sub": uid,
+            "iat": now,
+            "exp": now + 3600,
+            "auth_time": now,
+            "email": f"{uid}@example.com",
+            "email_verified": True,
+            "name": f"User {uid}",
+            "picture": f"https://example.com/{uid}.jpg",
+        }
+        payload.update(claims)
+        return jwt.encode(payload, self._key, algorithm="RS256", headers={"kid": self.kid})
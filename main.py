@@ -1,5 +1,15 @@
+from app import startup_profile
+
+_profile_startup = startup_profile.is_requested()
+if _profile_startup:
+    startup_profile.enable()
+
 from app.main import app
 
+if _profile_startup:
+    startup_profile.disable()
+    startup_profile.report()
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="127.0.0.1", port=8000) 
\ No newline at end of file
+    uvicorn.run(app, host="127.0.0.1", port=8000)
@@ -11,18 +11,65 @@ CREATE TABLE IF NOT EXISTS public.users (
     email TEXT UNIQUE NOT NULL,
     name TEXT NOT NULL,
     picture TEXT,
+    email_verified BOOLEAN NOT NULL DEFAULT FALSE,
     last_login TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- Existing deployments: add columns introduced after the initial schema
+ALTER TABLE public.users ADD COLUMN IF NOT EXISTS email_verified BOOLEAN NOT NULL DEFAULT FALSE;
+
 -- Create indexes for better performance
 CREATE INDEX IF NOT EXISTS idx_users_google_id ON public.users(google_id);
 CREATE INDEX IF NOT EXISTS idx_users_email ON public.users(email);
 CREATE INDEX IF NOT EXISTS idx_users_created_at ON public.users(created_at);
 
+-- Refresh tokens: only a SHA-256 of each opaque token is stored. Rows in a
+-- family share one login; a used token is kept until expiry to detect reuse.
+CREATE TABLE IF NOT EXISTS public.refresh_tokens (
+    token_hash BYTEA PRIMARY KEY,
+    family_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    email TEXT NOT NULL,
+    expires_at BIGINT NOT NULL,
+    used BOOLEAN NOT NULL DEFAULT FALSE,
+    revoked BOOLEAN NOT NULL DEFAULT FALSE
+);
+
+CREATE INDEX IF NOT EXISTS idx_refresh_tokens_family_id ON public.refresh_tokens(family_id);
+CREATE INDEX IF NOT EXISTS idx_refresh_tokens_user_id ON public.refresh_tokens(user_id);
+CREATE INDEX IF NOT EXISTS idx_refresh_tokens_expires_at ON public.refresh_tokens(expires_at);
+
+-- Access-token revocations, mirrored into each API process's memory. Rows
+-- are deleted once the tokens they cover have expired; processes pull new
+-- rows by revoked_at.
+CREATE TABLE IF NOT EXISTS public.revoked_tokens (
+    jti TEXT PRIMARY KEY,
+    expires_at BIGINT NOT NULL,
+    revoked_at DOUBLE PRECISION NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS public.revoked_users (
+    user_id TEXT PRIMARY KEY,
+    revoked_before DOUBLE PRECISION NOT NULL,
+    expires_at BIGINT NOT NULL,
+    revoked_at DOUBLE PRECISION NOT NULL DEFAULT 0
+);
+
+-- Tables created before revoked_at was added
+ALTER TABLE public.revoked_tokens ADD COLUMN IF NOT EXISTS revoked_at DOUBLE PRECISION NOT NULL DEFAULT 0;
+ALTER TABLE public.revoked_users ADD COLUMN IF NOT EXISTS revoked_at DOUBLE PRECISION NOT NULL DEFAULT 0;
+
+CREATE INDEX IF NOT EXISTS idx_revoked_tokens_revoked_at ON public.revoked_tokens(revoked_at);
+CREATE INDEX IF NOT EXISTS idx_revoked_users_revoked_at ON public.revoked_users(revoked_at);
+
 -- Enable Row Level Security
 ALTER TABLE public.users ENABLE ROW LEVEL SECURITY;
+-- No policies on the token tables: only the service role (which bypasses RLS) may touch it
+ALTER TABLE public.refresh_tokens ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.revoked_tokens ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.revoked_users ENABLE ROW LEVEL SECURITY;
 
 -- Create RLS policies
 
@@ -60,6 +107,9 @@ CREATE TRIGGER update_users_updated_at
 -- Grant necessary permissions
 GRANT ALL ON public.users TO authenticated;
 GRANT ALL ON public.users TO service_role;
+GRANT ALL ON public.refresh_tokens TO service_role;
+GRANT ALL ON public.revoked_tokens TO service_role;
+GRANT ALL ON public.revoked_users TO service_role;
 GRANT USAGE ON SCHEMA public TO authenticated;
 GRANT USAGE ON SCHEMA public TO service_role;
 
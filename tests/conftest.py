@@ -0,0 +1,6 @@
+import os
+
+# Settings are read at import time; keep the suite offline and quiet
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("ACCESS_LOG_LEVEL", "WARNING")
@@ -0,0 +1,39 @@
+import asyncio
+
+from fastapi import HTTPException
+
+from app import batch_verify
+from app.auth import FirebaseIdentity
+from app.utils import json_loads
+
+
+def _collect(access_tokens, firebase_tokens) -> list:
+    async def run():
+        return [chunk async for chunk in batch_verify.verify_batch(access_tokens, firebase_tokens)]
+    body = b"".join(asyncio.run(run()))
+    return [json_loads(line) for line in body.splitlines()]
+
+
+def test_one_failing_token_does_not_cut_off_the_stream(monkeypatch):
+    async def verify(token):
+        if token == "explodes":
+            raise TypeError("unhashable type: 'list'")
+        if token == "rejected":
+            raise HTTPException(status_code=401, detail="Invalid Firebase ID token")
+        return FirebaseIdentity.from_claims({"uid": token, "email": f"{token}@example.com", "exp": 1})
+
+    def verify_access(token):
+        raise RuntimeError("key ring unavailable")
+
+    monkeypatch.setattr(batch_verify, "verify_google_token", verify)
+    monkeypatch.setattr(batch_verify, "verify_access_token", verify_access)
+
+    results = _collect(["a0"], ["f0", "explodes", "rejected", "f3"])
+    firebase = {r["index"]: r for r in results if r["type"] == "firebase"}
+    access = [r for r in results if r["type"] == "access"]
+
+    assert sorted(firebase) == [0, 1, 2, 3]
+    assert firebase[0]["valid"] and firebase[3]["valid"]
+    assert (firebase[1]["valid"], firebase[1]["status"]) == (False, 500)
+    assert (firebase[2]["valid"], firebase[2]["status"]) == (False, 401)
+    assert access == [{"index": 0, "type": "access", "valid": False, "status": 500, "error": "Verification failed"}]
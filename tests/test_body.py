@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from app.body import read_body, read_json_fields
+
+
+def _request(chunks, headers=None, stall=False) -> Request:
+    """A request whose body arrives in ``chunks``, then (with ``stall``) never finishes."""
+    messages = [{"type": "http.request", "body": chunk, "more_body": True} for chunk in chunks]
+    if not stall:
+        messages.append({"type": "http.request", "body": b"", "more_body": False})
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await asyncio.Event().wait()
+
+    raw_headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in (headers or {}).items()]
+    scope = {"type": "http", "method": "POST", "path": "/", "headers": raw_headers, "query_string": b""}
+    return Request(scope, receive)
+
+
+def _status(coro) -> int:
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(coro)
+    return excinfo.value.status_code
+
+
+def test_reads_a_body_in_chunks():
+    assert asyncio.run(read_body(_request([b"ab", b"cd"]), max_bytes=4)) == b"abcd"
+
+
+def test_declared_length_over_the_cap_is_refused_before_reading():
+    request = _request([], headers={"content-length": "5"}, stall=True)
+    assert _status(read_body(request, max_bytes=4, timeout=5)) == 413
+
+
+def test_invalid_content_length_is_a_400():
+    assert _status(read_body(_request([b"x"], headers={"content-length": "lots"}))) == 400
+
+
+def test_chunked_body_growing_past_the_cap_is_cut_off():
+    assert _status(read_body(_request([b"abc", b"def", b"ghi"]), max_bytes=4)) == 413
+
+
+def test_understated_length_is_cut_off_at_the_cap():
+    request = _request([b"abcdef"], headers={"content-length": "2"})
+    assert _status(read_body(request, max_bytes=4)) == 413
+
+
+def test_stalled_body_times_out_and_leaves_the_task_uncancelled():
+    async def read():
+        with pytest.raises(HTTPException) as excinfo:
+            await read_body(_request([b"ab"], stall=True), timeout=0.05)
+        task = asyncio.current_task()
+        cancelling = task.cancelling() if hasattr(task, "cancelling") else 0
+        # The task carries on normally after the 408
+        await asyncio.sleep(0)
+        return excinfo.value.status_code, cancelling
+
+    assert asyncio.run(read()) == (408, 0)
+
+
+def test_outside_cancellation_still_propagates():
+    async def read():
+        task = asyncio.ensure_future(read_body(_request([], stall=True), timeout=5))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(read())
+
+
+def test_json_fields_are_picked_from_an_object():
+    request = _request([b'{"id_token": "t", "other": 1}'])
+    assert asyncio.run(read_json_fields(request, "id_token", "missing")) == ("t", None)
+
+
+@pytest.mark.parametrize("body", [b"[1, 2]", b'"text"', b"3"])
+def test_non_object_json_is_a_400(body):
+    assert _status(read_json_fields(_request([body]), "id_token")) == 400
+
+
+def test_invalid_json_is_a_400():
+    assert _status(read_json_fields(_request([b"{not json"]), "id_token")) == 400
@@ -0,0 +1,168 @@
+import asyncio
+import types
+
+import pytest
+from fastapi import HTTPException
+
+import app.auth
+from app.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _breaker(clock, **overrides) -> CircuitBreaker:
+    settings = dict(window_seconds=10, min_calls=4, failure_ratio=0.5, slow_seconds=2.0,
+                    open_seconds=30, min_timeout=0.5, max_timeout=10.0, p99_multiplier=3.0)
+    settings.update(overrides)
+    return CircuitBreaker("test", clock=clock, **settings)
+
+
+def _call(breaker, failed: bool, duration: float = 0.01):
+    breaker.allow()
+    if failed:
+        breaker.record_failure()
+    else:
+        breaker.record_success(duration)
+
+
+def test_opens_on_consecutive_failures_once_min_calls_is_reached():
+    clock = Clock()
+    breaker = _breaker(clock)
+    for _ in range(3):
+        _call(breaker, failed=True)
+    # Not enough calls in the window to judge yet
+    assert breaker.state == CLOSED
+    _call(breaker, failed=True)
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpen) as excinfo:
+        breaker.allow()
+    assert excinfo.value.retry_after == pytest.approx(30)
+    assert breaker.rejected == 1
+
+
+def test_stays_closed_below_the_failure_ratio():
+    clock = Clock()
+    breaker = _breaker(clock)
+    for failed in (False, False, True, False, False, True, False):
+        _call(breaker, failed)
+    assert breaker.state == CLOSED
+
+
+def test_slow_successes_count_as_failures():
+    clock = Clock()
+    breaker = _breaker(clock)
+    for _ in range(4):
+        _call(breaker, failed=False, duration=2.5)
+    assert breaker.state == OPEN
+
+
+def test_failures_age_out_of_the_window():
+    clock = Clock()
+    breaker = _breaker(clock)
+    for _ in range(3):
+        _call(breaker, failed=True)
+    clock.now += 11
+    _call(breaker, failed=True)
+    assert breaker.state == CLOSED
+
+
+def test_half_open_lets_one_probe_through_and_a_success_recloses():
+    clock = Clock()
+    breaker = _breaker(clock)
+    for _ in range(4):
+        _call(breaker, failed=True)
+    clock.now += 30
+    breaker.allow()
+    assert breaker.state == HALF_OPEN
+    # Only one probe at a time
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+    breaker.record_success(0.01)
+    assert breaker.state == CLOSED
+    breaker.allow()
+
+
+def test_a_failed_probe_reopens():
+    clock = Clock()
+    breaker = _breaker(clock)
+    for _ in range(4):
+        _call(breaker, failed=True)
+    clock.now += 30
+    _call(breaker, failed=True)
+    assert breaker.state == OPEN
+    assert breaker.opened == 2
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+
+
+def test_a_released_probe_frees_the_slot():
+    clock = Clock()
+    breaker = _breaker(clock)
+    for _ in range(4):
+        _call(breaker, failed=True)
+    clock.now += 30
+    breaker.allow()
+    breaker.release()
+    breaker.allow()
+    assert breaker.state == HALF_OPEN
+
+
+def test_timeout_follows_the_p99_within_bounds():
+    clock = Clock()
+    breaker = _breaker(clock)
+    # Too few samples: the ceiling
+    assert breaker.timeout() == 10.0
+    for _ in range(100):
+        breaker.record_success(0.4)
+    assert breaker.timeout() == pytest.approx(1.2)
+    fast = _breaker(clock)
+    for _ in range(100):
+        fast.record_success(0.01)
+    assert fast.timeout() == 0.5
+
+
+@pytest.fixture
+def sdk(monkeypatch):
+    """A breaker and an SDK stub for ``app.auth._verify_with_sdk``."""
+    from firebase_admin import auth as sdk_auth
+
+    breaker = _breaker(Clock())
+    outcome = {}
+
+    def verify_id_token(token):
+        raise outcome["error"]
+
+    stub = types.SimpleNamespace(
+        verify_id_token=verify_id_token,
+        InvalidIdTokenError=sdk_auth.InvalidIdTokenError,
+        UserDisabledError=sdk_auth.UserDisabledError,
+    )
+    monkeypatch.setattr(app.auth, "firebase_breaker", breaker)
+    monkeypatch.setattr(app.auth, "firebase_auth", stub)
+    return breaker, outcome, sdk_auth
+
+
+def test_rejected_tokens_are_401s_that_do_not_open_the_breaker(sdk):
+    breaker, outcome, sdk_auth = sdk
+    outcome["error"] = sdk_auth.InvalidIdTokenError("forged")
+    for _ in range(10):
+        # Passed up as is; verify_google_token answers it with a 401
+        with pytest.raises(sdk_auth.InvalidIdTokenError):
+            asyncio.run(app.auth._verify_with_sdk("t"))
+    assert breaker.state == CLOSED
+
+
+def test_sdk_infrastructure_errors_are_503s_that_open_the_breaker(sdk):
+    breaker, outcome, sdk_auth = sdk
+    outcome["error"] = sdk_auth.CertificateFetchError("certs unreachable", None)
+    for _ in range(4):
+        with pytest.raises(HTTPException) as excinfo:
+            asyncio.run(app.auth._verify_with_sdk("t"))
+        assert excinfo.value.status_code == 503
+    assert breaker.state == OPEN
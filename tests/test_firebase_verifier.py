@@ -0,0 +1,100 @@
+import asyncio
+import time
+
+import jwt
+import pytest
+from fastapi import HTTPException
+
+from app import firebase_verifier
+from app.auth import verify_google_token
+from app.firebase_verifier import FirebaseKeySet, LocalFirebaseVerifier, StaleKeySet, UnknownKeyId
+from benchmarks.stub_firebase import StubFirebase
+
+
+@pytest.fixture(scope="module")
+def firebase():
+    return StubFirebase()
+
+
+@pytest.fixture
+def verifier(firebase):
+    key_set = FirebaseKeySet(fetcher=firebase.fetch)
+    key_set.refresh()
+    return LocalFirebaseVerifier(firebase.project_id, key_set)
+
+
+@pytest.fixture
+def installed(firebase, monkeypatch):
+    """The stub as the process-wide verifier, restored afterwards."""
+    monkeypatch.setattr(firebase_verifier, "_local_verifier", firebase_verifier._local_verifier)
+    monkeypatch.setattr(firebase_verifier, "_key_refresher", firebase_verifier._key_refresher)
+    return firebase.install()
+
+
+def test_accepts_a_valid_token(firebase, verifier):
+    claims = verifier.verify(firebase.mint("alice"))
+    assert claims["uid"] == "alice"
+
+
+def test_rejects_a_token_signed_with_another_key(firebase, verifier):
+    # Same kid, different private key
+    forger = StubFirebase(project_id=firebase.project_id, kid=firebase.kid)
+    with pytest.raises(jwt.InvalidSignatureError):
+        verifier.verify(forger.mint("alice"))
+
+
+def test_rejects_a_token_for_another_project(firebase, verifier):
+    with pytest.raises(jwt.InvalidAudienceError):
+        verifier.verify(firebase.mint("alice", aud="someone-else"))
+
+
+def test_rejects_a_token_from_another_issuer(firebase, verifier):
+    with pytest.raises(jwt.InvalidIssuerError):
+        verifier.verify(firebase.mint("alice", iss="https://securetoken.google.com/someone-else"))
+
+
+def test_rejects_an_expired_token(firebase, verifier):
+    now = int(time.time())
+    with pytest.raises(jwt.ExpiredSignatureError):
+        verifier.verify(firebase.mint("alice", iat=now - 7200, exp=now - 3600))
+
+
+@pytest.mark.parametrize("sub", ["", "x" * 129, 42])
+def test_rejects_an_invalid_subject(firebase, verifier, sub):
+    with pytest.raises(jwt.InvalidTokenError):
+        verifier.verify(firebase.mint("alice", sub=sub))
+
+
+def test_unknown_kid_is_left_to_the_sdk(firebase, verifier):
+    other = StubFirebase(project_id=firebase.project_id, kid="rotated-key")
+    with pytest.raises(UnknownKeyId):
+        verifier.verify(other.mint("alice"))
+
+
+def test_refuses_to_use_a_key_set_past_its_max_age(firebase, verifier):
+    verifier.key_set.expires_at = time.time() - 1
+    with pytest.raises(StaleKeySet):
+        verifier.verify(firebase.mint("alice"))
+
+
+def test_stale_keys_are_refreshed_before_a_login_is_accepted(firebase, installed):
+    installed.expires_at = time.time() - 1
+    identity = asyncio.run(verify_google_token(firebase.mint("stale-refresh")))
+    assert identity.uid == "stale-refresh"
+    assert installed.is_fresh()
+
+
+def test_stale_keys_that_cannot_be_refreshed_answer_503(firebase, installed):
+    def unreachable(url):
+        raise OSError("certs endpoint unreachable")
+
+    installed.fetcher = unreachable
+    installed.expires_at = time.time() - 1
+
+    async def login_twice():
+        for uid in ("stale-down-1", "stale-down-2"):
+            with pytest.raises(HTTPException) as excinfo:
+                await verify_google_token(firebase.mint(uid))
+            assert excinfo.value.status_code == 503
+
+    asyncio.run(login_twice())
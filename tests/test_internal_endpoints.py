@@ -0,0 +1,35 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import app.auth
+from main import app as application
+
+INTERNAL_ENDPOINTS = [
+    ("POST", "/auth/verify-batch", {"access_tokens": ["x"], "firebase_tokens": []}),
+    ("GET", "/debug/profiles", None),
+    ("GET", "/debug/profiles/1", None),
+    ("GET", "/debug/stalls", None),
+]
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(application) as client:
+        yield client
+
+
+@pytest.mark.parametrize("method,path,body", INTERNAL_ENDPOINTS)
+def test_internal_endpoints_are_closed_without_a_key(client, monkeypatch, method, path, body):
+    monkeypatch.setattr(app.auth, "INTERNAL_API_KEY", None)
+    response = client.request(method, path, json=body, headers={"X-Internal-Api-Key": "anything"})
+    assert response.status_code == 404
+
+
+@pytest.mark.parametrize("method,path,body", INTERNAL_ENDPOINTS)
+def test_internal_endpoints_require_the_configured_key(client, monkeypatch, method, path, body):
+    monkeypatch.setattr(app.auth, "INTERNAL_API_KEY", "s3cret")
+    assert client.request(method, path, json=body).status_code == 401
+    assert client.request(method, path, json=body, headers={"X-Internal-Api-Key": "wrong"}).status_code == 401
+    response = client.request(method, path, json=body, headers={"X-Internal-Api-Key": "s3cret"})
+    # Past the gate; an unknown profile id is a 404 of its own
+    assert response.status_code == (404 if path == "/debug/profiles/1" else 200)
@@ -0,0 +1,97 @@
+import asyncio
+import json
+import logging
+
+import jwt
+import pytest
+
+from app import keyring as keyring_module
+from app.keyring import LEGACY_KID, load_keyring, start_keyring_warmup
+
+OLD = {"kid": "2024-01", "alg": "HS256", "secret": "old-secret"}
+NEW = {"kid": "2024-06", "alg": "HS256", "secret": "new-secret"}
+
+
+def _ring(specs, signing_kid=None):
+    return load_keyring(json.dumps(specs), signing_kid)
+
+
+def test_signs_with_the_signing_kid():
+    ring = _ring([OLD, NEW], signing_kid="2024-06")
+    token = ring.encode({"sub": "u1"})
+    assert jwt.get_unverified_header(token)["kid"] == "2024-06"
+    assert ring.decode(token) == {"sub": "u1"}
+
+
+def test_tokens_from_the_previous_key_verify_after_a_rotation():
+    before = _ring([OLD], signing_kid="2024-01")
+    issued_before = before.encode({"sub": "u1"})
+
+    after = _ring([OLD, NEW], signing_kid="2024-06")
+    assert after.decode(issued_before) == {"sub": "u1"}
+    assert jwt.get_unverified_header(after.encode({"sub": "u2"}))["kid"] == "2024-06"
+
+
+def test_tokens_from_a_dropped_key_are_refused():
+    issued_before = _ring([OLD]).encode({"sub": "u1"})
+    with pytest.raises(jwt.InvalidTokenError, match="Unknown key id"):
+        _ring([NEW]).decode(issued_before)
+
+
+def test_tokens_without_a_kid_verify_against_the_legacy_key():
+    legacy = {"kid": LEGACY_KID, "alg": "HS256", "secret": "jwt-secret"}
+    ring = _ring([NEW, legacy], signing_kid="2024-06")
+    # Issued before tokens carried a kid header
+    token = jwt.encode({"sub": "u1"}, "jwt-secret", algorithm="HS256")
+    assert ring.decode(token) == {"sub": "u1"}
+    # Without a legacy key there is nothing to verify it with
+    with pytest.raises(jwt.InvalidTokenError, match="Unknown key id"):
+        _ring([NEW]).decode(token)
+
+
+def test_the_algorithm_comes_from_the_key_not_the_header():
+    ring = _ring([NEW])
+    forged = jwt.encode({"sub": "u1"}, "new-secret", algorithm="HS512", headers={"kid": "2024-06"})
+    with pytest.raises(jwt.InvalidAlgorithmError):
+        ring.decode(forged)
+
+
+def test_without_jwt_keys_the_secret_is_the_legacy_key():
+    ring = load_keyring(None, None)
+    assert ring.kids == [LEGACY_KID]
+    assert ring.decode(ring.encode({"sub": "u1"})) == {"sub": "u1"}
+
+
+@pytest.mark.parametrize("keys_json, signing_kid", [
+    ("not json", None),
+    ('{"kid": "a"}', None),
+    (json.dumps([OLD, OLD]), None),
+    (json.dumps([OLD]), "missing"),
+    (json.dumps([{"kid": "a", "alg": "HS256"}]), None),
+])
+def test_bad_configuration_is_refused(keys_json, signing_kid):
+    with pytest.raises(ValueError):
+        load_keyring(keys_json, signing_kid)
+
+
+def test_warmup_builds_the_ring_off_the_loop(monkeypatch):
+    monkeypatch.setattr(keyring_module, "_keyring", None)
+
+    async def warm():
+        return await start_keyring_warmup()
+
+    ring = asyncio.run(warm())
+    assert keyring_module.get_keyring() is ring
+
+
+def test_warmup_logs_a_bad_configuration(monkeypatch, caplog):
+    monkeypatch.setattr(keyring_module, "_keyring", None)
+    monkeypatch.setattr(keyring_module, "load_keyring", lambda: load_keyring("not json"))
+
+    async def warm():
+        with pytest.raises(ValueError):
+            await start_keyring_warmup()
+
+    with caplog.at_level(logging.ERROR, logger="app.keyring"):
+        asyncio.run(warm())
+    assert "Invalid JWT key configuration" in caplog.text
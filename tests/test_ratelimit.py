@@ -0,0 +1,17 @@
+import math
+
+from app.ratelimit import TokenBucketLimiter, _retry_after_header
+
+
+def test_retry_after_is_a_whole_number_of_seconds():
+    assert _retry_after_header(0.2) == {"Retry-After": "1"}
+    assert _retry_after_header(2.5) == {"Retry-After": "3"}
+
+
+def test_retry_after_for_a_zero_rate_is_finite():
+    limiter = TokenBucketLimiter(rate=0, burst=1)
+    assert limiter.allow("k") == (True, 0.0)
+    allowed, retry_after = limiter.allow("k")
+    assert not allowed and retry_after == math.inf
+    assert _retry_after_header(retry_after) == {"Retry-After": "86400"}
+    assert _retry_after_header(float("nan")) == {"Retry-After": "86400"}
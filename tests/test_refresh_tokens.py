@@ -0,0 +1,125 @@
+import asyncio
+import multiprocessing
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from app import refresh_tokens
+from app.db import connect_database
+from app.refresh_tokens import (
+    DatabaseRefreshTokenStore, InMemoryRefreshTokenStore, RefreshTokenRecord, SharedRefreshTokenStore,
+    issue_refresh_token, refresh_token_digest, revoke_refresh_token, revoke_user_refresh_tokens,
+    rotate_refresh_token,
+)
+
+
+@pytest.fixture(params=["memory", "sqlite", "shared"])
+def store(request, tmp_path, monkeypatch):
+    if request.param == "memory":
+        store = InMemoryRefreshTokenStore()
+    elif request.param == "sqlite":
+        db = connect_database(f"sqlite:///{tmp_path / 'refresh.db'}", pool_size=2)
+        request.addfinalizer(db.close)
+        store = DatabaseRefreshTokenStore(db)
+    else:
+        store = SharedRefreshTokenStore(slots=256)
+    monkeypatch.setattr(refresh_tokens, "_store", store)
+    return store
+
+
+def _rejected(coro) -> str:
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(coro)
+    assert excinfo.value.status_code == 401
+    return excinfo.value.detail
+
+
+def test_rotation_spends_the_token_and_keeps_the_family(store):
+    async def scenario():
+        first = await issue_refresh_token("u1", "u1@example.com")
+        record, second = await rotate_refresh_token(first)
+        assert (record.user_id, record.email) == ("u1", "u1@example.com")
+        assert second != first
+        again, third = await rotate_refresh_token(second)
+        assert again.family_id == record.family_id
+        return third
+
+    assert asyncio.run(scenario())
+
+
+def test_reuse_revokes_the_whole_family(store):
+    async def scenario():
+        first = await issue_refresh_token("u1", "u1@example.com")
+        _, second = await rotate_refresh_token(first)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    # The spent token comes back: the session is treated as stolen
+    assert _rejected(rotate_refresh_token(first)) == "Refresh token has been revoked"
+    # ...which also cuts off the token that replaced it
+    assert _rejected(rotate_refresh_token(second)) == "Refresh token has been revoked"
+
+
+def test_other_families_survive_a_reuse(store):
+    async def scenario():
+        stolen = await issue_refresh_token("u1", "u1@example.com")
+        other = await issue_refresh_token("u1", "u1@example.com")
+        await rotate_refresh_token(stolen)
+        return stolen, other
+
+    stolen, other = asyncio.run(scenario())
+    _rejected(rotate_refresh_token(stolen))
+    record, _ = asyncio.run(rotate_refresh_token(other))
+    assert record.user_id == "u1"
+
+
+def test_logout_revokes_the_session(store):
+    async def scenario():
+        token = await issue_refresh_token("u1", "u1@example.com")
+        assert await revoke_refresh_token(token)
+        return token
+
+    _rejected(rotate_refresh_token(asyncio.run(scenario())))
+
+
+def test_revoke_user_covers_every_family_but_not_later_logins(store):
+    async def scenario():
+        tokens = [await issue_refresh_token("u1", "u1@example.com") for _ in range(3)]
+        bystander = await issue_refresh_token("u2", "u2@example.com")
+        await revoke_user_refresh_tokens("u1")
+        await asyncio.sleep(0.01)
+        later = await issue_refresh_token("u1", "u1@example.com")
+        return tokens, bystander, later
+
+    tokens, bystander, later = asyncio.run(scenario())
+    for token in tokens:
+        _rejected(rotate_refresh_token(token))
+    assert asyncio.run(rotate_refresh_token(bystander))[0].user_id == "u2"
+    assert asyncio.run(rotate_refresh_token(later))[0].user_id == "u1"
+
+
+def test_expired_tokens_are_refused(store):
+    token = "expired-refresh-token"
+    record = RefreshTokenRecord(user_id="u1", email="u1@example.com", family_id="f1",
+                                expires_at=time.time() - 1)
+    asyncio.run(store.add(refresh_token_digest(token), record))
+    _rejected(rotate_refresh_token(token))
+
+
+def test_unknown_tokens_are_refused(store):
+    assert _rejected(rotate_refresh_token("never-issued")) == "Invalid refresh token"
+
+
+def test_shared_store_tokens_work_across_forked_workers():
+    store = SharedRefreshTokenStore(slots=256)
+    record = RefreshTokenRecord(user_id="u1", email="u1@example.com", family_id="f1",
+                                expires_at=time.time() + 60)
+
+    def issue_in_worker():
+        asyncio.run(store.add(refresh_token_digest("from-another-worker"), record))
+
+    child = multiprocessing.get_context("fork").Process(target=issue_in_worker)
+    child.start()
+    child.join()
+    assert asyncio.run(store.consume(refresh_token_digest("from-another-worker"))) == record
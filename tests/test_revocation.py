@@ -0,0 +1,156 @@
+import asyncio
+import multiprocessing
+import time
+from datetime import timedelta
+
+import jwt
+import pytest
+
+from app.auth import create_access_token
+from app.db import connect_database
+from app.revocation import (
+    MAX_ACCESS_TOKEN_LIFETIME_SECONDS, SYNC_OVERLAP_SECONDS, USER_REVOCATION_TTL_SECONDS,
+    DatabaseRevocationStore, RevocationList, RevocationSync, SharedRevocationStore,
+)
+from app.shared_store import SharedLog
+
+
+class Clock:
+    def __init__(self, now: float = 1_700_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def database(tmp_path):
+    db = connect_database(f"sqlite:///{tmp_path / 'revocations.db'}", pool_size=2)
+    yield db
+    db.close()
+
+
+def _count(db, table):
+    async def count():
+        return await db.run(lambda conn: conn.cursor().execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0])
+    return asyncio.run(count())
+
+
+def test_load_only_returns_rows_since_the_last_sync(database):
+    clock = Clock()
+    writer = DatabaseRevocationStore(database, clock=clock)
+    reader = DatabaseRevocationStore(database, clock=clock)
+
+    async def scenario():
+        await writer.add_token("old", clock.now + 600)
+        await writer.add_user("u1", clock.now, clock.now + 600)
+        tokens, users = await reader.load()
+        assert [jti for jti, _ in tokens] == ["old"]
+        assert [user for user, _, _ in users] == ["u1"]
+
+        # Once a newer row has been seen, rows from before the overlap are not read again
+        clock.now += SYNC_OVERLAP_SECONDS + 1
+        await writer.add_token("new", clock.now + 600)
+        await reader.load()
+        tokens, users = await reader.load()
+        assert [jti for jti, _ in tokens] == ["new"]
+        assert list(users) == []
+
+    asyncio.run(scenario())
+
+
+def test_late_rows_inside_the_overlap_are_picked_up(database):
+    clock = Clock()
+    reader = DatabaseRevocationStore(database, clock=clock)
+    writer_clock = Clock(clock.now)
+    writer = DatabaseRevocationStore(database, clock=writer_clock)
+
+    async def scenario():
+        await writer.add_token("first", clock.now + 600)
+        await reader.load()
+        # Stamped by a process whose clock runs behind the newest row seen
+        writer_clock.now -= SYNC_OVERLAP_SECONDS / 2
+        await writer.add_token("behind", clock.now + 600)
+        tokens, _ = await reader.load()
+        assert "behind" in [jti for jti, _ in tokens]
+
+    asyncio.run(scenario())
+
+
+def test_expired_rows_are_not_loaded_and_are_purged_on_write(database):
+    clock = Clock()
+    store = DatabaseRevocationStore(database, purge_every=3, clock=clock)
+
+    async def scenario():
+        await store.add_token("short", clock.now + 10)
+        await store.add_token("long", clock.now + 600)
+        clock.now += 20
+        tokens, _ = await DatabaseRevocationStore(database, clock=clock).load()
+        assert [jti for jti, _ in tokens] == ["long"]
+        await store.add_user("u1", clock.now, clock.now + 600)
+
+    asyncio.run(scenario())
+    assert _count(database, "revoked_tokens") == 1
+
+
+def test_sync_applies_incremental_rows(database):
+    clock = Clock()
+    revocations = RevocationList(clock=clock)
+    sync = RevocationSync(revocations, DatabaseRevocationStore(database, clock=clock))
+    writer = DatabaseRevocationStore(database, clock=clock)
+
+    async def scenario():
+        await sync.sync()
+        await writer.add_token("a", clock.now + 600)
+        await sync.sync()
+        assert revocations.is_revoked({"jti": "a", "sub": "u1", "iat": clock.now})
+        await writer.add_user("u1", clock.now, clock.now + USER_REVOCATION_TTL_SECONDS)
+        await sync.sync()
+        assert revocations.is_revoked({"jti": "b", "sub": "u1", "iat": clock.now - 1})
+
+    asyncio.run(scenario())
+
+
+def test_revoke_all_outlives_the_longest_token():
+    assert USER_REVOCATION_TTL_SECONDS >= MAX_ACCESS_TOKEN_LIFETIME_SECONDS
+    # Legacy tokens were issued for 24 hours
+    assert USER_REVOCATION_TTL_SECONDS >= 24 * 3600
+
+    token = create_access_token({"sub": "u1"}, expires_delta=timedelta(days=30))
+    claims = jwt.decode(token, options={"verify_signature": False})
+    assert claims["exp"] - claims["iat"] <= MAX_ACCESS_TOKEN_LIFETIME_SECONDS + 1
+
+
+def test_shared_log_carries_revocations_between_forked_workers():
+    log = SharedLog(capacity=16, record_size=256)
+    revocations = RevocationList()
+    sync = RevocationSync(revocations, SharedRevocationStore(log))
+    now = time.time()
+
+    def logout_in_another_worker():
+        async def logout():
+            store = SharedRevocationStore(log)
+            await store.add_token("jti-1", now + 600)
+            await store.add_user("u1", now, now + USER_REVOCATION_TTL_SECONDS)
+        asyncio.run(logout())
+
+    child = multiprocessing.get_context("fork").Process(target=logout_in_another_worker)
+    child.start()
+    child.join()
+    asyncio.run(sync.sync())
+    assert revocations.is_revoked({"jti": "jti-1", "sub": "u2", "iat": now})
+    assert revocations.is_revoked({"jti": "other", "sub": "u1", "iat": now - 1})
+    assert not revocations.is_revoked({"jti": "other", "sub": "u2", "iat": now})
+
+
+def test_shared_log_reads_each_record_once_and_reports_wraparound():
+    log = SharedLog(capacity=4, record_size=16)
+    for i in range(3):
+        assert log.append(b"r%d" % i)
+    position, records, lost = log.read_since(0)
+    assert (position, records, lost) == (3, [b"r0", b"r1", b"r2"], 0)
+    for i in range(3, 9):
+        log.append(b"r%d" % i)
+    position, records, lost = log.read_since(position)
+    assert (position, records, lost) == (9, [b"r5", b"r6", b"r7", b"r8"], 2)
+    assert log.append(b"x" * 17) is False
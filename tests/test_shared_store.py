@@ -0,0 +1,89 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+
+import pytest
+
+import app.auth
+from app.auth import invalidate_firebase_user
+from app.ratelimit import SharedTokenBucketLimiter
+from app.shared_store import SharedTable, SharedTTLCache, StripeBusy, _key
+
+fork = multiprocessing.get_context("fork")
+
+
+def _die_holding(lock):
+    lock.acquire()
+
+
+def _strand_stripe(table: SharedTable, key) -> int:
+    """Lock ``key``'s stripe from a child process that exits without releasing it."""
+    _, stripe = table._locate(_key(key))
+    child = fork.Process(target=_die_holding, args=(table._locks[stripe],))
+    child.start()
+    child.join()
+    return stripe
+
+
+def test_dead_lock_holder_does_not_hang_the_table():
+    table = SharedTable(64, 16, stripes=4, lock_timeout=0.01)
+    table.set("other", b"ok", time.time() + 60)
+    _strand_stripe(table, "key")
+
+    start = time.perf_counter()
+    assert table.get("key") is None
+    assert table.set("key", b"value", time.time() + 60) is False
+    assert table.delete("key") is False
+    with pytest.raises(StripeBusy):
+        table.update("key", lambda raw: (b"value", time.time() + 60))
+    table.clear()
+    # One wait for the lock timeout; the stripe is then tried without waiting
+    assert time.perf_counter() - start < 0.5
+    # get, set, delete and update, then clear once per set on the stripe
+    assert table.lock_timeouts == 4 + table.sets // len(table._locks)
+
+
+def test_stripes_other_than_the_stranded_one_keep_working():
+    table = SharedTable(64, 16, stripes=4, lock_timeout=0.01)
+    stranded = _strand_stripe(table, "key")
+    other = next(f"k{i}" for i in range(100) if table._locate(_key(f"k{i}"))[1] != stranded)
+    assert table.set(other, b"value", time.time() + 60)
+    assert table.get(other) == b"value"
+
+
+def test_limiter_falls_back_to_a_per_process_bucket():
+    limiter = SharedTokenBucketLimiter(rate=1, burst=2, max_keys=64)
+    limiter._table.lock_timeout = 0.01
+    _strand_stripe(limiter._table, "1.2.3.4")
+
+    results = [limiter.allow("1.2.3.4")[0] for _ in range(3)]
+    assert results == [True, True, False]
+    assert limiter.fallbacks == 3
+
+
+def test_logout_all_scans_the_shared_cache_off_the_loop(monkeypatch):
+    cache = SharedTTLCache(256, 256, encode=lambda identity: b"{}", decode=lambda raw: raw)
+    monkeypatch.setattr(app.auth, "firebase_token_cache", cache)
+    expires_at = time.time() + 60
+    for index in range(3):
+        cache.set(f"u1-token-{index}", None, expires_at, owner="u1")
+    cache.set("u2-token", None, expires_at, owner="u2")
+
+    scanned_on = []
+    delete_owner = cache.table.delete_owner
+
+    def recording_delete_owner(owner):
+        scanned_on.append(threading.get_ident())
+        return delete_owner(owner)
+
+    monkeypatch.setattr(cache.table, "delete_owner", recording_delete_owner)
+
+    async def logout_all():
+        return threading.get_ident(), await invalidate_firebase_user("u1")
+
+    loop_thread, removed = asyncio.run(logout_all())
+    assert removed == 3
+    assert scanned_on and scanned_on[0] != loop_thread
+    assert cache.get("u1-token-0") is None
+    assert cache.get("u2-token") is not None
@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.auth import firebase_verify_flight, verify_google_token
+from app.firebase_verifier import get_local_verifier
+from app.singleflight import SingleFlight
+from benchmarks.stub_firebase import StubFirebase
+
+CALLERS = 50
+
+
+@pytest.fixture(scope="module")
+def firebase():
+    stub = StubFirebase()
+    stub.install()
+    return stub
+
+
+@pytest.fixture
+def counting_verifier(firebase, monkeypatch):
+    """Counts (and optionally fails) the underlying verifications."""
+    verifier = get_local_verifier()
+    calls = []
+    failure = {}
+    real_verify = verifier.verify
+
+    def verify(token):
+        calls.append(token)
+        if "error" in failure:
+            raise failure["error"]
+        return real_verify(token)
+
+    monkeypatch.setattr(verifier, "verify", verify)
+    return calls, failure
+
+
+def test_concurrent_logins_with_one_token_verify_once(firebase, counting_verifier):
+    calls, _ = counting_verifier
+    token = firebase.mint("flight-user")
+    before = firebase_verify_flight.stats()
+
+    async def run():
+        return await asyncio.gather(*(verify_google_token(token) for _ in range(CALLERS)))
+
+    identities = asyncio.run(run())
+
+    after = firebase_verify_flight.stats()
+    assert len(calls) == 1
+    assert after["executions"] - before["executions"] == 1
+    assert after["coalesced"] - before["coalesced"] == CALLERS - 1
+    assert {identity.uid for identity in identities} == {"flight-user"}
+
+
+def test_concurrent_logins_share_one_failure(firebase, counting_verifier):
+    calls, failure = counting_verifier
+    failure["error"] = ValueError("bad signature")
+    token = firebase.mint("flight-failure")
+
+    async def run():
+        return await asyncio.gather(*(verify_google_token(token) for _ in range(CALLERS)),
+                                    return_exceptions=True)
+
+    results = asyncio.run(run())
+
+    assert len(calls) == 1
+    assert all(isinstance(result, HTTPException) and result.status_code == 401 for result in results)
+
+
+def test_every_waiter_gets_the_exception():
+    flight = SingleFlight()
+    executions = []
+
+    async def work():
+        executions.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    async def run():
+        return await asyncio.gather(*(flight.do("key", work) for _ in range(10)), return_exceptions=True)
+
+    results = asyncio.run(run())
+
+    assert len(executions) == 1
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert flight.stats() == {"in_flight": 0, "executions": 1, "coalesced": 9}
+
+
+def test_cancelled_caller_does_not_cancel_the_flight():
+    flight = SingleFlight()
+    release = None
+
+    async def work():
+        await release.wait()
+        return "verified"
+
+    async def run():
+        nonlocal release
+        release = asyncio.Event()
+        impatient = asyncio.ensure_future(flight.do("key", work))
+        patient = asyncio.ensure_future(flight.do("key", work))
+        await asyncio.sleep(0)
+        impatient.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await impatient
+        # A caller giving up on a timeout is the same thing
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(flight.do("key", work), timeout=0.01)
+        release.set()
+        return await patient
+
+    assert asyncio.run(run()) == "verified"
+    assert flight.stats() == {"in_flight": 0, "executions": 1, "coalesced": 2}
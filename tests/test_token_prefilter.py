@@ -0,0 +1,42 @@
+import base64
+import json
+
+import pytest
+
+from app.token_prefilter import TokenRejected, _header_cache, decode_header, prefilter_firebase_token
+
+
+def _segment(value) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode("utf-8")).rstrip(b"=").decode("ascii")
+
+
+def _token(header: dict) -> str:
+    claims = {"sub": "alice", "iat": 0, "exp": 0}
+    return f"{_segment(header)}.{_segment(claims)}.c2ln"
+
+
+@pytest.mark.parametrize("header", [
+    {"alg": "RS256", "kid": ["x"]},
+    {"alg": "RS256", "kid": {"a": 1}},
+    {"alg": "RS256", "kid": 7},
+    {"alg": ["RS256"], "kid": "k"},
+    {"alg": None, "kid": "k"},
+])
+def test_non_string_alg_or_kid_is_malformed(header):
+    with pytest.raises(TokenRejected) as excinfo:
+        prefilter_firebase_token(_token(header))
+    assert excinfo.value.reason == "malformed"
+    assert excinfo.value.status_code == 400
+
+
+def test_malformed_headers_are_not_cached():
+    segment = _segment({"alg": "RS256", "kid": ["x"]})
+    with pytest.raises(ValueError):
+        decode_header(segment)
+    assert segment not in _header_cache
+
+
+def test_missing_kid_is_rejected():
+    with pytest.raises(TokenRejected) as excinfo:
+        prefilter_firebase_token(_token({"alg": "RS256"}))
+    assert excinfo.value.reason == "missing_kid"
@@ -0,0 +1,154 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app import db as db_module
+from app import user_repository
+from app.db import connect_database, start_database
+from app.user_repository import LastLoginBatcher, UserRepository, get_profile
+
+
+@pytest.fixture
+def database(tmp_path):
+    db = connect_database(f"sqlite:///{tmp_path / 'users.db'}", pool_size=2)
+    yield db
+    db.close()
+
+
+def _last_logins(db) -> dict:
+    async def read():
+        return await db.run(lambda conn: conn.cursor().execute(
+            "SELECT google_id, last_login FROM users").fetchall())
+    return dict(asyncio.run(read()))
+
+
+def _set_last_login(db, google_id: str, when: str):
+    async def write():
+        await db.run(lambda conn: conn.cursor().execute(
+            "UPDATE users SET last_login = ? WHERE google_id = ?", (when, google_id)))
+    asyncio.run(write())
+
+
+def test_placeholder_database_url_runs_without_a_database(monkeypatch):
+    monkeypatch.setattr(db_module, "DATABASE_URL", "your-supabase-database-url")
+    monkeypatch.setattr(db_module, "_database", None)
+    assert start_database() is None
+
+
+def test_upsert_inserts_then_updates_the_profile(database):
+    repository = UserRepository(database)
+
+    async def scenario():
+        created = await repository.upsert("uid-1", "a@example.com", "", "", False)
+        updated = await repository.upsert("uid-1", "b@example.com", "Bee", "pic.jpg", True)
+        return created, updated, await repository.get("uid-1"), await repository.get("nobody")
+
+    created, updated, loaded, missing = asyncio.run(scenario())
+    # A missing name falls back to the email
+    assert (created.email, created.name, created.email_verified) == ("a@example.com", "a@example.com", False)
+    assert updated.id == created.id
+    assert (updated.email, updated.name, updated.picture, updated.email_verified) == (
+        "b@example.com", "Bee", "pic.jpg", True)
+    assert loaded == updated
+    assert missing is None
+
+
+def test_batched_last_login_update_only_moves_forward(database):
+    repository = UserRepository(database)
+
+    async def create():
+        for uid in ("uid-1", "uid-2", "uid-3"):
+            await repository.upsert(uid, f"{uid}@example.com", uid, "", True)
+    asyncio.run(create())
+    for uid in ("uid-1", "uid-2", "uid-3"):
+        _set_last_login(database, uid, "2024-01-01 00:00:00")
+
+    rows = [
+        ("uid-1", datetime(2024, 6, 1, tzinfo=timezone.utc)),
+        # Older than what is stored: left alone
+        ("uid-2", datetime(2023, 6, 1, tzinfo=timezone.utc)),
+        ("uid-unknown", datetime(2024, 6, 1, tzinfo=timezone.utc)),
+    ]
+
+    async def update():
+        await database.run(repository.update_last_logins, rows)
+    asyncio.run(update())
+
+    assert _last_logins(database) == {
+        "uid-1": "2024-06-01 00:00:00",
+        "uid-2": "2024-01-01 00:00:00",
+        "uid-3": "2024-01-01 00:00:00",
+    }
+
+
+def test_batcher_coalesces_logins_and_writes_in_batches(database):
+    repository = UserRepository(database)
+    batcher = LastLoginBatcher(repository, batch_size=2)
+    base = datetime(2024, 6, 1, tzinfo=timezone.utc)
+
+    async def create():
+        for uid in ("uid-1", "uid-2", "uid-3"):
+            await repository.upsert(uid, f"{uid}@example.com", uid, "", True)
+    asyncio.run(create())
+    for uid in ("uid-1", "uid-2", "uid-3"):
+        _set_last_login(database, uid, "2024-01-01 00:00:00")
+
+    async def scenario():
+        batcher.record("uid-1", base)
+        batcher.record("uid-1", base + timedelta(hours=1))
+        batcher.record("uid-2", base)
+        batcher.record("uid-3", base)
+        await batcher.flush()
+
+    asyncio.run(scenario())
+    assert batcher.stats() == {"pending": 0, "flushes": 1, "rows_written": 3}
+    assert _last_logins(database) == {
+        "uid-1": "2024-06-01 01:00:00",
+        "uid-2": "2024-06-01 00:00:00",
+        "uid-3": "2024-06-01 00:00:00",
+    }
+
+
+def test_failed_flush_keeps_the_rows_for_the_next_one(database):
+    repository = UserRepository(database)
+    batcher = LastLoginBatcher(repository)
+    batcher.record("uid-1", datetime(2024, 6, 1, tzinfo=timezone.utc))
+    database.close()
+    with pytest.raises(Exception):
+        asyncio.run(batcher.flush())
+    assert batcher.stats()["pending"] == 1
+
+
+class CountingRepository:
+    def __init__(self, profiles=None):
+        self.profiles = profiles or {}
+        self.reads = 0
+
+    async def get(self, google_id):
+        self.reads += 1
+        return self.profiles.get(google_id)
+
+
+@pytest.fixture
+def counting_repository(monkeypatch):
+    repository = CountingRepository()
+    monkeypatch.setattr(user_repository, "_repository", repository)
+    user_repository.profile_cache.clear()
+    yield repository
+    user_repository.profile_cache.clear()
+
+
+def test_missing_profiles_are_cached_too(counting_repository):
+    async def scenario():
+        return [await get_profile("nobody") for _ in range(3)]
+
+    assert asyncio.run(scenario()) == [None, None, None]
+    assert counting_repository.reads == 1
+
+
+def test_negative_entries_expire_sooner(counting_repository, monkeypatch):
+    monkeypatch.setattr(user_repository, "PROFILE_NEGATIVE_TTL_SECONDS", -1)
+    asyncio.run(get_profile("nobody"))
+    asyncio.run(get_profile("nobody"))
+    assert counting_repository.reads == 2
@@ -0,0 +1,103 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app import watchdog as watchdog_module
+from app.watchdog import LoopStallError, shutdown_watchdog, stall_budget, start_watchdog
+
+
+@pytest.fixture(autouse=True)
+def fresh_watchdog(monkeypatch):
+    monkeypatch.setattr(watchdog_module, "_watchdog", None)
+
+
+def _watcher_threads() -> list:
+    return [thread for thread in threading.enumerate() if thread.name == "loop-watchdog"]
+
+
+def _wait_for_watchers(count: int, timeout: float = 1.0) -> int:
+    deadline = time.monotonic() + timeout
+    while len(_watcher_threads()) > count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return len(_watcher_threads())
+
+
+def block_the_loop(seconds: float):
+    time.sleep(seconds)
+
+
+def test_a_stall_over_budget_fails_with_the_blocking_stack():
+    async def scenario():
+        with stall_budget(0.05):
+            await asyncio.sleep(0.05)
+            block_the_loop(0.3)
+            await asyncio.sleep(0.05)
+
+    with pytest.raises(LoopStallError) as excinfo:
+        asyncio.run(scenario())
+    error = excinfo.value
+    assert error.lag >= 0.25
+    assert error.budget == 0.05
+    # Caught mid-stall by the watcher thread, so the culprit is on the stack
+    assert error.stall is not None
+    assert "block_the_loop" in "".join(error.stall.stack)
+    assert "scenario" in error.stall.task
+
+
+def test_a_stall_right_before_the_block_ends_still_counts():
+    async def scenario():
+        with stall_budget(0.05):
+            await asyncio.sleep(0.05)
+            block_the_loop(0.3)
+
+    with pytest.raises(LoopStallError):
+        asyncio.run(scenario())
+
+
+def test_staying_within_budget_passes():
+    async def scenario():
+        with stall_budget(0.25) as budget:
+            for _ in range(5):
+                await asyncio.sleep(0.02)
+                block_the_loop(0.005)
+        return budget.worst
+
+    assert asyncio.run(scenario()) < 0.25
+
+
+def test_stalls_are_kept_for_the_debug_endpoint():
+    async def scenario():
+        watchdog = start_watchdog()
+        await asyncio.sleep(0.05)
+        block_the_loop(0.3)
+        await asyncio.sleep(0.05)
+        stats = watchdog.stats()
+        await shutdown_watchdog()
+        return stats
+
+    stalls = asyncio.run(scenario())["stalls"]
+    assert len(stalls) == 1
+    assert stalls[0]["duration_ms"] >= 250
+    assert any("block_the_loop" in line for line in stalls[0]["stack"])
+
+
+def test_repeated_startups_leave_one_watcher_running():
+    before = _wait_for_watchers(0)
+
+    async def scenario():
+        first = start_watchdog()
+        start_watchdog()
+        third = start_watchdog()
+        await asyncio.sleep(0.05)
+        watching = _wait_for_watchers(before + 1)
+        first_ticker_done = first._task.done()
+        await shutdown_watchdog()
+        return watching, first_ticker_done, third._task.done()
+
+    watching, first_ticker_done, third_ticker_done = asyncio.run(scenario())
+    assert watching == before + 1
+    assert first_ticker_done
+    assert third_ticker_done
+    assert _wait_for_watchers(before) == before